@@ -0,0 +1,315 @@
+"""
+Deterministic synthetic Stripe account used by the mock server and the import.csv generator.
+Every object is derived from its number only, so any id can be served without keeping state.
+"""
+import zlib
+from datetime import datetime, timezone
+
+# 2024-01-01 00:00:00 UTC, one balance transaction per minute
+BASE_TIMESTAMP = 1704067200
+INTERVAL = 60
+CUSTOMER_COUNT = 1000
+
+TRANSACTION_TYPES = (
+    ['charge'] * 10 + ['payment'] * 3 + ['refund'] * 2 + ['stripe_fee'] * 2 + ['payout', 'application_fee']
+)
+PRODUCTS = ['KI-Workshop Premium', 'Workshop Ticket', 'Einzelberatung', 'Jahreslizenz', 'Starter Paket']
+REFUND_REASONS = ['duplicate', 'fraudulent', 'requested_by_customer', None]
+FEE_DESCRIPTIONS = ['Automatic Tax', 'Billing - Usage Fee', 'Connect (2024-01): Account Volume Billing', '']
+
+
+def _hash(number: int, salt: str):
+    return zlib.crc32(f'{salt}:{number}'.encode())
+
+
+def _number(object_id: str):
+    suffix = object_id.rsplit('_', 1)[-1]
+    return int(suffix) if suffix.isdigit() else None
+
+
+def transaction_type(i: int):
+    return TRANSACTION_TYPES[_hash(i, 'type') % len(TRANSACTION_TYPES)]
+
+
+def created(i: int):
+    return BASE_TIMESTAMP + i * INTERVAL
+
+
+def transaction_source(i: int):
+    return {
+        'charge': f'ch_{i}',
+        'payment': f'py_{i}',
+        'refund': f're_{i}',
+        'payout': f'po_{i}',
+        'stripe_fee': None,
+        'application_fee': f'fee_{i}',
+    }[transaction_type(i)]
+
+
+def balance_transaction(i: int):
+    kind = transaction_type(i)
+    amount = _hash(i, 'amount') % 50000 + 100
+    fee = 0
+    description = None
+    if kind in ('charge', 'payment'):
+        fee = amount * 14 // 1000 + 25
+        description = f'Bestellung {i}' if i % 5 == 0 else None
+    elif kind == 'stripe_fee':
+        amount = -(amount // 100 + 1)
+        description = FEE_DESCRIPTIONS[i % len(FEE_DESCRIPTIONS)]
+    else:
+        amount = -amount
+    return {
+        'id': f'txn_{i}',
+        'object': 'balance_transaction',
+        'type': kind,
+        'source': transaction_source(i),
+        'amount': amount,
+        'fee': fee,
+        'net': amount - fee,
+        'currency': 'eur',
+        'created': created(i),
+        'available_on': created(i) + 2 * 86400,
+        'description': description,
+        'reporting_category': kind,
+    }
+
+
+def customer(c: int):
+    return {
+        'id': f'cus_{c}',
+        'object': 'customer',
+        'created': BASE_TIMESTAMP + c * INTERVAL,
+        'name': f'Kunde {c}' if c % 10 else None,
+        'email': f'kunde{c}@example.com',
+    }
+
+
+def charge(i: int, object_id: str = None):
+    card = i % 3 != 0
+    return {
+        'id': object_id or f'ch_{i}',
+        'object': 'charge',
+        'created': created(i),
+        'amount': balance_transaction(i)['amount'],
+        'customer': f'cus_{i % CUSTOMER_COUNT}' if i % 4 else None,
+        'billing_details': {'name': f'Karteninhaber {i}' if i % 8 == 0 else None},
+        'description': f'Rechnung {i}' if i % 9 == 0 else None,
+        'statement_descriptor': None,
+        'payment_intent': f'pi_{i}' if i % 6 else None,
+        'invoice': f'in_{i}' if i % 7 == 0 else None,
+        'metadata': {'product_name': PRODUCTS[i % len(PRODUCTS)]} if i % 11 == 0 else {},
+        'payment_method_details': (
+            {'type': 'card', 'card': {'brand': ['visa', 'mastercard', 'amex'][i % 3], 'last4': f'{i % 10000:04d}'}}
+            if card else
+            {'type': 'sepa_debit', 'sepa_debit': {'last4': f'{(i * 7) % 10000:04d}'}}
+        ),
+    }
+
+
+def payment_intent(i: int):
+    return {
+        'id': f'pi_{i}',
+        'object': 'payment_intent',
+        'created': created(i),
+        'customer': f'cus_{i % CUSTOMER_COUNT}' if i % 5 else None,
+        'latest_charge': f'ch_{i}',
+        'description': f'Zahlung {i}' if i % 2 else None,
+        'statement_descriptor': None,
+        'metadata': {'product': PRODUCTS[i % len(PRODUCTS)]} if i % 13 == 0 else {},
+    }
+
+
+def invoice(i: int):
+    return {
+        'id': f'in_{i}',
+        'object': 'invoice',
+        'created': created(i),
+        'customer': f'cus_{i % CUSTOMER_COUNT}',
+        'lines': {
+            'object': 'list',
+            'data': [{'id': f'il_{i}', 'object': 'line_item', 'description': PRODUCTS[i % len(PRODUCTS)]}],
+        },
+    }
+
+
+def refund(i: int):
+    return {
+        'id': f're_{i}',
+        'object': 'refund',
+        'created': created(i),
+        'charge': f'ch_{i}',
+        'reason': REFUND_REASONS[i % len(REFUND_REASONS)],
+    }
+
+
+def checkout_session(i: int):
+    return {
+        'id': f'cs_{i}',
+        'object': 'checkout.session',
+        'created': created(i),
+        'customer': f'cus_{i % CUSTOMER_COUNT}' if i % 2 else None,
+        'customer_details': {'name': f'Kunde {i % CUSTOMER_COUNT}', 'email': f'kunde{i}@example.com'},
+        'description': None,
+        'client_reference_id': f'order-{i}',
+    }
+
+
+def retrieve(resource: str, object_id: str):
+    """
+    Returns the object behind a retrieve path (e.g. 'charges', 'ch_12') or None for unknown ids
+    """
+    number = _number(object_id)
+    if number is None:
+        return None
+    if resource == 'balance_transactions' and object_id.startswith('txn_'):
+        return balance_transaction(number)
+    if resource == 'charges' and object_id.startswith('ch_') and transaction_type(number) == 'charge':
+        return charge(number)
+    if resource == 'payment_intents' and object_id.startswith('pi_') and number % 6:
+        return payment_intent(number)
+    if resource == 'customers' and object_id.startswith('cus_') and number < CUSTOMER_COUNT:
+        return customer(number)
+    if resource == 'invoices' and object_id.startswith('in_') and number % 7 == 0:
+        return invoice(number)
+    if resource == 'refunds' and object_id.startswith('re_') and transaction_type(number) == 'refund':
+        return refund(number)
+    if resource == 'checkout/sessions' and object_id.startswith('cs_'):
+        return checkout_session(number)
+    return None
+
+
+def source_object(source_id: str):
+    """
+    Full source object of a balance transaction, as delivered with expand[]=data.source
+    """
+    number = _number(source_id)
+    if source_id.startswith('ch_'):
+        return charge(number)
+    if source_id.startswith('py_'):
+        # Non-card payments are charge objects with a py_ id
+        return charge(number, source_id)
+    if source_id.startswith('re_'):
+        return refund(number)
+    if source_id.startswith('po_'):
+        return {'id': source_id, 'object': 'payout', 'created': created(number)}
+    return {'id': source_id, 'object': 'application_fee', 'created': created(number)}
+
+
+def list_objects(resource: str, transactions: int, below: int = None, created_lte: int = None):
+    """
+    Yields (number, object) for a list endpoint, newest first like Stripe
+    :param below: Only objects with a smaller number (pagination via starting_after)
+    :param created_lte: Skip directly to objects created at or before this timestamp
+    """
+    count = CUSTOMER_COUNT if resource == 'customers' else transactions
+    first = count - 1
+    if below is not None:
+        first = min(first, below - 1)
+    if created_lte is not None:
+        first = min(first, (created_lte - BASE_TIMESTAMP) // INTERVAL)
+    if resource == 'customers':
+        for c in range(first, -1, -1):
+            yield c, customer(c)
+        return
+    for i in range(first, -1, -1):
+        if resource == 'balance_transactions':
+            yield i, balance_transaction(i)
+        elif transaction_type(i) == 'charge':
+            if resource == 'charges':
+                yield i, charge(i)
+            elif resource == 'payment_intents' and i % 6:
+                yield i, payment_intent(i)
+        elif resource == 'refunds' and transaction_type(i) == 'refund':
+            yield i, refund(i)
+
+
+def german_amount(cents: int):
+    """
+    Formats cents like the Stripe dashboard export with German locale (e.g. "-1.234,56")
+    """
+    euros, rest = divmod(abs(cents), 100)
+    text = f'{euros:,}'.replace(',', '.') + f',{rest:02d}'
+    return f'-{text}' if cents < 0 else text
+
+
+def utc(timestamp: int):
+    return datetime.fromtimestamp(timestamp, tz=timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+IMPORT_CSV_HEADER = [
+    'id', 'Type', 'Source', 'Amount', 'Fee', 'Currency', 'Net', 'Reporting Category',
+    'Customer Facing Amount', 'Created (UTC)', 'Available On (UTC)', 'Description',
+    # Itemized report columns used by the offline mode
+    'Customer Name', 'Customer Email', 'Payment Method Type', 'Card Brand', 'Card Last4', 'product_name (metadata)',
+]
+
+
+def import_csv_row(i: int):
+    """
+    One import.csv line in the column layout main.py reads
+    """
+    txn = balance_transaction(i)
+    itemized = [''] * 6
+    if txn['type'] in ('charge', 'payment'):
+        obj = charge(i)
+        details = obj['payment_method_details']
+        card = details.get('card') or {}
+        owner = customer(i % CUSTOMER_COUNT) if obj['customer'] else {'name': obj['billing_details']['name'], 'email': None}
+        itemized = [
+            owner['name'] or '', owner['email'] or '', details['type'], card.get('brand', ''),
+            card.get('last4') or details.get('sepa_debit', {}).get('last4', ''), obj['metadata'].get('product_name', ''),
+        ]
+    return [
+        txn['id'], txn['type'], txn['source'] or '', german_amount(txn['amount']), german_amount(txn['fee']),
+        'eur', german_amount(txn['net']), txn['reporting_category'], '',
+        utc(txn['created']), utc(txn['available_on']), txn['description'] or '',
+    ] + itemized
+
+
+def decimal_amount(cents: int):
+    """
+    Amount in the decimal point format of the Stripe reports, e.g. -1234.56
+    """
+    euros, rest = divmod(abs(cents), 100)
+    return f'{"-" if cents < 0 else ""}{euros}.{rest:02d}'
+
+
+def itemized_report_row(i: int):
+    """
+    One line of the balance_change_from_activity.itemized report by column name
+    """
+    txn = balance_transaction(i)
+    row = import_csv_row(i)
+    return {
+        'balance_transaction_id': txn['id'],
+        'created_utc': utc(txn['created']),
+        'available_on_utc': utc(txn['available_on']),
+        'currency': txn['currency'],
+        'gross': decimal_amount(txn['amount']),
+        'fee': decimal_amount(txn['fee']),
+        'net': decimal_amount(txn['net']),
+        'reporting_category': txn['reporting_category'],
+        'source_id': txn['source'] or '',
+        'description': txn['description'] or '',
+        'customer_facing_amount': '',
+        # Daily automatic payouts of everything that became available that day
+        'automatic_payout_id': f'po_auto_{(txn["available_on"] - BASE_TIMESTAMP) // 86400}',
+        'customer_name': row[12],
+        'customer_email': row[13],
+        'payment_method_type': row[14],
+        'card_brand': row[15],
+        'card_last4': row[16],
+        'payment_metadata[product_name]': row[17],
+    }
+
+
+def report_rows(transactions: int, interval_start: int, interval_end: int):
+    """
+    Transaction numbers created in [interval_start, interval_end), oldest first like the Stripe reports
+    """
+    first = max(0, -(-(interval_start - BASE_TIMESTAMP) // INTERVAL))
+    for i in range(first, transactions):
+        if created(i) >= interval_end:
+            return
+        yield i
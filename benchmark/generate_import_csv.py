@@ -0,0 +1,37 @@
+"""
+Writes a synthetic import.csv matching the account served by mock_stripe.py.
+Rows are streamed, so 10M rows need no more memory than 1k.
+
+Usage: python benchmark/generate_import_csv.py --rows 100000 --output import.csv
+"""
+import argparse
+import csv
+
+import dataset
+
+
+def generate(path: str, rows: int):
+    """
+    Writes the header and the newest `rows` balance transactions, newest first like the dashboard export
+    :param path: Target file
+    :param rows: Number of transactions
+    :return: None
+    """
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(dataset.IMPORT_CSV_HEADER)
+        for i in range(rows - 1, -1, -1):
+            writer.writerow(dataset.import_csv_row(i))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic Stripe import.csv')
+    parser.add_argument('--rows', type=int, default=1000, help='Number of transactions (e.g. 1000 to 10000000)')
+    parser.add_argument('--output', default='import.csv')
+    args = parser.parse_args()
+    generate(args.output, args.rows)
+    print(f'{args.rows} rows written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,295 @@
+"""
+Local stand-in for the Stripe API, serving the synthetic account from dataset.py.
+Point main.py at it with STRIPE_API_BASE=http://127.0.0.1:<port>.
+
+Usage: python benchmark/mock_stripe.py --port 12111 --transactions 10000 --latency-ms 30 --throttle-rate 0.01
+"""
+import argparse
+import csv
+import io
+import itertools
+import json
+import random
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+import dataset
+
+RETRIEVE_PATH = re.compile(
+    r'^/v1/(balance_transactions|charges|payment_intents|customers|invoices|refunds|checkout/sessions|'
+    r'payment_methods|setup_intents|subscriptions)/([A-Za-z0-9_]+)$'
+)
+LIST_PATH = re.compile(r'^/v1/(balance_transactions|charges|payment_intents|refunds|customers)$')
+REPORT_TYPE_PATH = re.compile(r'^/v1/reporting/report_types/([A-Za-z0-9_.]+)$')
+REPORT_RUN_PATH = re.compile(r'^/v1/reporting/report_runs/([A-Za-z0-9_]+)$')
+FILE_CONTENTS_PATH = re.compile(r'^/v1/files/([A-Za-z0-9_]+)/contents$')
+
+
+class MockStripeServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server with configurable latency, 429 injection and request counters
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, transactions: int, latency_ms: float = 0.0, throttle_rate: float = 0.0,
+                 retry_after: float = None, report_delay: float = 1.0):
+        super().__init__(address, MockStripeHandler)
+        self.transactions = transactions
+        self.latency = latency_ms / 1000
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.report_delay = report_delay
+        self.report_runs = {}
+        self.stats = {}
+        self._lock = threading.Lock()
+        self._report_ids = itertools.count(1)
+
+    def create_report_run(self, report_type: str, parameters: dict):
+        with self._lock:
+            number = next(self._report_ids)
+            self.report_runs[f'frr_{number}'] = {
+                'id': f'frr_{number}',
+                'object': 'reporting.report_run',
+                'report_type': report_type,
+                'parameters': parameters,
+                'created': int(time.time()),
+                'ready_at': time.time() + self.report_delay,
+                'file': f'file_{number}',
+            }
+            return self.report_runs[f'frr_{number}']
+
+    def count(self, key: str):
+        with self._lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = {}
+
+    def total_requests(self):
+        with self._lock:
+            return sum(value for key, value in self.stats.items() if not key.startswith('throttled'))
+
+
+class MockStripeHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Keep-alive connections: send the headers and body of a response in one write without Nagle's
+    # algorithm, otherwise every response on a reused connection waits for the delayed ACK
+    disable_nagle_algorithm = True
+    wbufsize = -1
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status: int, body, headers=None):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def send_error_json(self, status: int, error_type: str, message: str, headers=None, code: str = None):
+        error = {'type': error_type, 'message': message}
+        if code:
+            error['code'] = code
+        self.send_json(status, {'error': error}, headers)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+
+        if url.path == '/_stats':
+            return self.send_json(200, self.server.stats)
+
+        if self.server.latency:
+            time.sleep(random.uniform(0.5, 1.5) * self.server.latency)
+
+        if self.server.throttle_rate and random.random() < self.server.throttle_rate:
+            self.server.count('throttled')
+            headers = {'Retry-After': str(self.server.retry_after)} if self.server.retry_after is not None else {}
+            return self.send_error_json(429, 'rate_limit_error', 'Too many requests', headers)
+
+        match = LIST_PATH.match(url.path)
+        if match:
+            self.server.count(f'list {match.group(1)}')
+            return self.send_json(200, self.list_page(match.group(1), query))
+
+        match = REPORT_TYPE_PATH.match(url.path)
+        if match:
+            self.server.count('retrieve report_types')
+            return self.send_json(200, {
+                'id': match.group(1),
+                'object': 'reporting.report_type',
+                'data_available_start': dataset.BASE_TIMESTAMP,
+                'data_available_end': dataset.created(self.server.transactions - 1) + 1,
+            })
+
+        match = REPORT_RUN_PATH.match(url.path)
+        if match:
+            self.server.count('retrieve report_runs')
+            report_run = self.server.report_runs.get(match.group(1))
+            if report_run is None:
+                return self.send_error_json(404, 'invalid_request_error', f"No such report run: '{match.group(1)}'",
+                                            code='resource_missing')
+            return self.send_json(200, self.report_run_object(report_run))
+
+        match = FILE_CONTENTS_PATH.match(url.path)
+        if match:
+            self.server.count('download files')
+            report_run = next((run for run in self.server.report_runs.values() if run['file'] == match.group(1)), None)
+            if report_run is None or time.time() < report_run['ready_at']:
+                return self.send_error_json(404, 'invalid_request_error', f"No such file: '{match.group(1)}'",
+                                            code='resource_missing')
+            return self.send_report_csv(report_run)
+
+        match = RETRIEVE_PATH.match(url.path)
+        if match:
+            resource, object_id = match.groups()
+            self.server.count(f'retrieve {resource}')
+            obj = dataset.retrieve(resource, object_id)
+            if obj is None:
+                return self.send_error_json(404, 'invalid_request_error', f"No such object: '{object_id}'",
+                                            code='resource_missing')
+            return self.send_json(200, obj)
+
+        self.send_error_json(404, 'invalid_request_error', f'Unrecognized request URL ({url.path})')
+
+    def do_POST(self):
+        if self.path == '/_stats/reset':
+            self.server.reset_stats()
+            return self.send_json(200, {})
+        if self.path == '/v1/reporting/report_runs':
+            self.server.count('create report_runs')
+            length = int(self.headers.get('Content-Length') or 0)
+            form = {key: values[0] for key, values in parse_qs(self.rfile.read(length).decode()).items()}
+            columns = [form[key] for key in sorted(
+                (key for key in form if key.startswith('parameters[columns]')),
+                key=lambda key: int(key.rsplit('[', 1)[-1].rstrip(']'))
+            )]
+            parameters = {
+                'interval_start': int(form.get('parameters[interval_start]', dataset.BASE_TIMESTAMP)),
+                'interval_end': int(form.get('parameters[interval_end]', 2 ** 40)),
+                'columns': columns or list(dataset.itemized_report_row(0)),
+            }
+            report_run = self.server.create_report_run(form.get('report_type'), parameters)
+            return self.send_json(200, self.report_run_object(report_run))
+        self.send_error_json(404, 'invalid_request_error', f'Unrecognized request URL ({self.path})')
+
+    def report_run_object(self, report_run: dict):
+        ready = time.time() >= report_run['ready_at']
+        result = None
+        if ready:
+            result = {
+                'id': report_run['file'],
+                'object': 'file',
+                'purpose': 'finance_report_run',
+                'size': 0,
+                'url': f"http://{self.headers['Host']}/v1/files/{report_run['file']}/contents",
+            }
+        return {
+            'id': report_run['id'],
+            'object': report_run['object'],
+            'report_type': report_run['report_type'],
+            'parameters': report_run['parameters'],
+            'created': report_run['created'],
+            'status': 'succeeded' if ready else 'pending',
+            'error': None,
+            'result': result,
+        }
+
+    def send_report_csv(self, report_run: dict):
+        """
+        Streams the report with chunked transfer encoding, the file is never held in memory
+        """
+        parameters = report_run['parameters']
+        columns = parameters['columns']
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/csv')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        for i in dataset.report_rows(self.server.transactions, parameters['interval_start'], parameters['interval_end']):
+            row = dataset.itemized_report_row(i)
+            writer.writerow([row.get(column, '') for column in columns])
+            if buffer.tell() >= 65536:
+                self.write_chunk(buffer.getvalue().encode())
+                buffer.seek(0)
+                buffer.truncate()
+        self.write_chunk(buffer.getvalue().encode())
+        self.wfile.write(b'0\r\n\r\n')
+
+    def write_chunk(self, data: bytes):
+        if data:
+            self.wfile.write(f'{len(data):X}\r\n'.encode() + data + b'\r\n')
+
+    def list_page(self, resource: str, query: dict):
+        limit = min(int(query.get('limit', 10)), 100)
+        gte = int(query.get('created[gte]', 0))
+        lte = int(query.get('created[lte]', 2 ** 40))
+        starting_after = dataset._number(query['starting_after']) if 'starting_after' in query else None
+        expand = {value for key, value in query.items() if key.startswith('expand')}
+
+        page = []
+        has_more = False
+        for number, obj in dataset.list_objects(resource, self.server.transactions, starting_after, lte):
+            if obj['created'] < gte:
+                break
+            if len(page) == limit:
+                has_more = True
+                break
+            page.append(self.expand(obj, expand) if expand else obj)
+        return {'object': 'list', 'url': f'/v1/{resource}', 'has_more': has_more, 'data': page}
+
+    @staticmethod
+    def expand(transaction: dict, expand: set):
+        if 'data.source' not in expand or not transaction.get('source'):
+            return transaction
+        source = dataset.source_object(transaction['source'])
+        if 'data.source.customer' in expand and source.get('customer'):
+            source['customer'] = dataset.retrieve('customers', source['customer'])
+        if 'data.source.payment_intent' in expand and source.get('payment_intent'):
+            intent = dataset.retrieve('payment_intents', source['payment_intent'])
+            if intent and 'data.source.payment_intent.customer' in expand and intent.get('customer'):
+                intent['customer'] = dataset.retrieve('customers', intent['customer'])
+            source['payment_intent'] = intent
+        return dict(transaction, source=source)
+
+
+def start_server(port: int = 0, **options):
+    """
+    Starts the mock server in a background thread
+    :return: MockStripeServer, use server.server_address for the bound port
+    """
+    server = MockStripeServer(('127.0.0.1', port), **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local Stripe API stand-in for benchmarks')
+    parser.add_argument('--port', type=int, default=12111)
+    parser.add_argument('--transactions', type=int, default=10000, help='Balance transactions in the account')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='Average response latency')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='Share of requests answered with 429')
+    parser.add_argument('--retry-after', type=float, help='Retry-After header sent with 429 responses')
+    parser.add_argument('--report-delay-s', type=float, default=1.0, help='Seconds until a report run succeeds')
+    args = parser.parse_args()
+
+    server = MockStripeServer(('127.0.0.1', args.port), args.transactions, args.latency_ms,
+                              args.throttle_rate, args.retry_after, args.report_delay_s)
+    print(f'Mock Stripe API listening on http://127.0.0.1:{args.port}')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+"""
+Benchmark suite for the CSV, API and REPORT paths of main.py against the local mock Stripe server.
+Every scenario runs main.py in a fresh process and reports rows/s, Stripe API calls per row,
+peak RSS and p50/p99 per-row enrichment latency.
+
+Usage:
+    python benchmark/run_benchmark.py --rows 10000 --latency-ms 20 --output results.json
+    python benchmark/run_benchmark.py --rows 10000 --compare results.json --tolerance 0.1
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import urllib.request
+from datetime import datetime, timedelta, timezone
+
+import dataset
+import mock_stripe
+from generate_import_csv import generate
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs main.main() with a timing wrapper around the per-line enrichment and writes the measurements as JSON
+HARNESS = '''
+import json, resource, sys, time
+sys.path.insert(0, sys.argv[1])
+import main
+
+latencies = []
+
+def timed(enrich):
+    def timed_enrich(line):
+        started = time.perf_counter()
+        try:
+            return enrich(line)
+        finally:
+            latencies.append(time.perf_counter() - started)
+    return timed_enrich
+
+result_file = sys.argv[2]
+main.enrich_line = timed(main.enrich_line)
+main.enrich_line_offline = timed(main.enrich_line_offline)
+sys.argv = ['main.py'] + sys.argv[3:]
+started = time.perf_counter()
+main.main()
+wall = time.perf_counter() - started
+with open(result_file, 'w') as file:
+    json.dump({
+        'wall': wall,
+        'latencies': latencies,
+        'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }, file)
+'''
+
+SCENARIOS = {
+    'csv': {'STRIPE_METHOD': 'CSV', 'args': []},
+    'api': {'STRIPE_METHOD': 'API', 'args': []},
+    'offline': {'STRIPE_METHOD': 'CSV', 'args': ['--offline']},
+    'report': {'STRIPE_METHOD': 'REPORT', 'args': []},
+}
+# Metrics where a higher value is a regression
+LOWER_IS_BETTER = ['api_calls_per_row', 'peak_rss_mb', 'p50_ms', 'p99_ms']
+
+
+def percentile(values: list, share: float):
+    """
+    Nearest-rank percentile
+    :param values: Sorted measurements
+    :param share: Percentile between 0 and 1
+    :return: float
+    """
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+
+def run_scenario(name: str, scenario: dict, server, workdir: str, rows: int, extra_args: list, rate_limit: float):
+    """
+    Runs main.py once in a child process and collects its metrics
+    :return: dict of metrics
+    """
+    base = 'http://%s:%d' % server.server_address
+    urllib.request.urlopen(urllib.request.Request(f'{base}/_stats/reset', method='POST')).read()
+
+    last = datetime.fromtimestamp(dataset.created(rows - 1), tz=timezone.utc)
+    args = list(scenario['args']) + list(extra_args)
+    if scenario['STRIPE_METHOD'] in ['API', 'REPORT']:
+        args += ['--start-date', '2024-01-01', '--end-date', (last + timedelta(days=1)).strftime('%Y-%m-%d')]
+
+    env = dict(
+        os.environ,
+        STRIPE_KEY='sk_test_benchmark',
+        STRIPE_API_BASE=base,
+        STRIPE_METHOD=scenario['STRIPE_METHOD'],
+        # The client-side limit of the live API (25/s) would cap every scenario instead of the code
+        STRIPE_RATE_LIMIT=str(rate_limit),
+        TZ='UTC',
+    )
+    result_file = os.path.join(workdir, f'{name}.json')
+    subprocess.run(
+        [sys.executable, '-c', HARNESS, REPOSITORY, result_file, '--no-cache', *args],
+        cwd=workdir, env=env, check=True, stdout=subprocess.DEVNULL
+    )
+    with open(result_file) as file:
+        result = json.load(file)
+
+    stats = json.loads(urllib.request.urlopen(f'{base}/_stats').read())
+    latencies = sorted(result['latencies'])
+    processed = len(latencies)
+    api_calls = sum(value for key, value in stats.items() if key != 'throttled')
+    return {
+        'rows': processed,
+        'wall_s': round(result['wall'], 3),
+        'rows_per_s': round(processed / result['wall'], 1) if result['wall'] else 0.0,
+        'api_calls': api_calls,
+        'api_calls_per_row': round(api_calls / processed, 3) if processed else 0.0,
+        'throttled': stats.get('throttled', 0),
+        'peak_rss_mb': round(result['max_rss_kb'] / 1024, 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float):
+    """
+    Lists metrics that got worse than the baseline by more than the tolerance
+    :return: list of regression messages
+    """
+    regressions = []
+    for name, metrics in results.items():
+        reference = baseline.get(name)
+        if not reference:
+            continue
+        if metrics['rows_per_s'] < reference['rows_per_s'] * (1 - tolerance):
+            regressions.append(f"{name}: rows/s {metrics['rows_per_s']} < {reference['rows_per_s']}")
+        for key in LOWER_IS_BETTER:
+            if metrics[key] > reference[key] * (1 + tolerance):
+                regressions.append(f"{name}: {key} {metrics[key]} > {reference[key]}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the Stripe export against a local mock API')
+    parser.add_argument('--rows', type=int, default=1000, help='Transactions in import.csv and the mock account')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='Average mock API latency')
+    parser.add_argument('--throttle-rate', type=float, default=0.0, help='Share of requests answered with 429')
+    parser.add_argument('--retry-after', type=float, help='Retry-After header sent with 429 responses')
+    parser.add_argument('--rate-limit', type=float, default=10000.0, help='STRIPE_RATE_LIMIT of the runs (default 10000)')
+    parser.add_argument('--scenario', choices=list(SCENARIOS), action='append', help='Only run these paths')
+    parser.add_argument('--output', help='Write the results as JSON')
+    parser.add_argument('--compare', help='Baseline JSON, exit with 1 on regressions')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='Allowed relative regression (default 0.1)')
+    args, main_args = parser.parse_known_args()
+
+    server = mock_stripe.start_server(
+        transactions=args.rows, latency_ms=args.latency_ms,
+        throttle_rate=args.throttle_rate, retry_after=args.retry_after
+    )
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        generate(os.path.join(workdir, 'import.csv'), args.rows)
+        for name in args.scenario or list(SCENARIOS):
+            results[name] = run_scenario(name, SCENARIOS[name], server, workdir, args.rows, main_args, args.rate_limit)
+    server.shutdown()
+
+    print(f"{'path':<6}{'rows':>10}{'rows/s':>10}{'calls/row':>11}{'throttled':>11}{'RSS MB':>9}{'p50 ms':>9}{'p99 ms':>9}")
+    for name, metrics in results.items():
+        print(f"{name:<6}{metrics['rows']:>10}{metrics['rows_per_s']:>10}{metrics['api_calls_per_row']:>11}"
+              f"{metrics['throttled']:>11}{metrics['peak_rss_mb']:>9}{metrics['p50_ms']:>9}{metrics['p99_ms']:>9}")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    if args.compare:
+        with open(args.compare) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for message in regressions:
+            print(f"Regression: {message}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,610 +1,3603 @@
+import abc
 import csv
-import stripe
-from stripe.error import InvalidRequestError
+import gzip
 import os
-from dotenv import load_dotenv
 import argparse
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import time
+import random
+import bisect
+import contextlib
+import heapq
+import asyncio
+import sqlite3
+import functools
+import importlib.util
+import json
+import glob
+import itertools
+import io
+import mmap
+import operator
+import re
+import sys
+from array import array
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+import threading
+import uuid
+import hmac
+import ipaddress
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections import OrderedDict, deque
 
-# Load environment variables from .env file
-load_dotenv()
+# Configuration, these defaults apply until configure() reads the environment (.env) or explicit settings
+STRIPE_KEY = ''
+STRIPE_NAME = 'Stripe Technology Europe, Limited'
+SUM_FEES = False
+# Summary lines of SUM_FEES: one per run, day, month or payout
+FEE_GROUPING = 'run'
+FEE_GROUPINGS = ['run', 'day', 'month', 'payout']
+STRIPE_METHOD = 'CSV'
+# Connected account (acct_...) to export with the platform key, sent as Stripe-Account header
+STRIPE_ACCOUNT = ''
+IMPORT_FILE = 'import.csv'
+# Alternative API endpoint, e.g. the local mock server of the benchmark suite
+STRIPE_API_BASE = ''
+# Expandable fields requested on BalanceTransaction.list in expand mode (max. 4 levels deep)
+BALANCE_TRANSACTION_EXPAND = [
+    'data.source',
+    'data.source.customer',
+    'data.source.payment_intent',
+    'data.source.payment_intent.customer',
+]
+# Stripe read requests per second shared by all workers
+STRIPE_RATE_LIMIT = 25.0
+# Retries of a single call after rate limit, network or server errors
+STRIPE_MAX_RETRIES = 5
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 30.0
+# AIMD adjustment of the request rate: +1% of STRIPE_RATE_LIMIT per successful call, halved on 429
+AIMD_INCREASE = 0.01
+AIMD_DECREASE = 0.5
+AIMD_MIN_RATE = 1.0
+# Shared HTTP client of all Stripe calls: keep-alive connections, seconds per call, HTTP/2 (requires httpx[http2])
+STRIPE_HTTP_POOL_SIZE = 32
+STRIPE_HTTP_TIMEOUT = 30.0
+STRIPE_HTTP2 = False
+OBJECT_CACHE_SIZE = 10000
+# Lines prefetched per batch by the async engine
+PREFETCH_BATCH_SIZE = 1000
+# Processed lines between two checkpoints of a running export
+CHECKPOINT_INTERVAL = 500
+# Write buffer per output file and rows per Parquet row group (--output-format)
+SINK_BUFFER_BYTES = 1024 * 1024
+# Partitions of --split-by payout kept open at once, the others are closed until their next line
+SPLIT_OPEN_PARTITIONS = 16
+PARQUET_ROW_GROUP_ROWS = 50000
+# Bytes per chunk of the multi-process CSV parser (--parse-workers)
+CSV_CHUNK_BYTES = 8 * 1024 * 1024
+# Pages listed ahead of the export by all shards of a sharded listing (--shards)
+SHARD_BUFFER_PAGES = 50
+# Adaptive sharding splits windows whose first page indicates more transactions than this
+SHARD_TARGET_ROWS = 5000
+# Report of STRIPE_METHOD=REPORT, itemized balance changes with the columns the converter reads
+STRIPE_REPORT_TYPE = 'balance_change_from_activity.itemized.3'
+REPORT_COLUMNS = [
+    'balance_transaction_id', 'created_utc', 'available_on_utc', 'currency', 'gross', 'fee', 'net',
+    'reporting_category', 'source_id', 'description', 'customer_facing_amount', 'automatic_payout_id',
+    'customer_name', 'customer_email', 'payment_method_type', 'card_brand', 'card_last4', 'payment_metadata[product_name]',
+]
+# Seconds between the status requests of a running report, doubled up to the maximum
+REPORT_POLL_MIN_DELAY = 1.0
+REPORT_POLL_MAX_DELAY = 30.0
+# Objects listed by the bulk prefetch stage (--prefetch)
+PREFETCH_RESOURCES = ['Charge', 'PaymentIntent', 'Refund', 'Customer']
+# Objects can be created a little before their balance transaction (e.g. captured later)
+PREFETCH_WINDOW_MARGIN = 86400
+ENRICHMENT_CACHE_FILE = '.enrichment_cache.sqlite'
+ENRICHMENT_CACHE_TTL_DAYS = 30.0
+ENRICHMENT_CACHE_MAX_ENTRIES = 500000
+# Local ledger of synced balance transactions (sync command, STRIPE_METHOD=LEDGER)
+LEDGER_FILE = '.ledger.sqlite'
+# Settings of configure(): environment variable / module global -> type
+SETTINGS = {
+    'STRIPE_KEY': str,
+    'STRIPE_NAME': str,
+    'SUM_FEES': bool,
+    'FEE_GROUPING': str,
+    'STRIPE_METHOD': str,
+    'STRIPE_ACCOUNT': str,
+    'IMPORT_FILE': str,
+    'STRIPE_API_BASE': str,
+    'STRIPE_RATE_LIMIT': float,
+    'STRIPE_MAX_RETRIES': int,
+    'STRIPE_HTTP_POOL_SIZE': int,
+    'STRIPE_HTTP_TIMEOUT': float,
+    'STRIPE_HTTP2': bool,
+    'OBJECT_CACHE_SIZE': int,
+    'STRIPE_REPORT_TYPE': str,
+    'ENRICHMENT_CACHE_FILE': str,
+    'ENRICHMENT_CACHE_TTL_DAYS': float,
+    'ENRICHMENT_CACHE_MAX_ENTRIES': int,
+    'LEDGER_FILE': str,
+}
+DEFAULT_SETTINGS = {name: globals()[name] for name in SETTINGS}
+# Default daemon address (serve command)
+SERVE_HOST = '127.0.0.1'
+SERVE_PORT = 8765
+# Settings a request of the export daemon may override. Never the Stripe key, API base or file paths,
+# a request could otherwise send the key to another host or read and write any file.
+DAEMON_SETTINGS = ['SUM_FEES', 'FEE_GROUPING', 'STRIPE_METHOD']
+# CLI options a request of the export daemon may pass
+DAEMON_OPTIONS = [
+    'expand', 'workers', 'engine', 'concurrency', 'shards', 'shard_by', 'prefetch', 'parse_workers',
+    'offline', 'no_cache', 'output_format', 'split_by', 'profile',
+]
 
-# Configuration from environment variables
-STRIPE_KEY = os.getenv('STRIPE_KEY', '')
-STRIPE_NAME = os.getenv('STRIPE_NAME', 'Stripe Technology Europe, Limited')
-SUM_FEES = os.getenv('SUM_FEES', 'false').lower() == 'true'
-STRIPE_METHOD = os.getenv('STRIPE_METHOD', 'CSV').upper()
+# The Stripe library is imported by load_stripe() once a Stripe call is made, offline CSV runs never load it
+stripe = None
+# Stripe exception classes, bound by load_stripe(). Until then no exception matches them.
+InvalidRequestError = RateLimitError = APIConnectionError = StripeError = ()
+
+
+def load_stripe():
+    """
+    Imports the Stripe library on first use
+    :return: stripe module
+    """
+    global stripe, InvalidRequestError, RateLimitError, APIConnectionError, StripeError
+    if stripe is None:
+        import stripe as stripe_library
+        from stripe import error
+        InvalidRequestError = error.InvalidRequestError
+        RateLimitError = error.RateLimitError
+        APIConnectionError = error.APIConnectionError
+        StripeError = error.StripeError
+        stripe = stripe_library
+    return stripe
 
 
 def get_client():
     """
-    This method sets the api key & return the client
-    :return: stripe
+    This method sets the api key & return the client
+    :return: stripe
+    """
+    client = load_stripe()
+    client.api_key = STRIPE_KEY
+    client.api_base = STRIPE_API_BASE or client.DEFAULT_API_BASE
+    HTTP_POOL.client()
+    return client
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket limiting the Stripe request rate across all workers.
+    The rate adapts with AIMD: it grows additively with every successful call up to the
+    configured maximum and is halved whenever Stripe answers with 429, which also pauses
+    every worker, not only the throttled one.
+    """
+
+    def __init__(self, rate: float, burst: float = None):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = burst or rate
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _try_acquire(self):
+        """
+        Takes a token if one is available
+        :return: 0 if a token was taken, otherwise the seconds to wait before trying again
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if now >= self._paused_until and self._tokens >= 1:
+                self._tokens -= 1
+                return 0
+            return max(self._paused_until - now, (1 - self._tokens) / self.rate)
+
+    def acquire(self):
+        """
+        Blocks until a request may be sent
+        """
+        wait = self._try_acquire()
+        while wait:
+            time.sleep(wait)
+            wait = self._try_acquire()
+
+    async def acquire_async(self):
+        """
+        Waits without blocking the event loop until a request may be sent
+        """
+        wait = self._try_acquire()
+        while wait:
+            await asyncio.sleep(wait)
+            wait = self._try_acquire()
+
+    def on_success(self):
+        """
+        Additive increase of the request rate after a successful call
+        """
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate * AIMD_INCREASE)
+
+    def back_off(self, seconds: float):
+        """
+        Multiplicative decrease of the request rate after a rate limit error.
+        All requests pause and the bucket is drained.
+        :param seconds: Pause duration
+        """
+        with self._lock:
+            self.rate = max(AIMD_MIN_RATE, self.rate * AIMD_DECREASE)
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0
+
+    def set_rate(self, rate: float):
+        """
+        Changes the configured maximum rate, e.g. after configure()
+        :param rate: Requests per second
+        """
+        with self._lock:
+            self.max_rate = rate
+            self.rate = rate
+            self.capacity = rate
+            self._tokens = min(self._tokens, self.capacity)
+
+
+RATE_LIMITER = TokenBucket(STRIPE_RATE_LIMIT)
+
+
+class StripeHttpPool:
+    """
+    One explicitly configured HTTP client for all Stripe calls, shared by all worker threads instead of
+    a session per thread: a keep-alive pool of STRIPE_HTTP_POOL_SIZE connections, STRIPE_HTTP_TIMEOUT
+    seconds per call and optionally HTTP/2. The client is built on first use and rebuilt when these
+    settings change. New connections are counted, so the summary shows how many requests reused one.
+    """
+
+    def __init__(self):
+        self._client = None
+        self._settings = None
+        self._session = None
+        self._httpx_options = None
+        self._requests = 0
+        self._connections = 0
+        self._baseline = (0, 0)
+        # HTTP versions negotiated by the responses of the current run
+        self._protocols = set()
+        self._lock = threading.Lock()
+
+    def client(self, async_engine: bool = False):
+        """
+        Returns the shared client and installs it as stripe.default_http_client
+        :param async_engine: The async engine needs an httpx client
+        :return: stripe.HTTPClient
+        """
+        settings = (STRIPE_HTTP_POOL_SIZE, STRIPE_HTTP_TIMEOUT, STRIPE_HTTP2)
+        use_httpx = STRIPE_HTTP2 or async_engine
+        client = self._client
+        if client is None or self._settings != settings or (use_httpx and self._session is not None):
+            with self._lock:
+                if self._client is None or self._settings != settings or (use_httpx and self._session is not None):
+                    self.close()
+                    self._client = self._create_httpx() if use_httpx else self._create_requests()
+                    self._settings = settings
+                client = self._client
+        stripe.default_http_client = client
+        return client
+
+    def _create_requests(self):
+        """
+        Client on one requests session, all threads share its urllib3 connection pool
+        :return: stripe.RequestsClient
+        """
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self._session = requests.Session()
+        # Threads wait for a free connection instead of opening connections that are not kept alive
+        adapter = HTTPAdapter(pool_maxsize=STRIPE_HTTP_POOL_SIZE, pool_block=True)
+        self._session.mount('https://', adapter)
+        self._session.mount('http://', adapter)
+        return stripe.RequestsClient(timeout=STRIPE_HTTP_TIMEOUT, session=self._session)
+
+    def _create_httpx(self):
+        """
+        Client on one httpx client (and one async client for the async engine), with HTTP/2 if configured
+        :return: stripe.HTTPXClient
+        """
+        if importlib.util.find_spec('httpx') is None or (STRIPE_HTTP2 and importlib.util.find_spec('h2') is None):
+            raise ImportError(
+                "STRIPE_HTTP2 requires the 'httpx' package with HTTP/2 support!\n"
+                "Possible solutions:\n"
+                "1. Install it: pip install 'httpx[http2]'\n"
+                "2. Or use HTTP/1.1 keep-alive connections: STRIPE_HTTP2=false"
+            )
+        import httpx
+        import ssl
+
+        client = stripe.HTTPXClient(timeout=STRIPE_HTTP_TIMEOUT, allow_sync_methods=True)
+        # stripe.HTTPXClient takes no pool options, its httpx clients are replaced by configured ones.
+        # These attributes are private, requirements.txt pins the stripe versions that have them.
+        if not isinstance(getattr(client, '_client', None), httpx.Client) or not hasattr(client, '_client_async'):
+            raise RuntimeError(
+                f"stripe {stripe.VERSION} does not expose the httpx clients of stripe.HTTPXClient!\n"
+                "Possible solutions:\n"
+                "1. Install the supported version: pip install -r requirements.txt\n"
+                "2. Or use the requests client: STRIPE_HTTP2=false and --engine sync"
+            )
+        client._client.close()
+        self._httpx_options = {
+            'verify': ssl.create_default_context(cafile=stripe.ca_bundle_path),
+            'limits': httpx.Limits(max_connections=STRIPE_HTTP_POOL_SIZE, max_keepalive_connections=STRIPE_HTTP_POOL_SIZE),
+            'http2': STRIPE_HTTP2,
+        }
+        client._client = httpx.Client(event_hooks=self._event_hooks(), **self._httpx_options)
+        client._client_async = httpx.AsyncClient(event_hooks=self._event_hooks_async(), **self._httpx_options)
+        return client
+
+    def _event_hooks(self):
+        return {'request': [self._trace_request], 'response': [self._trace_response]}
+
+    def _event_hooks_async(self):
+        return {'request': [self._trace_request_async], 'response': [self._trace_response_async]}
+
+    def _count(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def _trace_request(self, request):
+        self._count('_requests')
+        request.extensions['trace'] = self._trace
+
+    async def _trace_request_async(self, request):
+        self._count('_requests')
+        request.extensions['trace'] = self._trace_async
+
+    def _trace_response(self, response):
+        self._protocols.add(response.http_version)
+
+    async def _trace_response_async(self, response):
+        self._trace_response(response)
+
+    def _trace(self, event: str, info: dict):
+        if event == 'connection.connect_tcp.complete':
+            self._count('_connections')
+
+    async def _trace_async(self, event: str, info: dict):
+        self._trace(event, info)
+
+    async def close_async(self):
+        """
+        Closes the connections of the async client, which belong to the event loop of one async run.
+        The next run gets a new async client, the synchronous connections stay open.
+        """
+        import httpx
+
+        client = self._client
+        await client._client_async.aclose()
+        client._client_async = httpx.AsyncClient(event_hooks=self._event_hooks_async(), **self._httpx_options)
+
+    def close(self):
+        """
+        Closes all connections of the current client
+        """
+        if self._client is None:
+            return
+        if self._session is not None:
+            self._session.close()
+        else:
+            self._client._client.close()
+        self._client = None
+        self._session = None
+        self._requests = 0
+        self._connections = 0
+        self._baseline = (0, 0)
+
+    def _counts(self):
+        """
+        Requests sent and connections opened by the current client
+        :return: Tuple (requests, connections)
+        """
+        if self._session is not None:
+            # urllib3 counts per host pool, keyed by scheme, host, port and TLS options
+            pools = self._session.get_adapter(stripe.api_base).poolmanager.pools
+            counts = [(pools[key].num_requests, pools[key].num_connections) for key in pools.keys()]
+            return tuple(map(sum, zip(*counts))) if counts else (0, 0)
+        return self._requests, self._connections
+
+    def reset_statistics(self):
+        """
+        Starts counting the requests of another run, the connections stay open
+        """
+        self._baseline = self._counts() if self._client is not None else (0, 0)
+        self._protocols = set()
+
+    def summary(self):
+        """
+        Human readable connection reuse statistics
+        :return: str
+        """
+        requests, connections = (count - baseline for count, baseline in zip(self._counts(), self._baseline))
+        reused = (requests - connections) / requests * 100 if requests else 0.0
+        # The requests client only speaks HTTP/1.1, httpx reports the negotiated version per response
+        protocol = ', '.join(sorted(self._protocols)) if self._session is None and self._protocols else 'HTTP/1.1'
+        if STRIPE_HTTP2 and 'HTTP/2' not in protocol:
+            protocol += ', HTTP/2 requested'
+        return (f"{connections} new connections for {requests} requests ({reused:.1f}% reused, "
+                f"pool size {STRIPE_HTTP_POOL_SIZE}, {protocol})")
+
+
+HTTP_POOL = StripeHttpPool()
+
+
+class CallStats:
+    """
+    Counters of the Stripe call layer. Failed calls are also counted per thread,
+    so a transaction line can tell whether its values are only fallbacks (degraded).
+    """
+
+    MAX_DEGRADED_IDS = 20
+
+    def __init__(self):
+        self.calls = 0
+        self.retries = 0
+        self.throttled = 0
+        self.failed = 0
+        self.degraded_rows = 0
+        self.degraded_ids = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def count(self, name: str):
+        """
+        Increments one of the global counters
+        :param name: Counter name
+        """
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def record_failure(self):
+        """
+        Records a call that failed for good (after all retries)
+        """
+        self.count('failed')
+        self._local.failures = self.thread_failures() + 1
+
+    def thread_failures(self):
+        """
+        Number of failed calls in the current thread
+        :return: int
+        """
+        return getattr(self._local, 'failures', 0)
+
+    def record_degraded(self, transaction_id: str):
+        """
+        Records a transaction line whose customer or description was resolved with fallback values
+        :param transaction_id: Balance transaction id
+        """
+        with self._lock:
+            self.degraded_rows += 1
+            if len(self.degraded_ids) < self.MAX_DEGRADED_IDS:
+                self.degraded_ids.append(transaction_id)
+
+    def reset(self):
+        """
+        Clears all counters before another run in the same process
+        """
+        with self._lock:
+            self.calls = 0
+            self.retries = 0
+            self.throttled = 0
+            self.failed = 0
+            self.degraded_rows = 0
+            self.degraded_ids = []
+            self._local = threading.local()
+
+    def summary(self):
+        """
+        Human readable call statistics
+        :return: str
+        """
+        return (f"{self.calls} calls, {self.retries} retries, {self.throttled} throttled, {self.failed} failed "
+                f"(rate limit now {RATE_LIMITER.rate:.1f}/s)")
+
+
+CALL_STATS = CallStats()
+
+
+class Profiler:
+    """
+    Collects the --profile report: exclusive wall time per pipeline stage, call counts and latency
+    histograms of the enrichment helpers, Stripe calls and cache hits per object type and the
+    slowest source ids. While disabled, every hook only checks a flag.
+    """
+
+    HISTOGRAM_BOUNDS_MS = [1, 5, 10, 50, 100, 500, 1000, 5000]
+    SLOWEST_SOURCES = 20
+
+    def __init__(self):
+        self.enabled = False
+        self.stages = {}
+        self.helpers = {}
+        self.objects = {}
+        self._slowest = []
+        self._started = None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    def reset(self):
+        """
+        Disables profiling and drops the measurements of the previous run
+        """
+        with self._lock:
+            self.enabled = False
+            self.stages = {}
+            self.helpers = {}
+            self.objects = {}
+            self._slowest = []
+            self._started = None
+
+    def enable(self):
+        """
+        Starts profiling the run
+        """
+        self.enabled = True
+        self._started = time.perf_counter()
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        """
+        Measures the wall time of a pipeline stage, excluding the time of stages nested inside it
+        :param name: Stage name
+        """
+        if not self.enabled:
+            yield
+            return
+        stack = self._local.__dict__.setdefault('stack', [])
+        stack.append(0.0)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            nested = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            with self._lock:
+                self.stages[name] = self.stages.get(name, 0.0) + elapsed - nested
+
+    def timed(self, name: str, iterator):
+        """
+        Attributes the time spent producing the items of an iterator to a stage
+        :param name: Stage name
+        :param iterator: Iterator of a pipeline stage
+        :return: Iterator of the same items
+        """
+        if not self.enabled:
+            return iterator
+        return self._timed(name, iter(iterator))
+
+    def _timed(self, name: str, iterator):
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def record_helper(self, name: str, seconds: float):
+        """
+        Adds one call of an enrichment helper to its latency histogram
+        :param name: Helper name
+        :param seconds: Duration of the call
+        """
+        milliseconds = seconds * 1000
+        bucket = bisect.bisect_left(self.HISTOGRAM_BOUNDS_MS, milliseconds)
+        with self._lock:
+            stats = self.helpers.get(name)
+            if stats is None:
+                stats = self.helpers[name] = {
+                    'calls': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+                    'histogram': [0] * (len(self.HISTOGRAM_BOUNDS_MS) + 1),
+                }
+            stats['calls'] += 1
+            stats['total_ms'] += milliseconds
+            stats['max_ms'] = max(stats['max_ms'], milliseconds)
+            stats['histogram'][bucket] += 1
+
+    def count_object(self, object_name: str, counter: str):
+        """
+        Counts a Stripe call or object cache lookup per object type
+        :param object_name: Stripe object type (e.g. charge)
+        :param counter: calls, hits, negative_hits or misses
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            stats = self.objects.setdefault(object_name, {'calls': 0, 'hits': 0, 'negative_hits': 0, 'misses': 0})
+            stats[counter] += 1
+
+    def record_source(self, source_id: str, transaction_id: str, seconds: float):
+        """
+        Keeps the slowest enriched transaction lines
+        :param source_id: Stripe source id
+        :param transaction_id: Balance transaction id
+        :param seconds: Enrichment time of the line
+        """
+        entry = (seconds, source_id or '', transaction_id)
+        with self._lock:
+            if len(self._slowest) < self.SLOWEST_SOURCES:
+                heapq.heappush(self._slowest, entry)
+            elif entry > self._slowest[0]:
+                heapq.heapreplace(self._slowest, entry)
+
+    def report(self):
+        """
+        Machine readable profile of the run
+        :return: dict
+        """
+        with self._lock:
+            histogram_labels = [f'<{bound}ms' for bound in self.HISTOGRAM_BOUNDS_MS]
+            histogram_labels.append(f'>={self.HISTOGRAM_BOUNDS_MS[-1]}ms')
+            return {
+                'wall_seconds': round(time.perf_counter() - self._started, 3),
+                'stages': {name: round(seconds, 3) for name, seconds in self.stages.items()},
+                'helpers': {
+                    name: dict(
+                        calls=stats['calls'],
+                        total_ms=round(stats['total_ms'], 3),
+                        mean_ms=round(stats['total_ms'] / stats['calls'], 3),
+                        max_ms=round(stats['max_ms'], 3),
+                        histogram=dict(zip(histogram_labels, stats['histogram'])),
+                    )
+                    for name, stats in self.helpers.items()
+                },
+                'stripe_objects': {name: dict(stats) for name, stats in sorted(self.objects.items())},
+                'slowest_sources': [
+                    {'source': source_id, 'transaction': transaction_id, 'ms': round(seconds * 1000, 3)}
+                    for seconds, source_id, transaction_id in sorted(self._slowest, reverse=True)
+                ],
+            }
+
+    def summary(self):
+        """
+        Human readable profile of the run
+        :return: str
+        """
+        report = self.report()
+        lines = [f"Profile ({report['wall_seconds']:.2f}s wall time):", "  Stages:"]
+        for name, seconds in sorted(report['stages'].items(), key=lambda item: -item[1]):
+            lines.append(f"    {name:<16}{seconds:>10.3f}s")
+        lines.append("  Helpers:")
+        for name, stats in sorted(report['helpers'].items(), key=lambda item: -item[1]['total_ms']):
+            histogram = ' '.join(f"{label}:{count}" for label, count in stats['histogram'].items() if count)
+            lines.append(f"    {name:<28}{stats['calls']:>8} calls {stats['mean_ms']:>9.2f}ms avg "
+                         f"{stats['max_ms']:>9.2f}ms max  {histogram}")
+        lines.append("  Stripe objects:")
+        for name, stats in report['stripe_objects'].items():
+            lookups = stats['hits'] + stats['negative_hits'] + stats['misses']
+            hit_rate = (stats['hits'] + stats['negative_hits']) / lookups * 100 if lookups else 0.0
+            lines.append(f"    {name:<28}{stats['calls']:>8} API calls {lookups:>8} lookups "
+                         f"({hit_rate:.1f}% cache hit rate)")
+        lines.append(f"  Slowest {len(report['slowest_sources'])} sources:")
+        for entry in report['slowest_sources']:
+            lines.append(f"    {entry['source'] or '-':<32}{entry['transaction']:<32}{entry['ms']:>10.2f}ms")
+        return '\n'.join(lines)
+
+
+PROFILER = Profiler()
+
+
+def _object_name(func):
+    """
+    Stripe object type a resource method belongs to (e.g. stripe.Charge.retrieve -> charge)
+    :param func: Stripe API method
+    :return: str
+    """
+    return getattr(getattr(func, '__self__', None), 'OBJECT_NAME', getattr(func, '__name__', 'unknown'))
+
+
+def _is_retryable(error):
+    """
+    Checks if a failed Stripe call may succeed when it is repeated
+    :param error: Exception raised by the Stripe library
+    :return: bool
+    """
+    if isinstance(error, (RateLimitError, APIConnectionError)):
+        return True
+    if isinstance(error, StripeError):
+        if (error.headers or {}).get('Stripe-Should-Retry') == 'true':
+            return True
+        return (error.http_status or 0) >= 500
+    return False
+
+
+def _retry_delay(error, attempt: int):
+    """
+    Backoff before the next attempt: Retry-After if Stripe sent it, otherwise
+    exponential backoff with full jitter
+    :param error: Exception raised by the Stripe library
+    :param attempt: Number of the failed attempt (starting at 1)
+    :return: Seconds to wait
+    """
+    retry_after = (getattr(error, 'headers', None) or {}).get('Retry-After')
+    if retry_after:
+        try:
+            return min(float(retry_after), RETRY_MAX_DELAY)
+        except ValueError:
+            pass
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+def call_stripe(func, *args, **kwargs):
+    """
+    Central call layer for every Stripe retrieve and list request: shared adaptive rate limit,
+    bounded retries with jittered exponential backoff for rate limits, network and server errors.
+    Calls that still fail are counted, so fallback values in the export do not go unnoticed.
+    :param func: Stripe API method (e.g. stripe.Charge.retrieve)
+    :return: API result
+    """
+    if STRIPE_ACCOUNT:
+        kwargs.setdefault('stripe_account', STRIPE_ACCOUNT)
+    attempt = 0
+    while True:
+        RATE_LIMITER.acquire()
+        CALL_STATS.count('calls')
+        PROFILER.count_object(_object_name(func), 'calls')
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            if not _is_retryable(e) or attempt >= STRIPE_MAX_RETRIES:
+                if not isinstance(e, InvalidRequestError):
+                    CALL_STATS.record_failure()
+                raise
+            attempt += 1
+            CALL_STATS.count('retries')
+            delay = _retry_delay(e, attempt)
+            if isinstance(e, RateLimitError):
+                CALL_STATS.count('throttled')
+                RATE_LIMITER.back_off(delay)
+            else:
+                time.sleep(delay)
+            continue
+        RATE_LIMITER.on_success()
+        return result
+
+
+async def call_stripe_async(func, *args, **kwargs):
+    """
+    Async counterpart of call_stripe() for the *_async methods of the Stripe library.
+    Failures are not counted as degraded, the synchronous enrichment retries them.
+    :param func: Async Stripe API method (e.g. stripe.Charge.retrieve_async)
+    :return: API result
+    """
+    if STRIPE_ACCOUNT:
+        kwargs.setdefault('stripe_account', STRIPE_ACCOUNT)
+    attempt = 0
+    while True:
+        await RATE_LIMITER.acquire_async()
+        CALL_STATS.count('calls')
+        PROFILER.count_object(_object_name(func), 'calls')
+        try:
+            result = await func(*args, **kwargs)
+        except Exception as e:
+            if not _is_retryable(e) or attempt >= STRIPE_MAX_RETRIES:
+                raise
+            attempt += 1
+            CALL_STATS.count('retries')
+            delay = _retry_delay(e, attempt)
+            if isinstance(e, RateLimitError):
+                CALL_STATS.count('throttled')
+                RATE_LIMITER.back_off(delay)
+            else:
+                await asyncio.sleep(delay)
+            continue
+        RATE_LIMITER.on_success()
+        return result
+
+
+class StripeObjectCache:
+    """
+    In-process LRU cache for retrieved Stripe objects, shared by all enrichment helpers.
+    Objects are keyed by object type and Stripe id, so every object is fetched at most once per run.
+    Ids that Stripe rejects with an InvalidRequestError are cached as well (negative caching).
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self._entries = OrderedDict()
+        self._prefetched = {}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    def _lookup(self, key):
+        """
+        Looks up an object in the prefetched index and the LRU cache, the lock must be held
+        :param key: Tuple (object type, id)
+        :return: Tuple (found, object), raises the cached error of negative entries
+        """
+        if key in self._prefetched:
+            self.hits += 1
+            PROFILER.count_object(key[0], 'hits')
+            return True, self._prefetched[key]
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            is_error, value = self._entries[key]
+            if is_error:
+                self.negative_hits += 1
+                PROFILER.count_object(key[0], 'negative_hits')
+                raise value
+            self.hits += 1
+            PROFILER.count_object(key[0], 'hits')
+            return True, value
+        return False, None
+
+    def get_or_fetch(self, resource, object_id: str):
+        """
+        Returns the cached object or retrieves it from Stripe
+        :param resource: Stripe resource class (e.g. stripe.Charge)
+        :param object_id: Stripe object id
+        :return: Stripe object
+        """
+        key = (resource.OBJECT_NAME, object_id)
+        with self._lock:
+            found, value = self._lookup(key)
+            if found:
+                return value
+            pending = self._in_flight.get(key)
+            if pending is None:
+                # This thread fetches the object, concurrent lookups wait for it
+                self._in_flight[key] = threading.Event()
+                self.misses += 1
+                PROFILER.count_object(key[0], 'misses')
+
+        if pending is not None:
+            pending.wait()
+            return self.get_or_fetch(resource, object_id)
+
+        try:
+            value = call_stripe(resource.retrieve, object_id)
+            self._store(key, False, value)
+            return value
+        except InvalidRequestError as e:
+            self._store(key, True, e)
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key).set()
+
+    async def get_or_fetch_async(self, resource, object_id: str):
+        """
+        Async variant of get_or_fetch() used by the asyncio prefetch engine
+        :param resource: Stripe resource class (e.g. stripe.Charge)
+        :param object_id: Stripe object id
+        :return: Stripe object
+        """
+        key = (resource.OBJECT_NAME, object_id)
+        with self._lock:
+            found, value = self._lookup(key)
+            if found:
+                return value
+            self.misses += 1
+            PROFILER.count_object(key[0], 'misses')
+
+        try:
+            value = await call_stripe_async(resource.retrieve_async, object_id)
+        except InvalidRequestError as e:
+            self._store(key, True, e)
+            raise
+        self._store(key, False, value)
+        return value
+
+    def seed(self, obj):
+        """
+        Stores an object that was already delivered by Stripe (e.g. an expanded list field),
+        including all expanded objects nested inside it
+        :param obj: Stripe object
+        """
+        for field_value in obj.values():
+            if _is_expanded_object(field_value):
+                self.seed(field_value)
+        self._store((obj['object'], obj['id']), False, obj)
+
+    def index(self, obj):
+        """
+        Adds a bulk-prefetched object to the index, which is not subject to LRU eviction
+        and only holds the objects of the current run (see drop_prefetched)
+        :param obj: Stripe object
+        """
+        with self._lock:
+            self._prefetched[(obj['object'], obj['id'])] = obj
+
+    def _store(self, key, is_error: bool, value):
+        with self._lock:
+            self._entries[key] = (is_error, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def drop_prefetched(self):
+        """
+        Drops the prefetched index at the end of a run. Otherwise every --prefetch run of a Converter
+        or the daemon adds its whole window for good and later runs get objects changed since then.
+        """
+        with self._lock:
+            self._prefetched.clear()
+
+    def clear(self):
+        """
+        Drops all cached and prefetched objects, e.g. when another Stripe account is configured
+        """
+        with self._lock:
+            self._entries.clear()
+            self._prefetched.clear()
+
+    def reset_statistics(self):
+        """
+        Clears the hit/miss statistics before another run, the cached objects stay warm
+        """
+        with self._lock:
+            self.hits = 0
+            self.misses = 0
+            self.negative_hits = 0
+
+    def summary(self):
+        """
+        Human readable hit/miss statistics
+        :return: str
+        """
+        lookups = self.hits + self.negative_hits + self.misses
+        hit_rate = (self.hits + self.negative_hits) / lookups * 100 if lookups else 0.0
+        return (f"{self.misses} API calls, {self.hits} hits, {self.negative_hits} negative hits "
+                f"({hit_rate:.1f}% hit rate)")
+
+
+OBJECT_CACHE = StripeObjectCache(OBJECT_CACHE_SIZE)
+
+
+def _is_expanded_object(value):
+    """
+    Checks if an expandable field holds a full Stripe object instead of an id
+    :param value: Field value
+    :return: bool
+    """
+    return isinstance(value, dict) and 'id' in value and 'object' in value
+
+
+def retrieve_object(resource, object_id):
+    """
+    Retrieves a Stripe object through the per-run object cache
+    :param resource: Stripe resource class (e.g. client.Charge)
+    :param object_id: Stripe object id or an already expanded object
+    :return: Stripe object
+    """
+    if _is_expanded_object(object_id):
+        return object_id
+    return OBJECT_CACHE.get_or_fetch(resource, object_id)
+
+
+class EnrichmentCache:
+    """
+    Persistent SQLite cache for resolved enrichment fields (customer name, description,
+    payment method, product name, ...) per source id, reused across runs.
+    Entries expire after ENRICHMENT_CACHE_TTL_DAYS, the oldest entries are evicted
+    once the cache holds more than ENRICHMENT_CACHE_MAX_ENTRIES.
+    """
+
+    COMMIT_INTERVAL = 500
+
+    def __init__(self, path: str, ttl_days: float, max_entries: int):
+        self.path = path
+        self.ttl_seconds = ttl_days * 86400
+        self.max_entries = max_entries
+        self.enabled = False
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+        self._pending_writes = 0
+        self._lock = threading.Lock()
+
+    def open(self, clear: bool = False):
+        """
+        Opens (and creates) the cache file and drops expired entries
+        :param clear: Remove all cached entries before the run
+        """
+        self.hits = 0
+        self.misses = 0
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS enrichment ('
+            'source_id TEXT NOT NULL, field TEXT NOT NULL, value TEXT NOT NULL, updated_at REAL NOT NULL, '
+            'PRIMARY KEY (source_id, field))'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS enrichment_updated_at ON enrichment (updated_at)')
+        if clear:
+            self._conn.execute('DELETE FROM enrichment')
+        else:
+            self._conn.execute('DELETE FROM enrichment WHERE updated_at < ?', (time.time() - self.ttl_seconds,))
+        self._conn.commit()
+        self.enabled = True
+
+    def contains(self, source_id: str, field: str):
+        """
+        Checks for a valid entry without touching the hit/miss statistics
+        :param source_id: Stripe source id
+        :param field: Enrichment field name
+        :return: bool
+        """
+        with self._lock:
+            return self._conn.execute(
+                'SELECT 1 FROM enrichment WHERE source_id = ? AND field = ? AND updated_at >= ?',
+                (source_id, field, time.time() - self.ttl_seconds)
+            ).fetchone() is not None
+
+    def get(self, source_id: str, field: str):
+        """
+        Returns the cached value or None if there is no valid entry
+        :param source_id: Stripe source id
+        :param field: Enrichment field name
+        :return: str or None
+        """
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT value FROM enrichment WHERE source_id = ? AND field = ? AND updated_at >= ?',
+                (source_id, field, time.time() - self.ttl_seconds)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def set(self, source_id: str, field: str, value: str):
+        """
+        Stores a resolved value, writes are committed in batches
+        :param source_id: Stripe source id
+        :param field: Enrichment field name
+        :param value: Resolved value
+        """
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO enrichment (source_id, field, value, updated_at) VALUES (?, ?, ?, ?)',
+                (source_id, field, value, time.time())
+            )
+            self._pending_writes += 1
+            if self._pending_writes >= self.COMMIT_INTERVAL:
+                self._conn.commit()
+                self._pending_writes = 0
+
+    def close(self):
+        """
+        Evicts the oldest entries above the size limit and closes the cache file
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            count = self._conn.execute('SELECT COUNT(*) FROM enrichment').fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    'DELETE FROM enrichment WHERE rowid IN '
+                    '(SELECT rowid FROM enrichment ORDER BY updated_at ASC LIMIT ?)',
+                    (count - self.max_entries,)
+                )
+            self._conn.commit()
+            self._conn.close()
+            self._conn = None
+            self.enabled = False
+
+    def summary(self):
+        """
+        Human readable hit/miss statistics
+        :return: str
+        """
+        return f"{self.hits} hits, {self.misses} misses ({self.path})"
+
+
+ENRICHMENT_CACHE = EnrichmentCache(ENRICHMENT_CACHE_FILE, ENRICHMENT_CACHE_TTL_DAYS, ENRICHMENT_CACHE_MAX_ENTRIES)
+
+
+class Ledger:
+    """
+    Local SQLite ledger of balance transactions with their resolved customer and description.
+    The sync command adds new transactions since the last completed sync, exports with
+    STRIPE_METHOD=LEDGER read a date range through the index on the created column.
+    """
+
+    COMMIT_INTERVAL = 500
+
+    def __init__(self, path: str):
+        self.path = path
+        self.added = 0
+        self.updated = 0
+        self._conn = None
+        self._pending_writes = 0
+        self._lock = threading.Lock()
+
+    def open(self):
+        """
+        Opens (and creates) the ledger file
+        """
+        self.added = 0
+        self.updated = 0
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS transactions ('
+            'id TEXT PRIMARY KEY, created TEXT NOT NULL, line TEXT NOT NULL, customer TEXT, description TEXT, '
+            'degraded INTEGER NOT NULL)'
+        )
+        self._conn.execute('CREATE INDEX IF NOT EXISTS transactions_created ON transactions (created)')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+        # Disjoint time ranges of the completed syncs, a sync of January and one of March leave February uncovered
+        self._conn.execute('CREATE TABLE IF NOT EXISTS synced_ranges (synced_from TEXT NOT NULL, synced_until TEXT NOT NULL)')
+        state = dict(self._conn.execute('SELECT key, value FROM sync_state').fetchall())
+        if 'synced_from' in state:
+            # Ledgers of earlier versions only kept the outer bounds of all syncs
+            self._conn.execute('INSERT INTO synced_ranges VALUES (?, ?)', (state['synced_from'], state['synced_until']))
+            self._conn.execute("DELETE FROM sync_state WHERE key IN ('synced_from', 'synced_until')")
+        self._conn.commit()
+
+    def synced_ranges(self):
+        """
+        Time ranges covered by the completed syncs
+        :return: List of (from, until) tuples in the date format of the transaction lines, oldest first
+        """
+        with self._lock:
+            return self._conn.execute('SELECT synced_from, synced_until FROM synced_ranges ORDER BY synced_from').fetchall()
+
+    def synced_range(self):
+        """
+        Outer bounds of the completed syncs, the next sync continues at the end
+        :return: Tuple (from, until) in the date format of the transaction lines, or None before the first sync
+        """
+        ranges = self.synced_ranges()
+        if not ranges:
+            return None
+        return ranges[0][0], max(until for _, until in ranges)
+
+    def gaps(self, start: str, end: str):
+        """
+        Parts of a time range that no completed sync covers
+        :param start: Start (inclusive) in the date format of the transaction lines
+        :param end: End (inclusive)
+        :return: List of (from, until) tuples
+        """
+        gaps = []
+        cursor = start
+        for synced_from, synced_until in self.synced_ranges():
+            if synced_until < cursor:
+                continue
+            if synced_from > end:
+                break
+            if synced_from > cursor:
+                gaps.append((cursor, synced_from))
+            cursor = max(cursor, synced_until)
+        if cursor < end:
+            gaps.append((cursor, end))
+        return gaps
+
+    def contains(self, transaction_id: str):
+        """
+        :param transaction_id: Balance transaction id
+        :return: bool
+        """
+        with self._lock:
+            return self._conn.execute('SELECT 1 FROM transactions WHERE id = ?', (transaction_id,)).fetchone() is not None
+
+    def degraded_lines(self):
+        """
+        Transactions stored with fallback values because Stripe calls failed, they are resolved again
+        :return: List of transaction lines
+        """
+        with self._lock:
+            rows = self._conn.execute('SELECT line FROM transactions WHERE degraded = 1 ORDER BY rowid').fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def add(self, line, customer: str, description: str, degraded: bool):
+        """
+        Stores a transaction line with its resolved values, writes are committed in batches.
+        Existing transactions keep their position and only get the new values.
+        :param line: Transaction line, amount and fee in cents
+        :param customer: Resolved customer
+        :param description: Resolved description
+        :param degraded: The values are only fallbacks because a Stripe call failed
+        """
+        with self._lock:
+            cursor = self._conn.execute(
+                'UPDATE transactions SET customer = ?, description = ?, degraded = ? WHERE id = ?',
+                (customer, description, int(degraded), line[0])
+            )
+            if cursor.rowcount:
+                self.updated += 1
+            else:
+                self._conn.execute(
+                    'INSERT INTO transactions (id, created, line, customer, description, degraded) VALUES (?, ?, ?, ?, ?, ?)',
+                    (line[0], line[9], json.dumps(line), customer, description, int(degraded))
+                )
+                self.added += 1
+            self._pending_writes += 1
+            if self._pending_writes >= self.COMMIT_INTERVAL:
+                self._conn.commit()
+                self._pending_writes = 0
+
+    def complete_sync(self, synced_from: str, synced_until: str):
+        """
+        Commits all transactions and moves the cursor, an interrupted sync lists its range again
+        :param synced_from: Start of the synced range
+        :param synced_until: End of the synced range, the next sync continues from here
+        """
+        with self._lock:
+            ranges = self._conn.execute('SELECT synced_from, synced_until FROM synced_ranges').fetchall()
+            # Overlapping and adjacent ranges are merged, ranges with a gap in between stay separate
+            merged = []
+            for range_from, range_until in sorted(ranges + [(synced_from, synced_until)]):
+                if merged and range_from <= merged[-1][1]:
+                    merged[-1][1] = max(merged[-1][1], range_until)
+                else:
+                    merged.append([range_from, range_until])
+            self._conn.execute('DELETE FROM synced_ranges')
+            self._conn.executemany('INSERT INTO synced_ranges VALUES (?, ?)', merged)
+            self._conn.commit()
+            self._pending_writes = 0
+
+    def query(self, start: str, end: str):
+        """
+        Transactions created in a time range, newest first like the Stripe API listing
+        :param start: Start (inclusive) in the date format of the transaction lines
+        :param end: End (inclusive)
+        :return: Iterator of (line, customer, description) tuples
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT line, customer, description FROM transactions WHERE created BETWEEN ? AND ? '
+                'ORDER BY created DESC, rowid ASC',
+                (start, end)
+            )
+        for line, customer, description in rows:
+            yield json.loads(line), customer, description
+
+    def close(self):
+        """
+        Commits pending writes and closes the ledger file
+        """
+        if self._conn is None:
+            return
+        with self._lock:
+            self._conn.commit()
+            self._conn.close()
+            self._conn = None
+
+    def summary(self):
+        """
+        Human readable sync statistics
+        :return: str
+        """
+        return f"{self.added} new, {self.updated} resolved again ({self.path})"
+
+
+LEDGER = Ledger(LEDGER_FILE)
+
+
+def _setting_value(name: str, value):
+    """
+    Converts an environment variable or explicit setting to the type of the setting
+    :param name: Setting name
+    :param value: Raw value
+    :return: Typed value
+    """
+    if SETTINGS[name] is bool and isinstance(value, str):
+        return value.lower() == 'true'
+    return SETTINGS[name](value)
+
+
+def configure(environ=None, **settings):
+    """
+    Sets the module configuration: the defaults, then the environment variables, then the explicit settings.
+    The rate limiter, caches and ledger follow the new configuration, cached Stripe objects are kept
+    as long as the Stripe key, account and API base stay the same.
+    :param environ: Environment variables (e.g. os.environ), None applies the defaults only
+    :param settings: Explicit settings by name, e.g. STRIPE_METHOD='API'
+    """
+    unknown = sorted(set(settings) - set(SETTINGS))
+    if unknown:
+        raise ValueError(f"Unknown settings: {', '.join(unknown)}. Available: {', '.join(SETTINGS)}")
+    previous_account = (STRIPE_KEY, STRIPE_ACCOUNT, STRIPE_API_BASE)
+    values = dict(DEFAULT_SETTINGS)
+    for name in SETTINGS:
+        if environ is not None and environ.get(name) is not None:
+            values[name] = _setting_value(name, environ[name])
+    for name, value in settings.items():
+        values[name] = _setting_value(name, value)
+    values['STRIPE_METHOD'] = values['STRIPE_METHOD'].upper()
+    values['FEE_GROUPING'] = values['FEE_GROUPING'].lower()
+    globals().update(values)
+
+    RATE_LIMITER.set_rate(STRIPE_RATE_LIMIT)
+    OBJECT_CACHE.max_size = OBJECT_CACHE_SIZE
+    if (STRIPE_KEY, STRIPE_ACCOUNT, STRIPE_API_BASE) != previous_account:
+        OBJECT_CACHE.clear()
+    ENRICHMENT_CACHE.path = ENRICHMENT_CACHE_FILE
+    ENRICHMENT_CACHE.ttl_seconds = ENRICHMENT_CACHE_TTL_DAYS * 86400
+    ENRICHMENT_CACHE.max_entries = ENRICHMENT_CACHE_MAX_ENTRIES
+    LEDGER.path = LEDGER_FILE
+
+
+def current_settings():
+    """
+    Snapshot of the current configuration, e.g. for the account processes
+    :return: dict
+    """
+    return {name: globals()[name] for name in SETTINGS}
+
+
+def reset_statistics():
+    """
+    Clears the call statistics and the profiler before another run in the same process
+    """
+    CALL_STATS.reset()
+    PROFILER.reset()
+    OBJECT_CACHE.reset_statistics()
+    HTTP_POOL.reset_statistics()
+
+
+def releases_run_state(func):
+    """
+    Decorator of a run that closes the enrichment cache and the ledger, drops the prefetched objects and
+    stops profiling when the run ends, also after errors. Otherwise a failed run of a Converter or the
+    daemon leaves the cache open and the next run with no_cache=True still reads and writes it.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            OBJECT_CACHE.drop_prefetched()
+            ENRICHMENT_CACHE.close()
+            LEDGER.close()
+            PROFILER.reset()
+    return wrapper
+
+
+def profiled(func):
+    """
+    Decorator that records call count and latency of an enrichment helper for --profile
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not PROFILER.enabled:
+            return func(*args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            PROFILER.record_helper(func.__name__, time.perf_counter() - started)
+    return wrapper
+
+
+def csv_header():
+    """
+    This method only returns the csv header for our export
+    Uses LexOffice-compatible German column headers for automatic field mapping
+    :return: array
+    """
+    return [
+        'Buchungsdatum',  # Booking Date (accounting_date)
+        'Auftraggeber / Empfänger',  # Client/Payer / Recipient (customer)
+        'Verwendungszweck', # Purpose of Use/Description (description)
+        'Betrag',         # Amount (amount)
+        'Soll Betrag (Ausgabe)', # Debit Amount/Expense (negative amounts)
+        'Haben Betrag (Einnahme)', # Credit Amount/Income (positive amounts)
+        'Wertstellungsdatum', # Value Date (value_date)
+    ]
+
+
+def _metadata_product(metadata: dict):
+    """
+    Product name from the metadata of a charge or payment intent
+    :param metadata: Stripe metadata
+    :return: Product name or None
+    """
+    return metadata.get('product_name') or metadata.get('product') or metadata.get('item_name') or None
+
+
+def _type_description(transaction_type: str):
+    """
+    Generic description of a transaction type, used when the source has none
+    :param transaction_type: The transaction type (payment, charge, etc.)
+    :return: Description string
+    """
+    if transaction_type == 'payment':
+        return 'Online Payment'
+    elif transaction_type == 'charge':
+        return 'Card Payment'
+    elif transaction_type == 'refund':
+        return 'Refund'
+    elif transaction_type == 'payout':
+        return 'Payout to Bank'
+    else:
+        return transaction_type.replace('_', ' ').title()
+
+
+class SourceGraph:
+    """
+    The Stripe objects behind one source id. Every object is retrieved at most once per line, also when
+    several fields follow the same reference (e.g. charge -> payment intent) or the retrieval failed.
+    """
+
+    def __init__(self, source_id: str):
+        self.source_id = source_id
+        self.client = get_client()
+        # Failed retrievals handed to a field, a memoized failure still marks the field as degraded
+        self.failures = 0
+        self._objects = {}
+
+    def get(self, resource_name: str, object_id=None):
+        """
+        Retrieves an object of the graph through the object cache
+        :param resource_name: Stripe resource, e.g. 'Charge' or 'checkout.Session'
+        :param object_id: Object id or expanded object, defaults to the source id
+        :return: Stripe object
+        """
+        object_id = object_id or self.source_id
+        if _is_expanded_object(object_id):
+            return object_id
+        key = (resource_name, object_id)
+        if key not in self._objects:
+            try:
+                self._objects[key] = (False, retrieve_object(stripe_resource(self.client, resource_name), object_id))
+            except Exception as e:
+                self._objects[key] = (True, e)
+        is_error, value = self._objects[key]
+        if is_error:
+            if not isinstance(value, InvalidRequestError):
+                self.failures += 1
+            raise value
+        return value
+
+    def customer_name(self, customer_id):
+        """
+        Name (or email) of a customer of the graph
+        :param customer_id: Customer id or expanded customer
+        :return: str
+        """
+        customer = self.get('Customer', customer_id)
+        return customer.get('name') or customer.get('email', STRIPE_NAME)
+
+
+def stripe_resource(client, resource_name: str):
+    """
+    :param client: stripe
+    :param resource_name: Stripe resource, e.g. 'Charge' or 'checkout.Session'
+    :return: Resource class
+    """
+    return functools.reduce(getattr, resource_name.split('.'), client)
+
+
+class SourceResolver:
+    """
+    Resolves the enrichment fields of one kind of source id from its SourceGraph. Every source type
+    is one subclass, registered for its id prefixes with @source_resolver. Fields a source type does
+    not know keep the generic values of this class, which is also used for lines without source.
+    Errors are handled by SourceRecord, a resolver only raises them.
+    """
+
+    # Stripe resources of the source id, prefetched by the async engine
+    resources = []
+
+    def customer(self, graph: SourceGraph):
+        return STRIPE_NAME
+
+    def description(self, graph: SourceGraph, transaction_type: str):
+        return _type_description(transaction_type)
+
+    def payment_method(self, graph: SourceGraph):
+        return "Online Payment"
+
+    def product(self, graph: SourceGraph):
+        return ""
+
+    def refund_reason(self, graph: SourceGraph, transaction_type: str):
+        if transaction_type == 'payment_failure_refund':
+            return 'Rückerstattung aufgrund fehlgeschlagener Zahlung'
+        return 'Rückerstattung'
+
+
+# Source id prefix (e.g. 'ch_') -> SourceResolver
+SOURCE_RESOLVERS = {}
+
+
+def source_resolver(*prefixes: str):
+    """
+    Class decorator registering a SourceResolver for source id prefixes, e.g. @source_resolver('ch_').
+    New source types are added as one resolver class, without changing the enrichment.
+    """
+    def decorator(cls):
+        for prefix in prefixes:
+            SOURCE_RESOLVERS[prefix] = cls()
+        return cls
+    return decorator
+
+
+@source_resolver('ch_')
+class ChargeResolver(SourceResolver):
+    resources = ['Charge']
+
+    def customer(self, graph):
+        charge = graph.get('Charge')
+        # Try billing_details first
+        if charge.get('billing_details', {}).get('name'):
+            return charge['billing_details']['name']
+        # Try customer object if available
+        if charge.get('customer'):
+            try:
+                return graph.customer_name(charge['customer'])
+            except Exception:
+                pass
+        # Try payment intent if available
+        if charge.get('payment_intent'):
+            try:
+                pi = graph.get('PaymentIntent', charge['payment_intent'])
+                if pi.get('customer'):
+                    return graph.customer_name(pi['customer'])
+            except Exception:
+                pass
+        return STRIPE_NAME
+
+    def description(self, graph, transaction_type):
+        charge = graph.get('Charge')
+        description = charge.get('description', '') or charge.get('statement_descriptor', '') or ''
+        if description:
+            return description
+        # If charge has no description, try to get it from payment intent
+        if charge.get('payment_intent'):
+            pi = graph.get('PaymentIntent', charge['payment_intent'])
+            return pi.get('description', '') or pi.get('statement_descriptor', '') or ''
+        return ''
+
+    def payment_method(self, graph):
+        payment_method = graph.get('Charge').get('payment_method_details', {})
+        if payment_method.get('card'):
+            brand = payment_method['card'].get('brand', 'Karte').capitalize()
+            last4 = payment_method['card'].get('last4', 'XXXX')
+            return f"{brand} ****{last4}"
+        elif payment_method.get('sepa_debit'):
+            last4 = payment_method['sepa_debit'].get('last4', 'XXXX')
+            return f"SEPA Lastschrift ****{last4}"
+        else:
+            return payment_method.get('type', 'Unbekannt').replace('_', ' ').title()
+
+    def product(self, graph):
+        charge = graph.get('Charge')
+        # Try to get product from metadata first
+        product = _metadata_product(charge.get('metadata', {}))
+        if product:
+            return product
+        # Try to get from payment intent
+        if charge.get('payment_intent'):
+            try:
+                product = _metadata_product(graph.get('PaymentIntent', charge['payment_intent']).get('metadata', {}))
+                if product:
+                    return product
+            except Exception:
+                pass
+        # Try to get from invoice if available
+        if charge.get('invoice'):
+            try:
+                line_items = graph.get('Invoice', charge['invoice']).get('lines', {}).get('data', [])
+                if line_items:
+                    # Get the first line item's description or price description
+                    first_item = line_items[0]
+                    if first_item.get('description'):
+                        return first_item['description']
+                    price = first_item.get('price', {})
+                    if price.get('nickname'):
+                        return price['nickname']
+                    product_data = price.get('product', {})
+                    if isinstance(product_data, dict) and product_data.get('name'):
+                        return product_data['name']
+            except Exception:
+                pass
+        return ""
+
+
+@source_resolver('pi_')
+class PaymentIntentResolver(SourceResolver):
+    resources = ['PaymentIntent']
+
+    def customer(self, graph):
+        payment_intent = graph.get('PaymentIntent')
+        if payment_intent.get('customer'):
+            try:
+                return graph.customer_name(payment_intent['customer'])
+            except Exception:
+                pass
+        # Try to get the latest charge from this payment intent
+        if payment_intent.get('latest_charge'):
+            try:
+                charge = graph.get('Charge', payment_intent['latest_charge'])
+                if charge.get('billing_details', {}).get('name'):
+                    return charge['billing_details']['name']
+            except Exception:
+                pass
+        return STRIPE_NAME
+
+    def description(self, graph, transaction_type):
+        payment_intent = graph.get('PaymentIntent')
+        return payment_intent.get('description', '') or payment_intent.get('statement_descriptor', '') or ''
+
+
+@source_resolver('py_')
+class PaymentResolver(SourceResolver):
+    # Could be various payment-related objects, tried as payment method and then as setup intent
+    resources = ['PaymentMethod', 'SetupIntent']
+
+    def customer(self, graph):
+        try:
+            pm = graph.get('PaymentMethod')
+            if pm.get('customer'):
+                return graph.customer_name(pm['customer'])
+        except Exception:
+            pass
+        return STRIPE_NAME
+
+    def description(self, graph, transaction_type):
+        try:
+            return graph.get('PaymentMethod').get('description', '') or ''
+        except Exception:
+            try:
+                si = graph.get('SetupIntent')
+                return si.get('description', '') or si.get('statement_descriptor', '') or ''
+            except Exception:
+                return ''
+
+
+@source_resolver('cs_')
+class CheckoutSessionResolver(SourceResolver):
+    resources = ['checkout.Session']
+
+    def customer(self, graph):
+        session = graph.get('checkout.Session')
+        if session.get('customer'):
+            try:
+                return graph.customer_name(session['customer'])
+            except Exception:
+                pass
+        # Try to get customer details from the session itself
+        customer_details = session.get('customer_details', {})
+        if customer_details.get('name'):
+            return customer_details['name']
+        if customer_details.get('email'):
+            return customer_details['email']
+        return STRIPE_NAME
+
+    def description(self, graph, transaction_type):
+        session = graph.get('checkout.Session')
+        return session.get('description', '') or session.get('client_reference_id', '') or ''
+
+
+@source_resolver('in_')
+class InvoiceResolver(SourceResolver):
+    resources = ['Invoice']
+
+    def customer(self, graph):
+        invoice = graph.get(self.resources[0])
+        if invoice.get('customer'):
+            try:
+                return graph.customer_name(invoice['customer'])
+            except Exception:
+                pass
+        return STRIPE_NAME
+
+
+@source_resolver('sub_')
+class SubscriptionResolver(InvoiceResolver):
+    resources = ['Subscription']
+
+
+@source_resolver('re_')
+class RefundResolver(SourceResolver):
+    resources = ['Refund']
+    REASONS = {
+        'duplicate': 'Doppelte Zahlung',
+        'fraudulent': 'Verdacht auf Betrug',
+        'requested_by_customer': 'Kunde hat Rückerstattung angefordert',
+    }
+
+    def description(self, graph, transaction_type):
+        return graph.get('Refund').get('reason', '') or 'Refund'
+
+    def refund_reason(self, graph, transaction_type):
+        reason = graph.get('Refund').get('reason', '')
+        return self.REASONS.get(reason, reason) or 'Rückerstattung'
+
+
+class UnknownSourceResolver(SourceResolver):
+    """
+    Source ids without a registered prefix are tried as charge (legacy behavior)
+    """
+
+    resources = ['Charge']
+
+    def customer(self, graph):
+        try:
+            charge = graph.get('Charge')
+            if charge.get('billing_details', {}).get('name'):
+                return charge['billing_details']['name']
+            if charge.get('customer'):
+                return graph.customer_name(charge['customer'])
+        except Exception:
+            pass
+        return STRIPE_NAME
+
+
+class NoSourceResolver(SourceResolver):
+    """
+    Transactions without a source object (e.g. adjustments), nothing is retrieved
+    """
+
+    def payment_method(self, graph):
+        return "Unbekannt"
+
+
+NO_SOURCE_RESOLVER = NoSourceResolver()
+UNKNOWN_SOURCE_RESOLVER = UnknownSourceResolver()
+
+
+def resolver_for(source_id: str):
+    """
+    Looks up the resolver of a source id by its prefix
+    :param source_id: Stripe source id
+    :return: SourceResolver
+    """
+    if not source_id:
+        return NO_SOURCE_RESOLVER
+    return SOURCE_RESOLVERS.get(source_id[:source_id.find('_') + 1], UNKNOWN_SOURCE_RESOLVER)
+
+
+class SourceRecord:
+    """
+    The enrichment fields of one source id (customer, description, payment method, product and
+    refund reason), each resolved on first access. All fields share one SourceGraph, so every object
+    behind the source is retrieved at most once per line. Fields are served from and stored in the
+    persistent cache, unless a Stripe call failed while resolving them (degraded fallback values).
+    """
+
+    def __init__(self, source_id: str, transaction_type: str):
+        self.source_id = source_id
+        self.transaction_type = transaction_type
+        self.resolver = resolver_for(source_id)
+        self._graph = None
+        self._values = {}
+
+    def customer(self):
+        """
+        Customer name, the Stripe name if the source has none (e.g. chargebacks)
+        :return: str
+        """
+        return self._field('customer', self.resolver.customer, self._customer_fallback)
+
+    def description(self):
+        """
+        Description of the source object, empty if it has none
+        :return: str
+        """
+        return self._field(f'description:{self.transaction_type}',
+                           lambda graph: self.resolver.description(graph, self.transaction_type),
+                           self._description_fallback)
+
+    def payment_method(self):
+        """
+        :return: Payment method, e.g. "Visa ****4242"
+        """
+        return self._field('payment_method', self.resolver.payment_method, lambda error: "Unbekannt")
+
+    def product(self):
+        """
+        :return: Product name or empty string
+        """
+        return self._field('product', self.resolver.product, self._product_fallback)
+
+    def refund_reason(self):
+        """
+        :return: Refund reason in German
+        """
+        return self._field(f'refund_reason:{self.transaction_type}',
+                           lambda graph: self.resolver.refund_reason(graph, self.transaction_type),
+                           lambda error: 'Rückerstattung')
+
+    def _customer_fallback(self, error):
+        if not isinstance(error, InvalidRequestError):
+            print(f"Warning: Could not fetch customer for {self.source_id}: {str(error)}")
+        return STRIPE_NAME
+
+    def _description_fallback(self, error):
+        print(f"Warning: Could not fetch description for {self.source_id}: {str(error)}")
+        return _type_description(self.transaction_type)
+
+    def _product_fallback(self, error):
+        print(f"Warning: Could not fetch product info for {self.source_id}: {str(error)}")
+        return ""
+
+    def _field(self, key: str, resolve, fallback):
+        """
+        Resolves a field once
+        :param key: Cache key, the field name and the transaction type for type dependent fields
+        :param resolve: Resolver method, called with the SourceGraph
+        :param fallback: Called with the exception if resolving failed
+        :return: Field value
+        """
+        if key in self._values:
+            return self._values[key]
+        started = time.perf_counter() if PROFILER.enabled else None
+
+        cached = ENRICHMENT_CACHE.enabled and self.source_id
+        value = ENRICHMENT_CACHE.get(self.source_id, key) if cached else None
+        if value is None:
+            if self._graph is None:
+                self._graph = SourceGraph(self.source_id)
+            failures_before = self._graph.failures
+            try:
+                value = resolve(self._graph)
+            except Exception as e:
+                value = fallback(e)
+            if cached and self._graph.failures == failures_before and isinstance(value, str):
+                ENRICHMENT_CACHE.set(self.source_id, key, value)
+
+        self._values[key] = value
+        if started is not None:
+            PROFILER.record_helper(key.split(':')[0], time.perf_counter() - started)
+        return value
+
+
+class ColumnRecord:
+    """
+    The enrichment fields of an itemized report line, read from its columns without any API call (--offline)
+    """
+
+    def __init__(self, line):
+        self.line = line
+
+    def customer(self):
+        return self.line[12] or self.line[13] or STRIPE_NAME
+
+    def payment_method(self):
+        return getPaymentMethodFromColumns(self.line)
+
+    def product(self):
+        return self.line[17]
+
+    def refund_reason(self):
+        return 'Rückerstattung'
+
+
+def read_csv(parse_workers: int = 1):
+    """
+    This method streams all csv lines in import.csv & drops the header.
+    :param parse_workers: Number of processes parsing chunks of the file
+    :return: Iterator of CSV lines from import.csv
+    """
+    # Check if CSV file exists
+    if not os.path.exists(IMPORT_FILE):
+        raise FileNotFoundError(
+            f"The file '{IMPORT_FILE}' was not found!\n"
+            "Possible solutions:\n"
+            "1. Create an 'import.csv' file with your Stripe data\n"
+            "2. Or switch to API method: Set STRIPE_METHOD=API in the .env file"
+        )
+
+    if parse_workers > 1:
+        return _iter_csv_chunks(IMPORT_FILE, parse_workers)
+    return _iter_csv_lines(IMPORT_FILE)
+
+
+# Line layout used by the converter: position -> accepted column names of the Stripe exports,
+# normalized to lowercase letters and digits (e.g. "Created (UTC)" and "created_utc" -> createdutc)
+CSV_COLUMNS = [
+    ['id', 'balancetransactionid'],  # id (0)
+    ['type', 'reportingcategory'],  # type (1)
+    ['source', 'sourceid'],  # source (2)
+    ['amount', 'gross'],  # amount (3)
+    ['fee'],  # fee (4)
+    ['currency'],  # currency (5)
+    ['net'],  # net (6)
+    ['reportingcategory'],  # reporting_category (7)
+    ['customerfacingamount'],  # customer_facing_amount (8)
+    ['createdutc', 'created'],  # created (9)
+    ['availableonutc', 'availableon'],  # available_on (10)
+    ['description'],  # description (11)
+    ['customername'],  # customer_name (12) - itemized reports only
+    ['customeremail'],  # customer_email (13)
+    ['paymentmethodtype'],  # payment_method_type (14)
+    ['cardbrand'],  # card_brand (15)
+    ['cardlast4'],  # card_last4 (16)
+    ['paymentmetadataproductname', 'productnamemetadata',
+     'paymentmetadataproduct', 'productmetadata',
+     'paymentmetadataitemname', 'itemnamemetadata'],  # product_name (17)
+    ['automaticpayoutid'],  # automatic_payout_id (18)
+]
+# Columns that must be found by name, otherwise the fixed positions of the dashboard export are used
+CSV_REQUIRED_COLUMNS = [0, 1, 3, 9]
+# Itemized reports only have the reporting category, which names some types differently
+REPORTING_CATEGORY_TYPES = {
+    'fee': 'stripe_fee',
+    'platform_earning': 'application_fee',
+}
+
+
+def _normalize_column(name: str):
+    return re.sub(r'[^a-z0-9]', '', name.lower())
+
+
+def compile_row_mapper(header: list):
+    """
+    Maps the columns of an export to the line layout of the converter by their names.
+    The accessor is compiled once per file, missing columns become empty strings.
+    Headers without the required columns fall back to the fixed positions of the dashboard export.
+    Amount and fee are converted to integer cents in the number format of the file: itemized reports
+    (column "gross") use a decimal point, the dashboard export the German format.
+    :param header: Header line of the CSV file
+    :return: Function converting a CSV row into a converter line
+    """
+    names = [_normalize_column(name) for name in header]
+    indices = []
+    for aliases in CSV_COLUMNS:
+        indices.append(next((names.index(alias) for alias in aliases if alias in names), None))
+
+    if any(indices[position] is None for position in CSV_REQUIRED_COLUMNS):
+        # Unknown header, the first 12 columns are read by position (original behavior)
+        indices = list(range(12)) + [None] * (len(CSV_COLUMNS) - 12)
+
+    # Missing columns read the empty string appended to every row
+    getter = operator.itemgetter(*(len(header) if index is None else index for index in indices))
+    translate_type = indices[1] == indices[7] and indices[1] is not None
+    decimal_comma = indices[3] is None or indices[3] >= len(names) or names[indices[3]] != 'gross'
+
+    def map_row(row):
+        row.extend([''] * (len(header) + 1 - len(row)))
+        line = list(getter(row))
+        if translate_type:
+            line[1] = REPORTING_CATEGORY_TYPES.get(line[1], line[1])
+        line[3] = to_cents(line[3], decimal_comma)
+        line[4] = to_cents(line[4], decimal_comma)
+        return line
+    return map_row
+
+
+def _iter_csv_lines(path: str):
+    """
+    Yields the lines of a CSV file one by one, without the header, in the line layout of the converter
+    with amount and fee in cents
+    :param path: CSV file path
+    :return: Iterator of CSV lines
+    """
+    with open(path, newline='', encoding='utf-8') as csvfile:
+        yield from _iter_csv_rows(csvfile)
+
+
+def _iter_csv_rows(csvfile):
+    """
+    Yields the lines of an open CSV stream (file or download) in the line layout of the converter
+    :param csvfile: Text stream opened with newline=''
+    :return: Iterator of CSV lines
+    """
+    reader = csv.reader(csvfile)
+
+    header = next(reader, None)
+    if header is None:
+        return
+    yield from map(compile_row_mapper(header), reader)
+
+
+def _record_end(data, start: int, position: int, quotes: int):
+    """
+    Finds the end of the CSV record at a position. A newline only ends a record if an even number
+    of quote characters precedes it, quoted fields may contain newlines and escaped quotes come in pairs.
+    :param data: Memory-mapped file
+    :param start: Offset from which quotes were counted
+    :param position: Offset to search from
+    :param quotes: Quote characters between start and position
+    :return: Tuple (offset after the newline, quotes between start and that offset)
+    """
+    while True:
+        newline = data.find(b'\n', position)
+        if newline == -1:
+            return len(data), quotes + data[position:].count(b'"')
+        quotes += data[position:newline].count(b'"')
+        if quotes % 2 == 0:
+            return newline + 1, quotes
+        position = newline + 1
+
+
+def csv_chunks(path: str, chunk_bytes: int = CSV_CHUNK_BYTES):
+    """
+    Splits a CSV file into byte ranges of about chunk_bytes that end on record boundaries
+    :param path: CSV file path
+    :param chunk_bytes: Target chunk size
+    :return: Tuple (header, list of (start, end) offsets)
+    """
+    if os.path.getsize(path) == 0:
+        return None, []
+    with open(path, 'rb') as csvfile, mmap.mmap(csvfile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        header_end, _ = _record_end(data, 0, 0, 0)
+        header = next(csv.reader(io.StringIO(data[:header_end].decode('utf-8'), newline='')), None)
+        chunks = []
+        start = header_end
+        while start < len(data):
+            candidate = min(len(data), start + chunk_bytes)
+            end, _ = _record_end(data, start, candidate, data[start:candidate].count(b'"'))
+            chunks.append((start, end))
+            start = end
+        return header, chunks
+
+
+class TransactionBatch:
+    """
+    Column-backed batch of transaction lines, e.g. one parsed chunk of import.csv.
+    Every column is one tuple in which repeated values (types, currencies, dates, customers, ...)
+    are stored once, amount and fee are arrays of integer cents. A batch needs a fraction of the
+    memory of a list per line, also while it is sent from a parser process and queued.
+    """
+
+    __slots__ = ('columns',)
+    # Positions of amount and fee in cents
+    CENTS_COLUMNS = (3, 4)
+
+    def __init__(self, lines: list):
+        values = {}
+        self.columns = [
+            array('q', column) if position in self.CENTS_COLUMNS else tuple(values.setdefault(value, value) for value in column)
+            for position, column in enumerate(zip(*lines))
+        ]
+
+    def __len__(self):
+        return len(self.columns[0]) if self.columns else 0
+
+    def __iter__(self):
+        """
+        :return: Iterator of the lines, each one a new list in the line layout of the converter
+        """
+        return map(list, zip(*self.columns))
+
+
+def parse_csv_chunk(path: str, header: list, start: int, end: int):
+    """
+    Parses and transforms one chunk of a CSV file (runs in a worker process)
+    :param path: CSV file path
+    :param header: Header line of the file
+    :param start: Chunk start offset
+    :param end: Chunk end offset
+    :return: TransactionBatch of the CSV lines with amount and fee in cents
+    """
+    with open(path, 'rb') as csvfile, mmap.mmap(csvfile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        text = data[start:end].decode('utf-8')
+    map_row = compile_row_mapper(header)
+    return TransactionBatch([map_row(row) for row in csv.reader(io.StringIO(text, newline=''))])
+
+
+def _iter_csv_chunks(path: str, workers: int):
+    """
+    Parses a large CSV file in chunks with a process pool and yields the lines in file order.
+    At most two chunks per worker are parsed ahead of the consumer.
+    :param path: CSV file path
+    :param workers: Number of processes
+    :return: Iterator of CSV lines
+    """
+    header, chunks = csv_chunks(path)
+    window = workers * 2
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for start, end in chunks:
+            pending.append(executor.submit(parse_csv_chunk, path, header, start, end))
+            if len(pending) >= window:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+
+def list_all(resource, **params):
+    """
+    Pages through a Stripe list endpoint, every page request goes through the rate limiter
+    :param resource: Stripe resource class (e.g. client.Charge)
+    :param params: List parameters
+    :return: Iterator of Stripe objects
+    """
+    params = dict(params, limit=100)
+    while True:
+        page = call_stripe(resource.list, **params)
+        yield from page.data
+        if not page.has_more or not page.data:
+            return
+        params['starting_after'] = page.data[-1].id
+
+
+def shard_windows(start_timestamp: int, end_timestamp: int, shard_by: str, count: int):
+    """
+    Splits a time range into disjoint sub-windows, newest first like the Stripe listing
+    :param start_timestamp: Range start (unix timestamp, inclusive)
+    :param end_timestamp: Range end (unix timestamp, inclusive)
+    :param shard_by: day, week or auto (count windows of equal length)
+    :param count: Number of windows in auto mode
+    :return: List of (gte, lte) tuples
+    """
+    if shard_by == 'day':
+        step = 86400
+    elif shard_by == 'week':
+        step = 7 * 86400
+    else:
+        step = max(1, -(-(end_timestamp - start_timestamp + 1) // count))
+
+    windows = []
+    upper = end_timestamp
+    while upper >= start_timestamp:
+        lower = max(start_timestamp, upper - step + 1)
+        windows.append((lower, upper))
+        upper = lower - 1
+    return windows
+
+
+class _Shard:
+    """
+    One sub-window of a sharded listing and the pages listed for it so far
+    """
+
+    def __init__(self, gte: int, lte: int, starting_after: str = None):
+        self.gte = gte
+        self.lte = lte
+        self.starting_after = starting_after
+        self.pages = deque()
+        self.done = False
+        # Shard covering the window right before this one (older transactions)
+        self.next = None
+
+
+class ShardedListing:
+    """
+    Lists a Stripe resource over disjoint time windows with several threads.
+    Pages are yielded window by window, newest window first, which is exactly the order of a
+    single listing and has no duplicates at the window edges. Threads always take the newest
+    pending window, at most SHARD_BUFFER_PAGES pages are listed ahead of the consumer.
+    In adaptive mode a window whose first page indicates more than SHARD_TARGET_ROWS objects
+    hands its older part to a new window, so idle threads take over busy ranges.
+    """
+
+    def __init__(self, resource, params: dict, windows: list, threads: int, adaptive: bool = False,
+                 starting_after: str = None):
+        self.resource = resource
+        self.params = params
+        self.threads = threads
+        self.adaptive = adaptive
+        self._shards = [_Shard(gte, lte) for gte, lte in windows]
+        for shard, older in zip(self._shards, self._shards[1:]):
+            shard.next = older
+        if starting_after and self._shards:
+            self._shards[0].starting_after = starting_after
+        self._pending = [(-shard.lte, shard.gte, shard) for shard in self._shards]
+        heapq.heapify(self._pending)
+        self._running = 0
+        self._buffered = 0
+        self._current = None
+        self._stopped = False
+        self._error = None
+        self._cond = threading.Condition()
+
+    def __iter__(self):
+        if not self._shards:
+            return
+        workers = [threading.Thread(target=self._work, daemon=True) for _ in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        try:
+            shard = self._shards[0]
+            while shard is not None:
+                with self._cond:
+                    self._current = shard
+                    self._cond.notify_all()
+                while True:
+                    with self._cond:
+                        while not shard.pages and not shard.done and self._error is None:
+                            self._cond.wait()
+                        if self._error is not None:
+                            raise self._error
+                        if not shard.pages:
+                            break
+                        page = shard.pages.popleft()
+                        self._buffered -= 1
+                        self._cond.notify_all()
+                    yield from page
+                shard = shard.next
+        finally:
+            with self._cond:
+                self._stopped = True
+                self._cond.notify_all()
+            for worker in workers:
+                worker.join()
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._pending and self._running and not self._stopped:
+                    self._cond.wait()
+                if self._stopped or not self._pending:
+                    return
+                shard = heapq.heappop(self._pending)[2]
+                self._running += 1
+            try:
+                self._list(shard)
+            except BaseException as e:
+                with self._cond:
+                    if self._error is None:
+                        self._error = e
+                    self._stopped = True
+            finally:
+                with self._cond:
+                    shard.done = True
+                    self._running -= 1
+                    self._cond.notify_all()
+
+    def _list(self, shard: _Shard):
+        params = dict(self.params, limit=100, created={'gte': shard.gte, 'lte': shard.lte})
+        if shard.starting_after:
+            params['starting_after'] = shard.starting_after
+        first_page = True
+        while True:
+            page = call_stripe(self.resource.list, **params)
+            has_more = page.has_more and page.data
+            if first_page and has_more and self.adaptive:
+                self._split(shard, page.data, params)
+            first_page = False
+            if not self._put(shard, page.data) or not has_more:
+                return
+            params['starting_after'] = page.data[-1].id
+
+    def _split(self, shard: _Shard, data, params: dict):
+        """
+        Hands the older part of a window to a new shard if the first page indicates a high volume.
+        The shard keeps at least everything its first page covers, so its cursor stays valid.
+        """
+        oldest = data[-1].created
+        seconds_per_page = max(1, data[0].created - oldest + 1)
+        estimated_rows = (oldest - shard.gte) / seconds_per_page * len(data)
+        if estimated_rows <= SHARD_TARGET_ROWS:
+            return
+        split = oldest - int(SHARD_TARGET_ROWS / len(data) * seconds_per_page)
+        if split <= shard.gte:
+            return
+        older = _Shard(shard.gte, split - 1)
+        with self._cond:
+            older.next = shard.next
+            shard.next = older
+            shard.gte = split
+            params['created'] = {'gte': split, 'lte': shard.lte}
+            heapq.heappush(self._pending, (-older.lte, older.gte, older))
+            self._cond.notify_all()
+
+    def _put(self, shard: _Shard, data):
+        """
+        Buffers a page, waits while the buffer is full unless the consumer is reading this shard
+        :return: False if the listing was stopped
+        """
+        with self._cond:
+            while self._buffered >= SHARD_BUFFER_PAGES and shard is not self._current and not self._stopped:
+                self._cond.wait()
+            if self._stopped:
+                return False
+            shard.pages.append(data)
+            self._buffered += 1
+            self._cond.notify_all()
+            return True
+
+
+def prefetch_window(start_timestamp: int, end_timestamp: int):
+    """
+    Lists all charges, payment intents, refunds and customers created in the export window
+    and indexes them by id, so enrichment becomes a dict lookup for most objects.
+    Objects created outside the window are still retrieved one by one.
+    :param start_timestamp: Window start (unix timestamp)
+    :param end_timestamp: Window end (unix timestamp)
+    """
+    client = get_client()
+    created = {
+        'gte': start_timestamp - PREFETCH_WINDOW_MARGIN,
+        'lte': end_timestamp + PREFETCH_WINDOW_MARGIN
+    }
+
+    print("Prefetching Stripe objects of the export window...")
+    for name in PREFETCH_RESOURCES:
+        count = 0
+        for obj in list_all(getattr(client, name), created=created):
+            OBJECT_CACHE.index(obj)
+            count += 1
+        print(f"  {name}: {count}")
+
+
+def csv_time_range():
+    """
+    Determines the time range covered by import.csv from the created column (9)
+    :return: Tuple (start timestamp, end timestamp) or None for an empty file
+    """
+    first = None
+    last = None
+    for line in read_csv():
+        created = line[9]
+        if first is None or created < first:
+            first = created
+        if last is None or created > last:
+            last = created
+    if first is None:
+        return None
+
+    def to_timestamp(value):
+        # Stripe exports the created column in UTC, depending on the export with or without seconds
+        try:
+            created = datetime.strptime(value[:19], '%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            created = datetime.strptime(value[:16], '%Y-%m-%d %H:%M')
+        return int(created.replace(tzinfo=timezone.utc).timestamp())
+    return to_timestamp(first), to_timestamp(last)
+
+
+def fetch_balance_transactions(start_date, end_date, expand=False, starting_after=None, shards=1, shard_by='auto'):
+    """
+    Fetches balance transactions directly from the Stripe API
+    :param start_date: Start date (datetime)
+    :param end_date: End date (datetime)
+    :param expand: Expand the source objects in the listing and seed the object cache with them
+    :param starting_after: Continue the listing after this balance transaction id (resume)
+    :param shards: Number of threads listing sub-windows of the range concurrently
+    :param shard_by: Sub-window size: day, week or auto (adaptive by volume)
+    :return: Iterator of CSV-like transaction lines, fetched page by page
+    """
+    client = get_client()
+    transaction_count = 0
+    
+    # Convert dates to Unix timestamps
+    start_timestamp = int(start_date.timestamp())
+    end_timestamp = int(end_date.timestamp())
+    
+    print(f"Fetching balance transactions from {start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}...")
+    
+    list_params = {
+        'created': {
+            'gte': start_timestamp,
+            'lte': end_timestamp
+        }
+    }
+    if expand:
+        list_params['expand'] = BALANCE_TRANSACTION_EXPAND
+
+    if shards > 1:
+        if starting_after:
+            # Only the range up to the last exported transaction is left
+            end_timestamp = call_stripe(client.BalanceTransaction.retrieve, starting_after).created
+        windows = shard_windows(start_timestamp, end_timestamp, shard_by, shards)
+        del list_params['created']
+        transactions = ShardedListing(client.BalanceTransaction, list_params, windows, shards,
+                                      adaptive=shard_by == 'auto', starting_after=starting_after)
+    else:
+        if starting_after:
+            list_params['starting_after'] = starting_after
+        transactions = list_all(client.BalanceTransaction, **list_params)
+
+    # Fetch all balance transactions in the timeframe, 100 per page
+    for transaction in transactions:
+        source = transaction.source
+        if _is_expanded_object(source):
+            # Expanded sources feed the enrichment helpers without further retrieves
+            OBJECT_CACHE.seed(source)
+            source = source['id']
+
+        # Convert balance transaction to CSV format
+        # Adapt Stripe Balance Transaction format
+        csv_row = [
+            transaction.id,  # id (0)
+            transaction.type,  # type (1)
+            source,  # source (2)
+            transaction.amount,  # amount (3) - integer cents
+            transaction.fee,  # fee (4) - integer cents
+            '',  # currency (5) - not used
+            '',  # net (6) - not used  
+            '',  # reporting_category (7) - not used
+            '',  # customer_facing_amount (8) - not used
+            datetime.fromtimestamp(transaction.created).strftime('%Y-%m-%d %H:%M:%S'),  # created/accounting_date (9)
+            datetime.fromtimestamp(transaction.available_on).strftime('%Y-%m-%d %H:%M:%S'),  # available_on/value_date (10)
+            transaction.description or ''  # description (11)
+        ]
+        transaction_count += 1
+        yield csv_row
+    
+    print(f"Found {transaction_count} transactions.")
+
+
+def run_report(start_date, end_date):
+    """
+    Creates an itemized balance change report run for the time range and waits until Stripe has generated it
+    :param start_date: Start date (datetime)
+    :param end_date: End date (datetime)
+    :return: File object with the report CSV
+    """
+    client = get_client()
+    start_timestamp = int(start_date.timestamp())
+    # The interval end is exclusive, the API method also includes transactions created at the end date
+    end_timestamp = int(end_date.timestamp()) + 1
+
+    report_type = call_stripe(client.reporting.ReportType.retrieve, STRIPE_REPORT_TYPE)
+    if end_timestamp > report_type.data_available_end:
+        print(f"Warning: Stripe report data is only available until "
+              f"{datetime.fromtimestamp(report_type.data_available_end).strftime('%Y-%m-%d %H:%M:%S')}, "
+              "later transactions are missing. Use STRIPE_METHOD=API for the most recent days.")
+        end_timestamp = report_type.data_available_end
+    start_timestamp = max(start_timestamp, report_type.data_available_start)
+
+    print(f"Creating report {STRIPE_REPORT_TYPE} from {start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}...")
+    report_run = call_stripe(client.reporting.ReportRun.create, report_type=STRIPE_REPORT_TYPE, parameters={
+        'interval_start': start_timestamp,
+        'interval_end': end_timestamp,
+        'columns': REPORT_COLUMNS,
+    })
+    delay = REPORT_POLL_MIN_DELAY
+    while report_run.status == 'pending':
+        time.sleep(delay)
+        delay = min(delay * 2, REPORT_POLL_MAX_DELAY)
+        report_run = call_stripe(client.reporting.ReportRun.retrieve, report_run.id)
+
+    if report_run.status != 'succeeded':
+        raise ValueError(
+            f"Report run {report_run.id} failed: {report_run.error}\n"
+            "Possible solutions:\n"
+            "1. Check that the API key may read reports (restricted keys need the Report Runs permission)\n"
+            "2. Or export with STRIPE_METHOD=API"
+        )
+    print("Report ready, downloading...")
+    return report_run.result
+
+
+class _ChunkReader(io.RawIOBase):
+    """
+    Readable stream over an iterator of byte chunks, e.g. the body of an httpx streaming response
+    """
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = b''
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self._buffer:
+            self._buffer = next(self._chunks, None)
+            if self._buffer is None:
+                self._buffer = b''
+                return 0
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+def open_report_stream(url: str, stripe_account: str = None):
+    """
+    Starts the download of a report file on the shared HTTP client, with its timeout per read.
+    Error responses are raised as Stripe errors, so call_stripe() retries 429 and 5xx.
+    :param url: URL of the report file
+    :param stripe_account: Connected account of the report
+    :return: Binary stream of the file
+    """
+    headers = {
+        'Authorization': f'Bearer {STRIPE_KEY}',
+        # The raw body of the requests client is not decompressed
+        'Accept-Encoding': 'identity',
+    }
+    if stripe_account:
+        headers['Stripe-Account'] = stripe_account
+    content, status, response_headers = HTTP_POOL.client().request_stream('get', url, headers)
+    if not hasattr(content, 'read'):
+        content = io.BufferedReader(_ChunkReader(content))
+    if status != 200:
+        body = content.read().decode('utf-8', errors='replace')
+        content.close()
+        error = RateLimitError if status == 429 else stripe.APIError
+        raise error(f"Report download failed with HTTP {status}: {body[:200]}", body, status, None, dict(response_headers))
+    return content
+
+
+def download_report(report_file):
+    """
+    Streams the CSV of a report run into the same processing as import.csv, without a temporary file.
+    Opening the download is retried by call_stripe(), an interrupted transfer fails the run
+    (continue it with --resume).
+    :param report_file: File object of the report run result
+    :return: Iterator of transaction lines
+    """
+    response = call_stripe(open_report_stream, report_file.url)
+    with response, io.TextIOWrapper(response, encoding='utf-8', newline='') as csvfile:
+        yield from _iter_csv_rows(csvfile)
+
+
+def to_cents(am: str, decimal_comma: bool = True):
+    """
+    Parses an amount string of the Stripe exports into exact integer cents
+    :param am: Amount string
+    :param decimal_comma: German format of the dashboard export (e.g. "-1.234,56"),
+        otherwise the decimal point of itemized reports (e.g. "-1234.56")
+    :return: int
+    """
+    text = am.replace('.', '').replace(',', '.') if decimal_comma else am
+    negative = text.startswith('-')
+    euros, _, cents = text.lstrip('-').partition('.')
+    value = int(euros or '0') * 100 + int((cents + '00')[:2])
+    return -value if negative else value
+
+
+def format_cents(cents: int):
+    """
+    Formats integer cents as decimal amount for the export (e.g. 105.5, -12.34, 100.0)
+    :param cents: Amount in cents
+    :return: str
+    """
+    euros, rest = divmod(abs(cents), 100)
+    text = f"{euros}.{rest:02d}".rstrip('0')
+    if text.endswith('.'):
+        text += '0'
+    return f"-{text}" if cents < 0 else text
+
+
+def format_cents_german(cents: int):
+    """
+    Formats integer cents with German decimal separator for descriptions (e.g. "105,91")
+    :param cents: Amount in cents
+    :return: str
+    """
+    euros, rest = divmod(abs(cents), 100)
+    return f"{'-' if cents < 0 else ''}{euros},{rest:02d}"
+
+
+@functools.lru_cache(maxsize=4096)
+def format_german_date(day: str):
+    """
+    Converts a date from "YYYY-MM-DD" to "DD.MM.YYYY", every day is parsed only once
+    :param day: Date string
+    :return: str
+    """
+    return datetime.strptime(day, '%Y-%m-%d').strftime('%d.%m.%Y')
+
+
+def parse_date(date_string):
+    """
+    Parses date string to datetime object
+    :param date_string: Date in format YYYY-MM-DD
+    :return: datetime object
+    """
+    try:
+        return datetime.strptime(date_string, '%Y-%m-%d')
+    except ValueError:
+        raise ValueError(f"Invalid date format: {date_string}. Use YYYY-MM-DD (e.g. 2024-01-01)")
+
+
+def get_transactions_data(start_date=None, end_date=None, expand=False, checkpoint=None, shards=1, shard_by='auto', parse_workers=1):
     """
-    stripe.api_key = STRIPE_KEY
-    return stripe
+    Gets transaction data either from CSV or API based on STRIPE_METHOD
+    :param start_date: Start date for API retrieval
+    :param end_date: End date for API retrieval
+    :param expand: Expand source objects during API retrieval
+    :param checkpoint: Checkpoint of an interrupted export, already processed lines are skipped
+    :param shards: Number of threads listing the API range concurrently
+    :param shard_by: Sub-window size of the sharded API listing
+    :param parse_workers: Number of processes parsing import.csv
+    :return: Transaction data in CSV format
+    """
+    if STRIPE_METHOD == 'CSV':
+        print("Using CSV method...")
+        lines = read_csv(parse_workers)
+        if checkpoint:
+            lines = itertools.islice(lines, checkpoint['rows_processed'], None)
+        return lines
+    elif STRIPE_METHOD == 'API':
+        if not start_date or not end_date:
+            raise ValueError("Start and end date are required for API method!")
+        print("Using API method...")
+        starting_after = checkpoint['last_transaction_id'] if checkpoint else None
+        return fetch_balance_transactions(start_date, end_date, expand, starting_after, shards, shard_by)
+    elif STRIPE_METHOD == 'REPORT':
+        if not start_date or not end_date:
+            raise ValueError("Start and end date are required for REPORT method!")
+        print("Using REPORT method...")
+        lines = download_report(run_report(start_date, end_date))
+        if checkpoint:
+            # The report of the same time range has the same lines, a new run is created on resume
+            lines = itertools.islice(lines, checkpoint['rows_processed'], None)
+        return lines
+    else:
+        raise ValueError(f"Invalid STRIPE_METHOD: {STRIPE_METHOD}. Use 'CSV', 'API', 'REPORT' or 'LEDGER'")
 
 
-def csv_header():
+def read_ledger(start_date, end_date, checkpoint=None):
     """
-    This method only returns the csv header for our export
-    Uses LexOffice-compatible German column headers for automatic field mapping
-    :return: array
+    Reads the transactions of the export time range from the local ledger (STRIPE_METHOD=LEDGER)
+    :param start_date: Start date (datetime)
+    :param end_date: End date (datetime)
+    :param checkpoint: Checkpoint of an interrupted export, already processed lines are skipped
+    :return: Iterator of (line, customer, description) tuples
     """
-    return [
-        'Buchungsdatum',  # Booking Date (accounting_date)
-        'Auftraggeber / Empfänger',  # Client/Payer / Recipient (customer)
-        'Verwendungszweck', # Purpose of Use/Description (description)
-        'Betrag',         # Amount (amount)
-        'Soll Betrag (Ausgabe)', # Debit Amount/Expense (negative amounts)
-        'Haben Betrag (Einnahme)', # Credit Amount/Income (positive amounts)
-        'Wertstellungsdatum', # Value Date (value_date)
-    ]
+    print("Using LEDGER method...")
+    LEDGER.open()
+    synced = LEDGER.synced_range()
+    if synced is None:
+        LEDGER.close()
+        raise ValueError(
+            f"The ledger '{LEDGER.path}' has not been synced yet!\n"
+            "Possible solutions:\n"
+            "1. Run: python main.py sync --start-date 2024-01-01\n"
+            "2. Or export directly with STRIPE_METHOD=API"
+        )
+    start = start_date.strftime('%Y-%m-%d %H:%M:%S')
+    end = end_date.strftime('%Y-%m-%d %H:%M:%S')
+    gaps = LEDGER.gaps(start, end)
+    if gaps:
+        LEDGER.close()
+        gap_from, gap_until = gaps[0]
+        sync_end = (datetime.strptime(gap_until, '%Y-%m-%d %H:%M:%S') + timedelta(days=1)).strftime('%Y-%m-%d')
+        raise ValueError(
+            f"The ledger '{LEDGER.path}' does not cover the whole time range, the export would miss transactions of "
+            f"{', '.join(f'{gap[0]} to {gap[1]}' for gap in gaps)}!\n"
+            "Possible solutions:\n"
+            f"1. Sync the missing range: python main.py sync --start-date {gap_from[:10]} --end-date {sync_end}\n"
+            "2. Or export directly with STRIPE_METHOD=API"
+        )
+
+    transactions = LEDGER.query(start, end)
+    if checkpoint:
+        transactions = itertools.islice(transactions, checkpoint['rows_processed'], None)
+    return transactions
 
 
-def getCustomerByPayment(payment_id: str):
+@profiled
+def createDefaultDescription(record, transaction_type: str, amount: int, customer_name: str, accounting_date: str, original_description: str = ""):
     """
-    This method tries to fetch the Customer name from various Stripe objects
-    if it does not succeed, it returns the stripe name (happens e.g. when there is a chargeback from a customer)
-    :param payment_id: => source id in import.csv
-    :return:
+    Creates a default description when none is available
+    :param record: SourceRecord of the source, or ColumnRecord in offline mode
+    :param transaction_type: Transaction type
+    :param amount: Transaction amount in cents
+    :param customer_name: Customer name
+    :param accounting_date: Transaction date
+    :param original_description: Original description from Stripe
+    :return: Formatted description string
     """
     try:
-        # Handle None or empty payment_id
-        if not payment_id:
-            return STRIPE_NAME
-            
-        client = get_client()
+        # Parse and format date from "YYYY-MM-DD HH:MM:SS" to "DD.MM.YYYY"
+        formatted_date = format_german_date(accounting_date.split(' ')[0])
         
-        # Handle different types of Stripe objects
-        if payment_id.startswith('ch_'):
-            # It's a charge
-            charge = client.Charge.retrieve(payment_id)
-            # Try billing_details first
-            if charge.get('billing_details', {}).get('name'):
-                return charge['billing_details']['name']
-            # Try customer object if available
-            if charge.get('customer'):
-                try:
-                    customer = client.Customer.retrieve(charge['customer'])
-                    return customer.get('name') or customer.get('email', STRIPE_NAME)
-                except:
-                    pass
-            # Try payment intent if available
-            if charge.get('payment_intent'):
-                try:
-                    pi = client.PaymentIntent.retrieve(charge['payment_intent'])
-                    if pi.get('customer'):
-                        customer = client.Customer.retrieve(pi['customer'])
-                        return customer.get('name') or customer.get('email', STRIPE_NAME)
-                except:
-                    pass
-            return STRIPE_NAME
-            
-        elif payment_id.startswith('pi_'):
-            # It's a payment intent
-            payment_intent = client.PaymentIntent.retrieve(payment_id)
-            # Try to get customer from the payment intent
-            if payment_intent.get('customer'):
-                try:
-                    customer = client.Customer.retrieve(payment_intent['customer'])
-                    return customer.get('name') or customer.get('email', STRIPE_NAME)
-                except:
-                    pass
-            # Try to get the latest charge from this payment intent
-            if payment_intent.get('latest_charge'):
-                try:
-                    charge = client.Charge.retrieve(payment_intent['latest_charge'])
-                    if charge.get('billing_details', {}).get('name'):
-                        return charge['billing_details']['name']
-                except:
-                    pass
-            return STRIPE_NAME
-            
-        elif payment_id.startswith('py_'):
-            # Could be various payment-related objects, try different approaches
-            try:
-                # Try as PaymentMethod first
-                pm = client.PaymentMethod.retrieve(payment_id)
-                if pm.get('customer'):
-                    customer = client.Customer.retrieve(pm['customer'])
-                    return customer.get('name') or customer.get('email', STRIPE_NAME)
-                return STRIPE_NAME
-            except:
-                # If PaymentMethod doesn't work, try other approaches
-                return STRIPE_NAME
-                
-        elif payment_id.startswith('cs_'):
-            # It's a checkout session
-            session = client.checkout.Session.retrieve(payment_id)
-            if session.get('customer'):
-                try:
-                    customer = client.Customer.retrieve(session['customer'])
-                    return customer.get('name') or customer.get('email', STRIPE_NAME)
-                except:
-                    pass
-            # Try to get customer details from the session itself
-            customer_details = session.get('customer_details', {})
-            if customer_details.get('name'):
-                return customer_details['name']
-            if customer_details.get('email'):
-                return customer_details['email']
-            return STRIPE_NAME
-            
-        elif payment_id.startswith('in_'):
-            # It's an invoice
-            invoice = client.Invoice.retrieve(payment_id)
-            if invoice.get('customer'):
-                try:
-                    customer = client.Customer.retrieve(invoice['customer'])
-                    return customer.get('name') or customer.get('email', STRIPE_NAME)
-                except:
-                    pass
-            return STRIPE_NAME
+        # Format amount with German decimal separator (make amount positive for display)
+        amount_str = format_cents_german(abs(amount))
+        
+        # Handle different transaction types
+        if transaction_type == 'refund':
+            refund_reason = record.refund_reason()
+            description = f"Rückerstattung vom {formatted_date} über {amount_str}€, Kunde: {customer_name}, Grund: {refund_reason}"
+        elif transaction_type == 'payment_failure_refund':
+            description = f"Rückerstattung vom {formatted_date} über {amount_str}€, Kunde: {customer_name}, Grund: Fehlgeschlagene Zahlung"
+        elif transaction_type == 'payout':
+            description = f"Geldtransit vom {formatted_date} über {amount_str}€ - Auszahlung von gesammelten Transaktionen"
+        elif transaction_type in ['stripe_fee', 'application_fee']:
+            # Create description based on what the fee is for
+            fee_reason = ""
+            if "tax" in original_description.lower() or "automatic" in original_description.lower():
+                fee_reason = " - Automated Tax Berechnung"
+            elif "connect" in original_description.lower():
+                fee_reason = " - Connect Gebühr"
+            elif "processing" in original_description.lower():
+                fee_reason = " - Zahlungsabwicklung"
+            elif original_description and original_description.strip():
+                fee_reason = f" - {original_description}"
             
-        elif payment_id.startswith('sub_'):
-            # It's a subscription
-            subscription = client.Subscription.retrieve(payment_id)
-            if subscription.get('customer'):
-                try:
-                    customer = client.Customer.retrieve(subscription['customer'])
-                    return customer.get('name') or customer.get('email', STRIPE_NAME)
-                except:
-                    pass
-            return STRIPE_NAME
+            description = f"Kontoführungsgebühr vom {formatted_date} über {amount_str}€{fee_reason}"
+        else:
+            # Regular payment/charge
+            payment_method = record.payment_method()
+            description = f"Zahlung vom {formatted_date} über {amount_str}€ ({payment_method}), Kunde: {customer_name}"
             
+            # Try to get product information for payments/charges
+            product_name = record.product()
+            if product_name and product_name.strip():
+                description += f", Kunde hat Produkt \"{product_name}\" gekauft"
+        
+        return description
+    except Exception:
+        # Fallback if anything goes wrong
+        if transaction_type == 'refund':
+            return f"Rückerstattung über {abs(amount) / 100:.2f}€, Kunde: {customer_name}"
+        elif transaction_type == 'payment_failure_refund':
+            return f"Rückerstattung über {abs(amount) / 100:.2f}€, Kunde: {customer_name}, Grund: Fehlgeschlagene Zahlung"
+        elif transaction_type == 'payout':
+            return f"Geldtransit über {abs(amount) / 100:.2f}€ - Auszahlung von gesammelten Transaktionen"
+        elif transaction_type in ['stripe_fee', 'application_fee']:
+            return f"Kontoführungsgebühr über {abs(amount) / 100:.2f}€"
         else:
-            # For unknown types, try as charge first (legacy behavior)
-            try:
-                charge = client.Charge.retrieve(payment_id)
-                if charge.get('billing_details', {}).get('name'):
-                    return charge['billing_details']['name']
-                if charge.get('customer'):
-                    customer = client.Customer.retrieve(charge['customer'])
-                    return customer.get('name') or customer.get('email', STRIPE_NAME)
-                return STRIPE_NAME
-            except:
-                return STRIPE_NAME
-                
-    except InvalidRequestError:
-        return STRIPE_NAME
-    except Exception as e:
-        print(f"Warning: Could not fetch customer for {payment_id}: {str(e)}")
-        return STRIPE_NAME
+            return f"Zahlung über {amount / 100:.2f}€, Kunde: {customer_name}"
+
+
+def enrich_line(line, sum_fees: bool = None):
+    """
+    Resolves customer and description of one transaction line.
+    This is the network-bound part of the conversion and may run in worker threads.
+    :param line: Transaction line in CSV format, amount and fee in cents
+    :param sum_fees: Billing fees are summarized and get no description, defaults to SUM_FEES
+    :return: Tuple (customer, description), description is None for summarized billing fees
+    """
+    transType = line[1]
+    source = line[2]
+    amount = line[3]
+    accounting_date = line[9]
+    description = line[11]
+    failures_before = CALL_STATS.thread_failures()
+    started = time.perf_counter() if PROFILER.enabled else None
+
+    # All fields of the source are resolved from one object graph
+    record = SourceRecord(source, transType)
+    customer = record.customer()
 
+    # Billing usage fees are only summarized when SUM_FEES is enabled
+    if transType == 'stripe_fee' and (SUM_FEES if sum_fees is None else sum_fees):
+        description = None
+    # For refunds, payment_failure_refunds, payouts and stripe_fees, always use German descriptions
+    elif transType in ['refund', 'payment_failure_refund', 'payout', 'stripe_fee', 'application_fee']:
+        description = createDefaultDescription(record, transType, amount, customer, accounting_date, line[11])
+    else:
+        # If description is empty, try to get it from the original source
+        if not description or description.strip() == '':
+            description = record.description()
+
+        # If still empty, create a default description
+        if not description or description.strip() == '':
+            description = createDefaultDescription(record, transType, amount, customer, accounting_date, line[11])
+
+    if CALL_STATS.thread_failures() != failures_before:
+        # A Stripe call failed for good, customer or description are only fallback values
+        CALL_STATS.record_degraded(line[0])
+    if started is not None:
+        PROFILER.record_source(source, line[0], time.perf_counter() - started)
+
+    return customer, description
 
-def getPaymentMethodFromSource(source_id: str):
+
+def getPaymentMethodFromColumns(line):
     """
-    Fetches the payment method from the original Stripe object
-    :param source_id: The source ID (charge, payment_intent, etc.)
+    Payment method text of an itemized report line, in the format of ChargeResolver.payment_method
+    :param line: Transaction line in CSV format
     :return: Payment method string
     """
-    try:
-        client = get_client()
-        
-        if source_id.startswith('ch_'):
-            # It's a charge
-            charge = client.Charge.retrieve(source_id)
-            payment_method = charge.get('payment_method_details', {})
-            if payment_method.get('card'):
-                brand = payment_method['card'].get('brand', 'Karte').capitalize()
-                last4 = payment_method['card'].get('last4', 'XXXX')
-                return f"{brand} ****{last4}"
-            elif payment_method.get('sepa_debit'):
-                last4 = payment_method['sepa_debit'].get('last4', 'XXXX')
-                return f"SEPA Lastschrift ****{last4}"
-            else:
-                return payment_method.get('type', 'Unbekannt').replace('_', ' ').title()
-        else:
-            return "Online Payment"
-    except Exception:
-        return "Unbekannt"
+    method_type = line[14]
+    brand = line[15]
+    last4 = line[16] or 'XXXX'
+    if brand:
+        return f"{brand.capitalize()} ****{last4}"
+    if method_type == 'sepa_debit':
+        return f"SEPA Lastschrift ****{last4}"
+    if method_type:
+        return method_type.replace('_', ' ').title()
+    return "Online Payment"
 
 
-def getProductInfoFromSource(source_id: str):
+def enrich_line_offline(line):
     """
-    Fetches product information from the original Stripe object
-    :param source_id: The source ID (charge, payment_intent, etc.)
-    :return: Product name string or empty string
+    Resolves customer and description of one transaction line only from the columns of an
+    itemized report (customer name/email, card brand/last4, payment metadata), without any API call
+    :param line: Transaction line in CSV format, amount and fee in cents
+    :return: Tuple (customer, description), description is None for summarized billing fees
     """
-    try:
-        client = get_client()
-        
-        if source_id.startswith('ch_'):
-            # It's a charge
-            charge = client.Charge.retrieve(source_id)
-            
-            # Try to get product from metadata first
-            metadata = charge.get('metadata', {})
-            if metadata.get('product_name'):
-                return metadata['product_name']
-            if metadata.get('product'):
-                return metadata['product']
-            if metadata.get('item_name'):
-                return metadata['item_name']
-            
-            # Try to get from payment intent
-            payment_intent_id = charge.get('payment_intent')
-            if payment_intent_id:
-                try:
-                    pi = client.PaymentIntent.retrieve(payment_intent_id)
-                    pi_metadata = pi.get('metadata', {})
-                    if pi_metadata.get('product_name'):
-                        return pi_metadata['product_name']
-                    if pi_metadata.get('product'):
-                        return pi_metadata['product']
-                    if pi_metadata.get('item_name'):
-                        return pi_metadata['item_name']
-                except:
-                    pass
-            
-            # Try to get from invoice if available
-            invoice_id = charge.get('invoice')
-            if invoice_id:
-                try:
-                    invoice = client.Invoice.retrieve(invoice_id)
-                    line_items = invoice.get('lines', {}).get('data', [])
-                    if line_items:
-                        # Get the first line item's description or price description
-                        first_item = line_items[0]
-                        if first_item.get('description'):
-                            return first_item['description']
-                        price = first_item.get('price', {})
-                        if price.get('nickname'):
-                            return price['nickname']
-                        product_data = price.get('product', {})
-                        if isinstance(product_data, dict) and product_data.get('name'):
-                            return product_data['name']
-                except:
-                    pass
-                    
-        elif source_id.startswith('py_'):
-            # Try as different object types - this might be from a checkout session
+    transType = line[1]
+    amount = line[3]
+    accounting_date = line[9]
+    description = line[11]
+    record = ColumnRecord(line)
+    customer = record.customer()
+
+    if transType == 'stripe_fee' and SUM_FEES:
+        description = None
+    elif transType in ['refund', 'payment_failure_refund', 'payout', 'stripe_fee', 'application_fee'] \
+            or not description or description.strip() == '':
+        description = createDefaultDescription(record, transType, amount, customer, accounting_date, line[11])
+
+    return customer, description
+
+
+def enrich_ledger_line(line):
+    """
+    Resolves customer and description of a transaction line for the ledger
+    :param line: Transaction line in CSV format, amount and fee in cents
+    :return: Tuple (customer, description, degraded), degraded lines are resolved again by the next sync
+    """
+    failures_before = CALL_STATS.thread_failures()
+    # The ledger keeps the descriptions of all transactions, SUM_FEES only applies to exports
+    customer, description = enrich_line(line, sum_fees=False)
+    return customer, description, CALL_STATS.thread_failures() != failures_before
+
+
+def enrich_lines(lines, workers: int = 1, offline: bool = False, enrich=None):
+    """
+    Enriches all transaction lines, concurrently if more than one worker is configured.
+    The results keep the order of the input lines, at most a few lines per worker are in progress.
+    :param lines: Iterator of transaction lines in CSV format
+    :param workers: Number of worker threads
+    :param offline: Only use the columns of the CSV file, no Stripe API calls
+    :param enrich: Enrichment function of one line, defaults to enrich_line
+    :return: Iterator of (line, customer, description) tuples
+    """
+    if offline:
+        for line in lines:
+            yield (line, *enrich_line_offline(line))
+        return
+
+    enrich = enrich or enrich_line
+    if workers <= 1:
+        for line in lines:
+            yield (line, *enrich(line))
+        return
+
+    window = workers * 4
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        for line in lines:
+            pending.append((line, executor.submit(enrich, line)))
+            if len(pending) >= window:
+                line, future = pending.popleft()
+                yield (line, *future.result())
+        while pending:
+            line, future = pending.popleft()
+            yield (line, *future.result())
+
+
+def _referenced_objects(client, obj):
+    """
+    Objects the enrichment helpers follow from an already retrieved object
+    :param client: stripe
+    :param obj: Stripe object
+    :return: List of (resource, id) tuples
+    """
+    references = []
+    if obj.get('customer'):
+        references.append((client.Customer, obj['customer']))
+    if obj['object'] == 'charge':
+        if obj.get('payment_intent'):
+            references.append((client.PaymentIntent, obj['payment_intent']))
+        if obj.get('invoice'):
+            references.append((client.Invoice, obj['invoice']))
+    elif obj['object'] == 'payment_intent' and obj.get('latest_charge'):
+        references.append((client.Charge, obj['latest_charge']))
+    return [(resource, object_id) for resource, object_id in references if not _is_expanded_object(object_id)]
+
+
+async def prefetch_objects_async(lines, concurrency: int):
+    """
+    Retrieves the object graph behind all source ids concurrently with asyncio and stores it in
+    the object cache. Level by level (source -> charge / payment intent / invoice -> customer),
+    at most `concurrency` requests are in flight over one pooled keep-alive HTTP client.
+    The synchronous enrichment afterwards is served from the cache, so the output is identical.
+    :param lines: Transaction lines in CSV format
+    :param concurrency: Maximum number of concurrent requests
+    """
+    client = get_client()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch(resource, object_id):
+        async with semaphore:
             try:
-                # Try to find related checkout session through metadata patterns
-                # This is a bit tricky since py_ objects can be various things
-                pass
-            except:
-                pass
-                
-        return ""
-    except Exception as e:
-        print(f"Warning: Could not fetch product info for {source_id}: {str(e)}")
-        return ""
+                return await OBJECT_CACHE.get_or_fetch_async(resource, object_id)
+            except Exception:
+                # Failures are handled by the enrichment helpers, which retry or fall back
+                return None
+
+    pending = set()
+    for line in lines:
+        source = line[2]
+        if not source or (ENRICHMENT_CACHE.enabled and ENRICHMENT_CACHE.contains(source, 'customer')):
+            continue
+        for resource_name in resolver_for(source).resources:
+            pending.add((stripe_resource(client, resource_name), source))
 
+    seen = set()
+    while pending:
+        seen |= pending
+        objects = await asyncio.gather(*(fetch(resource, object_id) for resource, object_id in pending))
+        pending = set()
+        for obj in objects:
+            if obj is not None:
+                pending.update(reference for reference in _referenced_objects(client, obj) if reference not in seen)
 
-def getDescriptionFromSource(source_id: str, transaction_type: str):
+
+def prefetch_objects(lines, concurrency: int, batch_size: int = PREFETCH_BATCH_SIZE):
     """
-    Fetches the real description from the original Stripe object
-    :param source_id: The source ID (charge, payment_intent, etc.)
-    :param transaction_type: The transaction type (payment, charge, etc.)
-    :return: Description string or empty string
+    Runs the asyncio prefetch engine on one pooled httpx client, batch by batch
+    :param lines: Iterator of transaction lines in CSV format
+    :param concurrency: Maximum number of concurrent requests
+    :param batch_size: Number of lines prefetched at once
+    :return: Iterator of the same lines, each one yielded after its batch was prefetched
     """
+    # stripe.HTTPXClient requires httpx
+    if importlib.util.find_spec('httpx') is None:
+        raise ImportError(
+            "The async engine requires the 'httpx' package!\n"
+            "Possible solutions:\n"
+            "1. Install it: pip install httpx\n"
+            "2. Or use the default engine: --engine sync"
+        )
+    # The shared connection pool serves the async prefetch and remaining synchronous calls
+    get_client()
+    HTTP_POOL.client(async_engine=True)
+    loop = asyncio.new_event_loop()
     try:
-        client = get_client()
-        
-        # Handle different source types
-        if source_id.startswith('ch_'):
-            # It's a charge
-            charge = client.Charge.retrieve(source_id)
-            description = charge.get('description', '') or charge.get('statement_descriptor', '') or ''
-            if description:
-                return description
-            # If charge has no description, try to get it from payment intent
-            payment_intent_id = charge.get('payment_intent')
-            if payment_intent_id:
-                pi = client.PaymentIntent.retrieve(payment_intent_id)
-                return pi.get('description', '') or pi.get('statement_descriptor', '') or ''
-            return ''
-        elif source_id.startswith('py_'):
-            # This seems to be a checkout session or setup intent, try different approaches
-            try:
-                # Try as PaymentMethod
-                pm = client.PaymentMethod.retrieve(source_id)
-                return pm.get('description', '') or ''
-            except:
-                try:
-                    # Try as Setup Intent
-                    si = client.SetupIntent.retrieve(source_id)
-                    return si.get('description', '') or si.get('statement_descriptor', '') or ''
-                except:
-                    return ''
-        elif source_id.startswith('pi_'):
-            # It's a payment intent
-            payment_intent = client.PaymentIntent.retrieve(source_id)
-            return payment_intent.get('description', '') or payment_intent.get('statement_descriptor', '') or ''
-        elif source_id.startswith('re_'):
-            # It's a refund
-            refund = client.Refund.retrieve(source_id)
-            return refund.get('reason', '') or 'Refund'
-        elif source_id.startswith('cs_'):
-            # It's a checkout session
-            session = client.checkout.Session.retrieve(source_id)
-            return session.get('description', '') or session.get('client_reference_id', '') or ''
+        batch = []
+        for line in lines:
+            batch.append(line)
+            if len(batch) >= batch_size:
+                loop.run_until_complete(prefetch_objects_async(batch, concurrency))
+                yield from batch
+                batch = []
+        if batch:
+            loop.run_until_complete(prefetch_objects_async(batch, concurrency))
+            yield from batch
+    finally:
+        loop.run_until_complete(HTTP_POOL.close_async())
+        loop.close()
+
+
+class FeeAggregator:
+    """
+    Running fee sums of SUM_FEES in cents, one set of sums per group (run, day, month or payout),
+    kept for the whole run, so lines of a group may arrive in any order (e.g. interleaved payouts).
+    The group key is only sliced when it changes from the previous line, so runs of lines of the
+    same group add their fees without allocating. Memory depends on the number of groups in the
+    period, never on the number of transactions.
+    """
+
+    # Fee types in the order of the summary lines
+    DESCRIPTIONS = [
+        'Stripe Processing Fees for Charges',
+        'Stripe Processing Fees for Payments',
+        'Billing Usage Fee',
+    ]
+    CHARGE = 0
+    PAYMENT = 1
+    BILLING = 2
+
+    def __init__(self, grouping: str = 'run', groups: list = None):
+        self.grouping = grouping
+        # group key -> [charge cents, payment cents, billing cents, accounting date, value date]
+        self.groups = {}
+        for key, *sums in groups or []:
+            self.groups[key] = sums
+        self._key = None
+        self._sums = None
+
+    def add(self, kind: int, cents: int, line, accounting_date: str, value_date: str):
+        """
+        Adds a fee to the sums of the group of its transaction
+        :param kind: FeeAggregator.CHARGE, PAYMENT or BILLING
+        :param cents: Fee in cents
+        :param line: Transaction line
+        :param accounting_date: Accounting date of the transaction
+        :param value_date: Value date of the transaction
+        """
+        # Group keys are prefixes of a date ("2024-01-15", "2024-01") or complete payout IDs
+        if self.grouping == 'day':
+            value, length = accounting_date, 10
+        elif self.grouping == 'month':
+            value, length = accounting_date, 7
+        elif self.grouping == 'payout' and len(line) > 18 and line[18]:
+            value, length = line[18], None
+        elif self.grouping == 'payout':
+            # Without the payout ID of itemized reports, all transactions that became
+            # available on the same day are paid out together
+            value, length = value_date, 10
         else:
-            # For unknown types, try to create a meaningful description from transaction type
-            if transaction_type == 'payment':
-                return 'Online Payment'
-            elif transaction_type == 'charge':
-                return 'Card Payment'
-            elif transaction_type == 'refund':
-                return 'Refund'
-            elif transaction_type == 'payout':
-                return 'Payout to Bank'
-            else:
-                return transaction_type.replace('_', ' ').title()
-    except Exception as e:
-        # If we can't retrieve the object, create a fallback description
-        print(f"Warning: Could not fetch description for {source_id}: {str(e)}")
-        if transaction_type == 'payment':
-            return 'Online Payment'
-        elif transaction_type == 'charge':
-            return 'Card Payment'
-        elif transaction_type == 'refund':
-            return 'Refund'
-        elif transaction_type == 'payout':
-            return 'Payout to Bank'
+            value, length = '', None
+
+        key = self._key
+        if key is None or (value != key if length is None else not value.startswith(key)):
+            key = value if length is None else value[:length]
+            sums = self.groups.get(key)
+            if sums is None:
+                # The first fee of a group dates its summary lines
+                sums = self.groups[key] = [0, 0, 0, accounting_date, value_date]
+            self._key = key
+            self._sums = sums
+        self._sums[kind] += cents
+
+    def rows(self):
+        """
+        Summary lines of all groups in the order their first fee appeared
+        :return: Iterator of ExportLine
+        """
+        for key, sums in self.groups.items():
+            for kind, description in enumerate(self.DESCRIPTIONS):
+                cents = sums[kind]
+                if cents > 0:
+                    # Fees are always expenses (Soll)
+                    yield ExportLine(sums[3], STRIPE_NAME, f'{description} ({key})' if key else description,
+                                     -cents, cents, None, sums[4])
+
+    def state(self):
+        """
+        :return: JSON serializable sums for the checkpoint of a running export
+        """
+        return [[key, *sums] for key, sums in self.groups.items()]
+
+
+class ExportLine:
+    """
+    One line of the export in the column order of csv_header(), with the amounts as integer cents.
+    Every sink formats the amounts itself, so JSONL and Parquet never parse formatted amounts back.
+    """
+
+    __slots__ = ('accounting_date', 'customer', 'description', 'amount', 'debit', 'credit', 'value_date')
+
+    def __init__(self, accounting_date: str, customer: str, description: str, amount: int, debit: int, credit: int, value_date: str):
+        """
+        :param accounting_date: Buchungsdatum
+        :param customer: Auftraggeber / Empfänger
+        :param description: Verwendungszweck
+        :param amount: Betrag in cents
+        :param debit: Soll Betrag (Ausgabe) in cents or None
+        :param credit: Haben Betrag (Einnahme) in cents or None
+        :param value_date: Wertstellungsdatum
+        """
+        self.accounting_date = accounting_date
+        self.customer = customer
+        self.description = description
+        self.amount = amount
+        self.debit = debit
+        self.credit = credit
+        self.value_date = value_date
+
+
+class ExportSink(abc.ABC):
+    """
+    One output file of an export. All sinks receive the same lines, so every format
+    is written in a single pass and the enrichment is paid only once per run.
+    """
+
+    extension = '.csv'
+    # Plain files can be truncated to a checkpoint and continued with --resume
+    resumable = True
+    # Closed files can be continued with reopen()
+    reopenable = True
+
+    def __init__(self, filename: str, output_format: str, compressed: bool = False):
+        self.filename = filename
+        self.output_format = output_format
+        self.compressed = compressed
+        self.resumable = self.resumable and not compressed
+        self._file = None
+
+    def open(self, position: int = None):
+        """
+        Opens the output file, with the position of a checkpoint the file is truncated and continued
+        :param position: Bytes of the file written up to the checkpoint
+        """
+        if self.compressed:
+            self._file = gzip.open(self.filename, 'wt', newline='', encoding='utf-8')
+        elif position is not None:
+            self._file = open(self.filename, 'r+', newline='', encoding='utf-8', buffering=SINK_BUFFER_BYTES)
+            # Drop rows written after the last checkpoint, they are processed again
+            self._file.truncate(position)
+            self._file.seek(0, os.SEEK_END)
+        else:
+            self._file = open(self.filename, 'w', newline='', encoding='utf-8', buffering=SINK_BUFFER_BYTES)
+        self.start(position is None)
+
+    def start(self, new_file: bool):
+        """
+        Prepares writing, new files get their header
+        :param new_file: The file was just created
+        """
+
+    @abc.abstractmethod
+    def write(self, line: ExportLine):
+        """
+        Writes one line in the format of the sink
+        :param line: Export line
+        """
+
+    def position(self):
+        """
+        Flushes the buffered rows for a checkpoint
+        :return: Bytes written so far
+        """
+        self._file.flush()
+        return self._file.tell()
+
+    def reopen(self):
+        """
+        Continues the file after close(), --split-by closes partitions to free their file handles and buffers
+        """
+        if self.compressed:
+            # Appends another gzip member, readers decompress all members as one stream
+            self._file = gzip.open(self.filename, 'at', newline='', encoding='utf-8')
+            self.start(False)
         else:
-            return transaction_type.replace('_', ' ').title()
+            self.open(os.path.getsize(self.filename))
 
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
 
-def read_csv():
+
+class LexOfficeSink(ExportSink):
     """
-    This method returns all csv lines in import.csv & drops the header.
-    :return: CSV Lines in array from import.csv
+    Semicolon separated CSV with the German column headers of the LexOffice bank import
     """
-    # Check if CSV file exists
-    if not os.path.exists('import.csv'):
-        raise FileNotFoundError(
-            "The file 'import.csv' was not found!\n"
-            "Possible solutions:\n"
-            "1. Create an 'import.csv' file with your Stripe data\n"
-            "2. Or switch to API method: Set STRIPE_METHOD=API in the .env file"
-        )
-    
-    csvlines = []
-    with open('import.csv', newline='', encoding='utf-8') as csvfile:
-        reader = csv.reader(csvfile)
 
-        # Appending rows to csvlines
-        for row in reader:
-            csvlines.append(row)
+    extension = '.csv'
 
-    # We remove the header
-    csvlines.pop(0)
+    def start(self, new_file: bool):
+        self._writer = csv.writer(self._file, delimiter=';')
+        if new_file:
+            self._writer.writerow(csv_header())
 
-    return csvlines
+    def write(self, line: ExportLine):
+        self._writer.writerow([
+            line.accounting_date,
+            line.customer,
+            line.description,
+            format_cents(line.amount),
+            "" if line.debit is None else format_cents(line.debit),
+            "" if line.credit is None else format_cents(line.credit),
+            line.value_date,
+        ])
 
 
-def fetch_balance_transactions(start_date, end_date):
+class JsonlSink(ExportSink):
     """
-    Fetches balance transactions directly from the Stripe API
-    :param start_date: Start date (datetime)
-    :param end_date: End date (datetime)
-    :return: CSV-like array with transaction data
+    One JSON object per line with the amounts in cents, e.g. for internal reporting
     """
-    client = get_client()
-    transactions = []
-    
-    # Convert dates to Unix timestamps
-    start_timestamp = int(start_date.timestamp())
-    end_timestamp = int(end_date.timestamp())
-    
-    print(f"Fetching balance transactions from {start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}...")
-    
-    # Fetch all balance transactions in the timeframe
-    balance_transactions = client.BalanceTransaction.list(
-        created={
-            'gte': start_timestamp,
-            'lte': end_timestamp
-        },
-        limit=100
-    )
-    
-    for transaction in balance_transactions.auto_paging_iter():
-        # Convert balance transaction to CSV format
-        # Adapt Stripe Balance Transaction format
-        csv_row = [
-            transaction.id,  # id (0)
-            transaction.type,  # type (1)
-            transaction.source,  # source (2)
-            format_stripe_amount(transaction.amount),  # amount (3)
-            format_stripe_amount(transaction.fee),  # fee (4)
-            '',  # currency (5) - not used
-            '',  # net (6) - not used  
-            '',  # reporting_category (7) - not used
-            '',  # customer_facing_amount (8) - not used
-            datetime.fromtimestamp(transaction.created).strftime('%Y-%m-%d %H:%M:%S'),  # created/accounting_date (9)
-            datetime.fromtimestamp(transaction.available_on).strftime('%Y-%m-%d %H:%M:%S'),  # available_on/value_date (10)
-            transaction.description or ''  # description (11)
-        ]
-        transactions.append(csv_row)
-    
-    print(f"Found {len(transactions)} transactions.")
-    return transactions
+
+    extension = '.jsonl'
+
+    def write(self, line: ExportLine):
+        self._file.write(json.dumps(export_record(line), ensure_ascii=False))
+        self._file.write('\n')
+
+
+class ParquetSink(ExportSink):
+    """
+    Parquet file with the amounts in cents, lines are collected column by column and
+    written as row groups. Requires the optional package pyarrow.
+    """
+
+    extension = '.parquet'
+    # Row groups can not be continued after an interruption or close
+    resumable = False
+    reopenable = False
+    _writer = None
+
+    def open(self, position: int = None):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError(
+                "The Parquet output requires the 'pyarrow' package!\n"
+                "Possible solutions:\n"
+                "1. Install it: pip install pyarrow\n"
+                "2. Or use another format: --output-format jsonl"
+            )
+        self._pyarrow = pyarrow
+        self._schema = pyarrow.schema([
+            (field, pyarrow.int64() if field.endswith('_cents') else pyarrow.string()) for field in EXPORT_FIELDS
+        ])
+        self._writer = pyarrow.parquet.ParquetWriter(self.filename, self._schema)
+        self._columns = [[] for _ in EXPORT_FIELDS]
+        self._rows = 0
+
+    def write(self, line: ExportLine):
+        for column, field in zip(self._columns, ExportLine.__slots__):
+            column.append(getattr(line, field))
+        self._rows += 1
+        if self._rows >= PARQUET_ROW_GROUP_ROWS:
+            self._write_row_group()
+
+    def _write_row_group(self):
+        self._writer.write_table(self._pyarrow.Table.from_arrays(
+            [self._pyarrow.array(column, type=field.type) for column, field in zip(self._columns, self._schema)],
+            schema=self._schema,
+        ))
+        self._columns = [[] for _ in EXPORT_FIELDS]
+        self._rows = 0
+
+    def position(self):
+        return None
+
+    def close(self):
+        if self._writer is not None:
+            if self._rows:
+                self._write_row_group()
+            self._writer.close()
+            self._writer = None
+
+
+# Output formats of --output-format, every format except parquet also as gzip-compressed variant (.gz)
+EXPORT_SINKS = {
+    'lexoffice': LexOfficeSink,
+    'jsonl': JsonlSink,
+    'parquet': ParquetSink,
+}
+OUTPUT_FORMATS = ['lexoffice', 'lexoffice.gz', 'jsonl', 'jsonl.gz', 'parquet']
+# Field names of the JSONL and Parquet outputs, in the column order of csv_header()
+EXPORT_FIELDS = [
+    'accounting_date', 'customer', 'description', 'amount_cents', 'debit_cents', 'credit_cents', 'value_date',
+]
+
+
+def export_record(line: ExportLine):
+    """
+    Converts an export line into a record of the JSONL and Parquet outputs
+    :param line: ExportLine
+    :return: dict with the fields of EXPORT_FIELDS
+    """
+    return {
+        'accounting_date': line.accounting_date,
+        'customer': line.customer,
+        'description': line.description,
+        'amount_cents': line.amount,
+        'debit_cents': line.debit,
+        'credit_cents': line.credit,
+        'value_date': line.value_date,
+    }
 
 
-def format_stripe_amount(amount_in_cents):
+class ExportPartition:
     """
-    Converts Stripe amounts (in cents) to German format
-    :param amount_in_cents: Amount in cents
-    :return: German format string (e.g. "10,50")
+    The output files and fee sums of one export. A run writes one partition,
+    with --split-by one per month, week or payout, all in the same pass.
     """
-    if amount_in_cents == 0:
-        return "0,00"
-    
-    amount_in_euros = amount_in_cents / 100
-    return f"{amount_in_euros:.2f}".replace('.', ',')
 
+    def __init__(self, export_filename: str, output_formats: list, fee_groups: list = None):
+        """
+        :param export_filename: Export filename (export_....csv)
+        :param output_formats: Formats from OUTPUT_FORMATS
+        :param fee_groups: Fee sums of a checkpoint
+        """
+        self.export_filename = export_filename
+        self.sinks = create_sinks(export_filename, output_formats)
+        self.fees = FeeAggregator(FEE_GROUPING, fee_groups)
+        self.reopenable = all(sink.reopenable for sink in self.sinks)
+        self.is_open = False
+        self.lines_written = 0
 
-def parse_date(date_string):
+    def open(self, outputs: contextlib.ExitStack, sink_bytes: dict = None):
+        """
+        Opens all output files
+        :param outputs: Closes the files at the end of the run
+        :param sink_bytes: Bytes per output format written up to a checkpoint
+        """
+        outputs.callback(self.close)
+        for sink in self.sinks:
+            sink.open(sink_bytes[sink.output_format] if sink_bytes else None)
+        self.is_open = True
+
+    def reopen(self):
+        """
+        Continues the output files after close()
+        """
+        for sink in self.sinks:
+            sink.reopen()
+        self.is_open = True
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+        self.is_open = False
+
+    def write(self, export_line: ExportLine):
+        for sink in self.sinks:
+            sink.write(export_line)
+        self.lines_written += 1
+
+
+class ExportSplitter:
     """
-    Parses date string to datetime object
-    :param date_string: Date in format YYYY-MM-DD
-    :return: datetime object
+    Routes the lines of a --split-by run to one ExportPartition per calendar month, ISO week
+    (Monday to Sunday) or payout. Partitions are opened with their first line. Lines arrive in time
+    order, so a month or week partition is closed as soon as the next one starts. Lines of different
+    payouts interleave, only the SPLIT_OPEN_PARTITIONS payouts used last stay open. Closed partitions
+    are continued if more of their lines follow. The partition is only looked up again when the day
+    (or payout) of the lines changes.
     """
-    try:
-        return datetime.strptime(date_string, '%Y-%m-%d')
-    except ValueError:
-        raise ValueError(f"Invalid date format: {date_string}. Use YYYY-MM-DD (e.g. 2024-01-01)")
 
+    def __init__(self, split_by: str, start_date, end_date, account: str, output_formats: list, outputs: contextlib.ExitStack, suffix: str = None):
+        self.split_by = split_by
+        self.start_date = start_date
+        self.end_date = end_date
+        self.account = account
+        self.suffix = suffix
+        self.output_formats = output_formats
+        self.outputs = outputs
+        # export filename -> ExportPartition, in the order of their first line
+        self.partitions = {}
+        # Open partitions, least recently used first
+        self._open_partitions = {}
+        self._key = None
+        self._partition = None
+
+    def partition(self, line):
+        """
+        :param line: Transaction line
+        :return: ExportPartition of the line
+        """
+        if self.split_by == 'payout':
+            # Without the payout ID of itemized reports, all transactions that became
+            # available on the same day are paid out together
+            key = line[18] if len(line) > 18 and line[18] else line[10][:10]
+        else:
+            key = line[9][:10]
+        if key != self._key:
+            self._key = key
+            partition = self._get(key)
+            if partition is not self._partition:
+                self._activate(partition)
+                self._partition = partition
+        return self._partition
+
+    def _get(self, key: str):
+        """
+        Returns the partition of a day or payout ID, created on first use
+        :param key: Day (YYYY-MM-DD) or payout ID
+        :return: ExportPartition
+        """
+        if self.split_by == 'payout':
+            # Payouts are named after their ID or available-on day, which usually lies after the export range
+            export_filename = generate_export_filename(None, None, self.account, name=key, suffix=self.suffix)
+        else:
+            day = datetime.strptime(key, '%Y-%m-%d')
+            if self.split_by == 'month':
+                start = day.replace(day=1)
+                end = (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+            else:
+                start = day - timedelta(days=day.weekday())
+                end = start + timedelta(days=6)
+            # The first and last partition only cover their part of the export range
+            if self.start_date:
+                start = max(start, self.start_date)
+            if self.end_date:
+                end = min(end, self.end_date)
+            export_filename = generate_export_filename(start, end, self.account, suffix=self.suffix)
+
+        partition = self.partitions.get(export_filename)
+        if partition is None:
+            partition = self.partitions[export_filename] = ExportPartition(export_filename, self.output_formats)
+        return partition
+
+    def _activate(self, partition: ExportPartition):
+        """
+        Opens or continues the partition of the next lines and closes the partitions beyond the limit
+        :param partition: ExportPartition of the next lines
+        """
+        self._open_partitions.pop(partition.export_filename, None)
+        if not partition.is_open:
+            if partition.lines_written:
+                partition.reopen()
+            else:
+                partition.open(self.outputs)
+        self._open_partitions[partition.export_filename] = partition
+
+        limit = SPLIT_OPEN_PARTITIONS if self.split_by == 'payout' else 1
+        # Parquet files can not be continued, they stay open (validate_args rejects them for payouts)
+        for export_filename, open_partition in list(self._open_partitions.items())[:-limit]:
+            if open_partition.reopenable:
+                open_partition.close()
+                del self._open_partitions[export_filename]
 
-def get_transactions_data(start_date=None, end_date=None):
+
+def create_sinks(export_filename: str, output_formats: list):
     """
-    Gets transaction data either from CSV or API based on STRIPE_METHOD
-    :param start_date: Start date for API retrieval
-    :param end_date: End date for API retrieval
-    :return: Transaction data in CSV format
+    Creates the sinks of all requested output formats, named after the export file
+    :param export_filename: Export filename (export_....csv)
+    :param output_formats: Formats from OUTPUT_FORMATS
+    :return: List of sinks
     """
-    if STRIPE_METHOD == 'CSV':
-        print("Using CSV method...")
-        return read_csv()
-    elif STRIPE_METHOD == 'API':
-        if not start_date or not end_date:
-            raise ValueError("Start and end date are required for API method!")
-        print("Using API method...")
-        return fetch_balance_transactions(start_date, end_date)
-    else:
-        raise ValueError(f"Invalid STRIPE_METHOD: {STRIPE_METHOD}. Use 'CSV' or 'API'")
+    root = os.path.splitext(export_filename)[0]
+    sinks = []
+    for output_format in output_formats:
+        name, _, compression = output_format.partition('.')
+        sink_class = EXPORT_SINKS[name]
+        filename = f"{root}{sink_class.extension}{'.gz' if compression else ''}"
+        sinks.append(sink_class(filename, output_format, compressed=bool(compression)))
+    return sinks
 
 
-def toMoney(am: str):
+def checkpoint_filename(export_filename: str):
     """
-    Convert the amount part to float and to an easy format, so lexoffice does not get in trouble
-    :param am:
-    :return:
+    Returns the checkpoint file belonging to an export file
+    :param export_filename: Export filename
+    :return: Filename string
     """
-    return float(
-        am.replace('.', '').replace(',', '.')
-    )
+    return f'{export_filename}.checkpoint'
 
 
-def getRefundReason(source_id: str, transaction_type: str):
+def profile_filename(export_filename: str):
     """
-    Gets the refund reason from Stripe
-    :param source_id: The source ID
-    :param transaction_type: Transaction type
-    :return: Refund reason in German
+    Returns the --profile report file belonging to an export file
+    :param export_filename: Export filename
+    :return: Filename string
     """
-    try:
-        client = get_client()
-        
-        if source_id.startswith('re_'):
-            # It's a refund
-            refund = client.Refund.retrieve(source_id)
-            reason = refund.get('reason', '')
-            if reason == 'duplicate':
-                return 'Doppelte Zahlung'
-            elif reason == 'fraudulent':
-                return 'Verdacht auf Betrug'
-            elif reason == 'requested_by_customer':
-                return 'Kunde hat Rückerstattung angefordert'
-            elif reason:
-                return reason
-            else:
-                return 'Rückerstattung'
-        elif transaction_type == 'payment_failure_refund':
-            return 'Rückerstattung aufgrund fehlgeschlagener Zahlung'
-        else:
-            return 'Rückerstattung'
-    except Exception:
-        return 'Rückerstattung'
+    return f'{export_filename}.profile.json'
 
 
-def createDefaultDescription(source_id: str, transaction_type: str, amount: float, customer_name: str, accounting_date: str, original_description: str = ""):
+def save_checkpoint(export_filename: str, state: dict):
     """
-    Creates a default description when none is available
-    :param source_id: The source ID
-    :param transaction_type: Transaction type
-    :param amount: Transaction amount
-    :param customer_name: Customer name
-    :param accounting_date: Transaction date
-    :param original_description: Original description from Stripe
-    :return: Formatted description string
+    Atomically writes the checkpoint of a running export
+    :param export_filename: Export filename
+    :param state: Checkpoint data
     """
-    try:
-        # Parse and format date from "YYYY-MM-DD HH:MM:SS" to "DD.MM.YYYY"
-        from datetime import datetime
-        date_obj = datetime.strptime(accounting_date.split(' ')[0], '%Y-%m-%d')
-        formatted_date = date_obj.strftime('%d.%m.%Y')
-        
-        # Format amount with German decimal separator (make amount positive for display)
-        amount_abs = abs(amount)
-        amount_str = f"{amount_abs:.2f}".replace('.', ',')
-        
-        # Handle different transaction types
-        if transaction_type == 'refund':
-            refund_reason = getRefundReason(source_id, transaction_type)
-            description = f"Rückerstattung vom {formatted_date} über {amount_str}€, Kunde: {customer_name}, Grund: {refund_reason}"
-        elif transaction_type == 'payment_failure_refund':
-            description = f"Rückerstattung vom {formatted_date} über {amount_str}€, Kunde: {customer_name}, Grund: Fehlgeschlagene Zahlung"
-        elif transaction_type == 'payout':
-            description = f"Geldtransit vom {formatted_date} über {amount_str}€ - Auszahlung von gesammelten Transaktionen"
-        elif transaction_type in ['stripe_fee', 'application_fee']:
-            # Create description based on what the fee is for
-            fee_reason = ""
-            if "tax" in original_description.lower() or "automatic" in original_description.lower():
-                fee_reason = " - Automated Tax Berechnung"
-            elif "connect" in original_description.lower():
-                fee_reason = " - Connect Gebühr"
-            elif "processing" in original_description.lower():
-                fee_reason = " - Zahlungsabwicklung"
-            elif original_description and original_description.strip():
-                fee_reason = f" - {original_description}"
-            
-            description = f"Kontoführungsgebühr vom {formatted_date} über {amount_str}€{fee_reason}"
-        else:
-            # Regular payment/charge
-            payment_method = getPaymentMethodFromSource(source_id)
-            description = f"Zahlung vom {formatted_date} über {amount_str}€ ({payment_method}), Kunde: {customer_name}"
-            
-            # Try to get product information for payments/charges
-            product_name = getProductInfoFromSource(source_id)
-            if product_name and product_name.strip():
-                description += f", Kunde hat Produkt \"{product_name}\" gekauft"
-        
-        return description
-    except Exception as e:
-        # Fallback if anything goes wrong
-        if transaction_type == 'refund':
-            return f"Rückerstattung über {abs(amount):.2f}€, Kunde: {customer_name}"
-        elif transaction_type == 'payment_failure_refund':
-            return f"Rückerstattung über {abs(amount):.2f}€, Kunde: {customer_name}, Grund: Fehlgeschlagene Zahlung"
-        elif transaction_type == 'payout':
-            return f"Geldtransit über {abs(amount):.2f}€ - Auszahlung von gesammelten Transaktionen"
-        elif transaction_type in ['stripe_fee', 'application_fee']:
-            return f"Kontoführungsgebühr über {abs(amount):.2f}€"
-        else:
-            return f"Zahlung über {amount:.2f}€, Kunde: {customer_name}"
+    filename = checkpoint_filename(export_filename)
+    with open(f'{filename}.tmp', 'w', encoding='utf-8') as checkpointFile:
+        json.dump(state, checkpointFile)
+    os.replace(f'{filename}.tmp', filename)
+
+
+def load_checkpoint(export_filename: str):
+    """
+    Loads the checkpoint of an interrupted export and checks that it fits the current configuration
+    :param export_filename: Export filename
+    :return: Checkpoint data
+    """
+    filename = checkpoint_filename(export_filename)
+    if not os.path.exists(filename) or not os.path.exists(export_filename):
+        raise FileNotFoundError(
+            f"No resumable export found for '{export_filename}'!\n"
+            "Possible solutions:\n"
+            "1. Use the same --start-date / --end-date as the interrupted run\n"
+            "2. Or start a new export without --resume"
+        )
+    with open(filename, encoding='utf-8') as checkpointFile:
+        checkpoint = json.load(checkpointFile)
+    if 'fee_groups' not in checkpoint or 'sink_bytes' not in checkpoint:
+        raise ValueError(
+            f"The checkpoint of '{export_filename}' was written by an older version. "
+            "Start a new export without --resume."
+        )
+    if (checkpoint['stripe_method'] != STRIPE_METHOD or checkpoint['sum_fees'] != SUM_FEES
+            or checkpoint['fee_grouping'] != FEE_GROUPING):
+        raise ValueError(
+            f"The checkpoint of '{export_filename}' was written with STRIPE_METHOD={checkpoint['stripe_method']}, "
+            f"SUM_FEES={checkpoint['sum_fees']} and FEE_GROUPING={checkpoint['fee_grouping']}. "
+            "Use the same configuration to resume."
+        )
+    return checkpoint
+
+
+def find_resumable_export(account: str = None):
+    """
+    Finds the most recent interrupted export (used for the CSV method without date range)
+    :param account: Account name in multi-account mode
+    :return: Export filename
+    """
+    checkpoints = glob.glob(checkpoint_filename(f'export_{account}_*.csv' if account else 'export_*.csv'))
+    if not checkpoints:
+        raise FileNotFoundError("No interrupted export found to resume (no export_*.csv.checkpoint file)!")
+    return max(checkpoints, key=os.path.getmtime)[:-len('.checkpoint')]
 
 
-def generate_export_filename(start_date, end_date):
+def generate_export_filename(start_date, end_date, account: str = None, name: str = None, suffix: str = None):
     """
     Generate export filename based on date range
     :param start_date: Start date (datetime object or None)
     :param end_date: End date (datetime object or None)
+    :param account: Account name in multi-account mode
+    :param name: Name instead of the date range, e.g. the payout ID of --split-by payout
+    :param suffix: Appended to the name, e.g. the request ID of the export daemon
     :return: Filename string
     """
+    prefix = f'export_{account}_' if account else 'export_'
+    suffix = f'_{suffix}' if suffix else ''
+    if name:
+        return f'{prefix}{name}{suffix}.csv'
     if start_date and end_date:
         start_str = start_date.strftime('%Y-%m-%d')
         end_str = end_date.strftime('%Y-%m-%d')
-        return f'export_{start_str}_{end_str}.csv'
+        return f'{prefix}{start_str}_{end_str}{suffix}.csv'
     else:
         # Fallback for CSV method or when dates are not specified
         timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
-        return f'export_{timestamp}.csv'
+        return f'{prefix}{timestamp}{suffix}.csv'
 
 
-def main():
+def build_parser():
     """
-    Main function with CLI argument parsing
+    CLI arguments, also the defaults of the Converter options
+    :return: argparse.ArgumentParser
     """
     parser = argparse.ArgumentParser(description='Stripe to LexOffice CSV Converter')
+    parser.add_argument('command', nargs='?', choices=['export', 'sync', 'serve'], default='export', help='export (default) writes the LexOffice CSV, sync updates the local ledger from the Stripe API, serve runs the export daemon')
     parser.add_argument('--start-date', type=str, help='Start date (YYYY-MM-DD) for API retrieval')
     parser.add_argument('--end-date', type=str, help='End date (YYYY-MM-DD) for API retrieval')
-    
-    args = parser.parse_args()
+    parser.add_argument('--expand', action='store_true', help='Expand source objects in the API listing instead of retrieving them one by one')
+    parser.add_argument('--workers', type=int, default=1, help='Number of threads resolving customers and descriptions concurrently')
+    parser.add_argument('--engine', choices=['sync', 'async'], default='sync', help='Enrichment engine, async prefetches all Stripe objects with asyncio')
+    parser.add_argument('--concurrency', type=int, default=50, help='Maximum concurrent requests of the async engine')
+    parser.add_argument('--resume', action='store_true', help='Continue an interrupted export from its checkpoint')
+    parser.add_argument('--shards', type=int, default=1, help='Number of threads listing sub-windows of the API date range concurrently')
+    parser.add_argument('--shard-by', choices=['auto', 'day', 'week'], default='auto', help='Sub-window size of the sharded listing, auto splits by volume')
+    parser.add_argument('--prefetch', action='store_true', help='Bulk-list charges, payment intents, refunds and customers of the export window before enrichment')
+    parser.add_argument('--parse-workers', type=int, default=1, help='Number of processes parsing chunks of a large import.csv')
+    parser.add_argument('--offline', action='store_true', help='Enrich only from the columns of an itemized import.csv or report, without Stripe API calls')
+    parser.add_argument('--no-cache', action='store_true', help='Bypass the persistent enrichment cache')
+    parser.add_argument('--clear-cache', action='store_true', help='Clear the persistent enrichment cache before the run')
+    parser.add_argument('--accounts', type=str, help='JSON file with several Stripe accounts, exported in parallel processes')
+    parser.add_argument('--combined', action='store_true', help='Also write one combined export of all accounts (with --accounts)')
+    parser.add_argument('--output-format', choices=OUTPUT_FORMATS, action='append', help='Output format, repeat for several outputs of one run (default: lexoffice)')
+    parser.add_argument('--split-by', choices=['month', 'week', 'payout'], help='Write one export per month, week or payout of the range in a single pass')
+    parser.add_argument('--profile', action='store_true', help='Report time per stage, helper latencies, Stripe calls per object type and the slowest sources')
+    parser.add_argument('--host', type=str, default=SERVE_HOST, help='Address of the export daemon (serve)')
+    parser.add_argument('--port', type=int, default=SERVE_PORT, help='Port of the export daemon (serve)')
+    return parser
+
+
+def validate_args(args, start_date, end_date):
+    """
+    Checks the arguments against the current configuration
+    :param args: Parsed CLI arguments
+    :param start_date: Start date (datetime or None)
+    :param end_date: End date (datetime or None)
+    :return: Error message or None
+    """
+    if STRIPE_HTTP2 and (importlib.util.find_spec('httpx') is None or importlib.util.find_spec('h2') is None):
+        return "STRIPE_HTTP2 requires the 'httpx' package with HTTP/2 support, install it with pip install 'httpx[http2]'!"
+
+    if args.command == 'sync':
+        if args.offline:
+            return "sync resolves customers and descriptions from the Stripe API, remove --offline!"
+        return None
+
+    # Validation for API, REPORT and LEDGER method
+    if STRIPE_METHOD in ['API', 'REPORT', 'LEDGER'] and (not start_date or not end_date):
+        return (f"Start and end date are required for {STRIPE_METHOD} method!\n"
+                "Usage: python main.py --start-date 2024-01-01 --end-date 2024-01-31")
+    if STRIPE_METHOD == 'LEDGER' and (args.prefetch or args.engine == 'async'):
+        return "The ledger already contains the resolved transactions, remove --prefetch / --engine async!"
+
+    if FEE_GROUPING not in FEE_GROUPINGS:
+        return f"FEE_GROUPING must be one of {', '.join(FEE_GROUPINGS)}!"
+
+    if args.offline and STRIPE_METHOD not in ['CSV', 'REPORT']:
+        return "--offline is only available for the CSV and REPORT methods!"
+    if args.offline and (args.prefetch or args.engine == 'async'):
+        return "--offline does not call the Stripe API, remove --prefetch / --engine async!"
+
+    if args.combined and 'lexoffice' not in (args.output_format or ['lexoffice']):
+        return "--combined joins the LexOffice CSV files, add --output-format lexoffice!"
+    if args.split_by and args.resume:
+        return "Exports with --split-by can not be resumed, run the export again without --resume!"
+    if args.split_by and args.combined:
+        return "--combined joins one export file per account, remove --split-by!"
+    if args.split_by == 'payout' and 'parquet' in (args.output_format or []):
+        return ("--split-by payout closes and continues its files, which Parquet files do not support!\n"
+                "Possible solutions:\n"
+                "1. Split by month or week: --split-by month\n"
+                "2. Or use another format: --output-format jsonl")
+    return None
+
+
+def main():
+    """
+    Main function with CLI argument parsing
+    """
+    from dotenv import load_dotenv
+
+    # Load environment variables from .env file
+    load_dotenv()
+    configure(os.environ)
+
+    args = build_parser().parse_args()
     
     start_date = None
     end_date = None
@@ -614,174 +3607,697 @@ def main():
         start_date = parse_date(args.start_date)
     if args.end_date:
         end_date = parse_date(args.end_date)
-    
-    # Validation for API method
-    if STRIPE_METHOD == 'API' and (not start_date or not end_date):
-        print("Error: Start and end date are required for API method!")
-        print("Usage: python main.py --start-date 2024-01-01 --end-date 2024-01-31")
+
+    if args.command == 'serve':
+        try:
+            serve(args.host, args.port, os.environ.get('SERVE_TOKEN'))
+        except ValueError as e:
+            print(f"Error: {e}")
         return
-    
+
+    error = validate_args(args, start_date, end_date)
+    if error:
+        print(f"Error: {error}")
+        return
+
+    if args.accounts:
+        export_accounts(args, start_date, end_date)
+    elif args.command == 'sync':
+        run_sync(args, start_date, end_date)
+    else:
+        run_export(args, start_date, end_date)
+
+
+@releases_run_state
+def run_export(args, start_date, end_date, account: str = None, suffix: str = None):
+    """
+    Runs one export of the configured Stripe account
+    :param args: Parsed CLI arguments
+    :param start_date: Start date (datetime or None)
+    :param end_date: End date (datetime or None)
+    :param account: Account name in multi-account mode, part of the export filename
+    :param suffix: Appended to the export filenames, e.g. the request ID of the export daemon.
+                   Resumed exports continue their existing file and ignore it.
+    :return: Tuple (export filename or list of the filenames with --split-by, written lines)
+    """
+    reset_statistics()
     # Generate export filename
-    export_filename = generate_export_filename(start_date, end_date)
+    if args.resume and not (start_date and end_date):
+        export_filename = find_resumable_export(account)
+    else:
+        export_filename = generate_export_filename(start_date, end_date, account, suffix=None if args.resume else suffix)
+    checkpoint = load_checkpoint(export_filename) if args.resume else None
+    output_formats = list(dict.fromkeys(args.output_format or ['lexoffice']))
+    # All lines go to this partition, unless --split-by routes them to one partition per month, week or payout
+    partition = ExportPartition(export_filename, output_formats, checkpoint['fee_groups'] if checkpoint else None)
+    splitter = None
+    # Compressed and Parquet outputs and split exports can not be continued, the export then runs without checkpoints
+    resumable = all(sink.resumable for sink in partition.sinks) and not args.split_by
+    if checkpoint and checkpoint['output_formats'] != output_formats:
+        raise ValueError(
+            f"The checkpoint of '{export_filename}' was written with --output-format "
+            f"{' '.join(checkpoint['output_formats'])}. Use the same output formats to resume."
+        )
     
     print(f"Configuration:")
+    if account:
+        print(f"  Account: {account}{f' ({STRIPE_ACCOUNT})' if STRIPE_ACCOUNT else ''}")
     print(f"  STRIPE_METHOD: {STRIPE_METHOD}")
     print(f"  SUM_FEES: {SUM_FEES}")
-    print(f"  Export filename: {export_filename}")
+    if SUM_FEES and FEE_GROUPING != 'run':
+        print(f"  FEE_GROUPING: {FEE_GROUPING}")
+    if args.offline:
+        print("  Offline: enrichment from the itemized columns only")
+    if args.engine == 'async':
+        print(f"  Engine: async ({args.concurrency} concurrent requests)")
+    if STRIPE_METHOD == 'CSV' and args.parse_workers > 1:
+        print(f"  Parse workers: {args.parse_workers}")
+    if args.workers > 1:
+        print(f"  Workers: {args.workers} (max. {STRIPE_RATE_LIMIT:g} requests/s)")
+    if args.split_by:
+        print(f"  Split by: {args.split_by}")
+    else:
+        print(f"  Export filename: {export_filename}")
+    if output_formats != ['lexoffice'] and not args.split_by:
+        print(f"  Outputs: {', '.join(sink.filename for sink in partition.sinks)}")
+    if checkpoint:
+        print(f"  Resuming after {checkpoint['rows_processed']} processed transactions")
+    if STRIPE_METHOD == 'API' and args.shards > 1:
+        print(f"  Shards: {args.shards} (by {args.shard_by})")
+    if STRIPE_METHOD == 'API' and args.expand:
+        print(f"  Expand: {', '.join(BALANCE_TRANSACTION_EXPAND)}")
     if start_date and end_date:
         print(f"  Time range: {start_date.strftime('%Y-%m-%d')} to {end_date.strftime('%Y-%m-%d')}")
     
-    # Get transaction data
-    stripeCSV = get_transactions_data(start_date, end_date)
-    everhypeCSV = []
+    if args.profile:
+        PROFILER.enable()
+
+    if STRIPE_METHOD == 'LEDGER':
+        print(f"  Ledger: {LEDGER.path}")
+    elif not args.no_cache and not args.offline:
+        ENRICHMENT_CACHE.open(clear=args.clear_cache)
+        print(f"  Enrichment cache: {ENRICHMENT_CACHE.path}{' (cleared)' if args.clear_cache else ''}")
+
+    if args.prefetch:
+        with PROFILER.stage('prefetch'):
+            if STRIPE_METHOD in ['API', 'REPORT']:
+                prefetch_window(int(start_date.timestamp()), int(end_date.timestamp()))
+            else:
+                time_range = csv_time_range()
+                if time_range:
+                    prefetch_window(*time_range)
+
+    if STRIPE_METHOD == 'LEDGER':
+        # Customers and descriptions were already resolved by the sync command
+        transactions = PROFILER.timed('input', read_ledger(start_date, end_date, checkpoint))
+    else:
+        # Get transaction data
+        stripeCSV = PROFILER.timed('input', get_transactions_data(start_date, end_date, args.expand, checkpoint, args.shards, args.shard_by, args.parse_workers))
+
+        if args.engine == 'async':
+            print(f"Prefetching Stripe objects (async, {args.concurrency} concurrent requests)...")
+            stripeCSV = PROFILER.timed('async prefetch', prefetch_objects(stripeCSV, args.concurrency))
+        transactions = enrich_lines(stripeCSV, args.workers, args.offline)
+
+    # The output files are only created once the input delivers its first line, a missing import
+    # file or a failing listing leaves an existing export and its checkpoint untouched
+    transactions = iter(transactions)
+    first = next(transactions, None)
+    if first is not None:
+        transactions = itertools.chain([first], transactions)
     
-    # Variables for fee aggregation - separate by type
-    charge_fees = 0.0
-    payment_fees = 0.0
-    billing_usage_fees = 0.0
-    charge_fee_descriptions = []
-    payment_fee_descriptions = []
-    billing_fee_descriptions = []
-    fee_accounting_date = None
-    fee_value_date = None
-
-    for line in stripeCSV:
-        id = line[0]
-        transType = line[1]
-        source = line[2]
-        amount = line[3]
-
-        customer = getCustomerByPayment(source)
-        # --> created (utc)
-        accounting_date = line[9]
-        # --> available_on (utc)
-        value_date = line[10]
-        # --> description from original source or balance transaction
-        description = line[11]
-        
-        # Handle billing usage fees (stripe_fee) when SUM_FEES is enabled
-        if transType == 'stripe_fee' and SUM_FEES:
-            billing_usage_fees += abs(toMoney(amount))
-            billing_fee_descriptions.append(f'Billing fee {id}')
-            if fee_accounting_date is None:
-                fee_accounting_date = accounting_date
-                fee_value_date = value_date
-            # Skip adding to everhypeCSV - will be added as summary
-            continue
-        
-        # For refunds, payment_failure_refunds, payouts and stripe_fees, always use German descriptions
-        if transType in ['refund', 'payment_failure_refund', 'payout', 'stripe_fee', 'application_fee']:
-            description = createDefaultDescription(source, transType, toMoney(amount), customer, accounting_date, line[11])
-        else:
-            # If description is empty, try to get it from the original source
-            if not description or description.strip() == '':
-                description = getDescriptionFromSource(source, transType)
-            
-            # If still empty, create a default description
-            if not description or description.strip() == '':
-                description = createDefaultDescription(source, transType, toMoney(amount), customer, accounting_date, line[11])
-
-        # Determine if this is income (positive) or expense (negative)
-        amount_float = toMoney(amount)
-        soll_betrag = ""  # Debit amount (expense)
-        haben_betrag = ""  # Credit amount (income)
-        
-        if amount_float < 0:
-            soll_betrag = abs(amount_float)  # Expense (negative amount becomes positive in Soll)
+    lines_written = 0
+    rows_processed = 0
+    last_transaction_id = None
+
+    if checkpoint:
+        lines_written = checkpoint['lines_written']
+        rows_processed = checkpoint['rows_processed']
+        last_transaction_id = checkpoint['last_transaction_id']
+
+    def checkpoint_state():
+        # Everything needed to continue the export after the last fully processed line
+        return {
+            'stripe_method': STRIPE_METHOD,
+            'sum_fees': SUM_FEES,
+            'fee_grouping': FEE_GROUPING,
+            'output_formats': output_formats,
+            'sink_bytes': {sink.output_format: sink.position() for sink in partition.sinks},
+            'lines_written': lines_written,
+            'rows_processed': rows_processed,
+            'last_transaction_id': last_transaction_id,
+            'fee_groups': partition.fees.state(),
+        }
+
+    # Rows are written to all outputs while the input is processed instead of being collected in memory
+    with PROFILER.stage('output'), contextlib.ExitStack() as outputs:
+        if args.split_by:
+            splitter = ExportSplitter(args.split_by, start_date, end_date, account, output_formats, outputs, suffix)
         else:
-            haben_betrag = amount_float  # Income (positive amount stays positive in Haben)
+            partition.open(outputs, checkpoint['sink_bytes'] if checkpoint else None)
+
+        try:
+            for line, customer, description in PROFILER.timed('enrichment', transactions):
+                if resumable and rows_processed % CHECKPOINT_INTERVAL == 0:
+                    save_checkpoint(export_filename, checkpoint_state())
+                rows_processed += 1
+                last_transaction_id = line[0]
+                if splitter is not None:
+                    partition = splitter.partition(line)
+
+                id = line[0]
+                transType = line[1]
+                amount = line[3]
+                # --> created (utc)
+                accounting_date = line[9]
+                # --> available_on (utc)
+                value_date = line[10]
         
-        everhypeCSV.append([
-            accounting_date,  # Buchungsdatum
-            customer,         # Auftraggeber / Empfänger
-            description,      # Verwendungszweck
-            amount_float,     # Betrag (original amount)
-            soll_betrag,      # Soll Betrag (Ausgabe)
-            haben_betrag,     # Haben Betrag (Einnahme)
-            value_date,       # Wertstellungsdatum
-        ])
+                # Handle billing usage fees (stripe_fee) when SUM_FEES is enabled
+                if transType == 'stripe_fee' and SUM_FEES:
+                    partition.fees.add(FeeAggregator.BILLING, abs(amount), line, accounting_date, value_date)
+                    # Skip writing the line - will be added as summary
+                    continue
 
-        # Processing fee handling (from fee column)
-        if line[4] != '0,00':
-            fee_amount = toMoney(line[4])
-            
-            if SUM_FEES:
-                # Categorize fees by transaction type
-                if transType == 'charge':
-                    charge_fees += fee_amount
-                    charge_fee_descriptions.append(f'Processing fee for charge {id}')
-                elif transType == 'payment':
-                    payment_fees += fee_amount
-                    payment_fee_descriptions.append(f'Processing fee for payment {id}')
+                # Customers repeat across many lines, buffered lines (e.g. Parquet row groups) share one string
+                if customer:
+                    customer = sys.intern(customer)
+
+                # Determine if this is income (positive) or expense (negative)
+                if amount < 0:
+                    # Expense, the negative amount becomes positive in Soll
+                    partition.write(ExportLine(accounting_date, customer, description, amount, -amount, None, value_date))
                 else:
-                    # Fallback for other types (refunds, etc.)
-                    if transType == 'charge':
-                        charge_fees += fee_amount
-                        charge_fee_descriptions.append(f'Fee for {transType} {id}')
+                    # Income, the positive amount stays positive in Haben
+                    partition.write(ExportLine(accounting_date, customer, description, amount, None, amount, value_date))
+                lines_written += 1
+
+                # Processing fee handling (from fee column)
+                if line[4]:
+                    fee_amount = line[4]
+            
+                    if SUM_FEES:
+                        # Categorize fees by transaction type, other types (refunds, etc.) count as payments
+                        kind = FeeAggregator.CHARGE if transType == 'charge' else FeeAggregator.PAYMENT
+                        partition.fees.add(kind, fee_amount, line, accounting_date, value_date)
                     else:
-                        payment_fees += fee_amount
-                        payment_fee_descriptions.append(f'Fee for {transType} {id}')
+                        # Create individual fee line (original behavior)
+                        fee_description = f'Fees for payment {id} -- {description}'
                 
-                if fee_accounting_date is None:
-                    fee_accounting_date = accounting_date
-                    fee_value_date = value_date
+                        # Fees are always expenses (Soll)
+                        partition.write(ExportLine(accounting_date, STRIPE_NAME, fee_description, -fee_amount, abs(fee_amount), None, value_date))
+                        lines_written += 1
+
+        except BaseException:
+            # Keep the progress of interrupted runs (errors, rate limits, Ctrl+C)
+            if resumable:
+                save_checkpoint(export_filename, checkpoint_state())
+                print(f"Export interrupted after {rows_processed} transactions. Continue with --resume.")
+            elif args.split_by:
+                print(f"Export interrupted after {rows_processed} transactions. Exports with --split-by can not be resumed.")
             else:
-                # Create individual fee line (original behavior)
-                fee_description = f'Fees for payment {id} -- {description}'
-                
-                everhypeCSV.append([
-                    accounting_date,  # Buchungsdatum
-                    STRIPE_NAME,      # Auftraggeber / Empfänger
-                    fee_description,  # Verwendungszweck
-                    round(fee_amount * -1, 2),  # Betrag
-                    abs(fee_amount),  # Soll Betrag (Ausgabe) - fees are always expenses
-                    "",               # Haben Betrag (Einnahme)
-                    value_date,       # Wertstellungsdatum
-                ])
-
-    # If SUM_FEES is enabled, add separate summarized lines for each fee type
-    if SUM_FEES:
-        if charge_fees > 0:
-            everhypeCSV.append([
-                fee_accounting_date,  # Buchungsdatum
-                STRIPE_NAME,          # Auftraggeber / Empfänger
-                'Stripe Processing Fees for Charges',  # Verwendungszweck
-                round(charge_fees * -1, 2),  # Betrag
-                charge_fees,          # Soll Betrag (Ausgabe) - fees are always expenses
-                "",                   # Haben Betrag (Einnahme)
-                fee_value_date,       # Wertstellungsdatum
-            ])
-        
-        if payment_fees > 0:
-            everhypeCSV.append([
-                fee_accounting_date,  # Buchungsdatum
-                STRIPE_NAME,          # Auftraggeber / Empfänger
-                'Stripe Processing Fees for Payments',  # Verwendungszweck
-                round(payment_fees * -1, 2),  # Betrag
-                payment_fees,         # Soll Betrag (Ausgabe) - fees are always expenses
-                "",                   # Haben Betrag (Einnahme)
-                fee_value_date,       # Wertstellungsdatum
-            ])
-        
-        if billing_usage_fees > 0:
-            everhypeCSV.append([
-                fee_accounting_date,  # Buchungsdatum
-                STRIPE_NAME,          # Auftraggeber / Empfänger
-                'Billing Usage Fee',  # Verwendungszweck
-                round(billing_usage_fees * -1, 2),  # Betrag
-                billing_usage_fees,   # Soll Betrag (Ausgabe) - fees are always expenses
-                "",                   # Haben Betrag (Einnahme)
-                fee_value_date,       # Wertstellungsdatum
-            ])
-
-    # Writing to export file
-    with open(export_filename, 'w', newline='', encoding='utf-8') as exportFile:
-        writer = csv.writer(exportFile, delimiter=';')
-
-        writer.writerow(csv_header())
-        writer.writerows(everhypeCSV)
-    
-    print(f"Export completed! {len(everhypeCSV)} lines written to {export_filename}.")
+                print(f"Export interrupted after {rows_processed} transactions. Compressed and Parquet outputs can not be resumed.")
+            raise
+
+        partitions = list(splitter.partitions.values()) if splitter else [partition]
+        # If SUM_FEES is enabled, add separate summarized lines for each fee type and group of every partition
+        for partition in partitions:
+            if SUM_FEES:
+                if not partition.is_open:
+                    partition.reopen()
+                for export_line in partition.fees.rows():
+                    partition.write(export_line)
+                    lines_written += 1
+            if splitter is not None:
+                partition.close()
+
+    # The export is complete, it can no longer be resumed
+    if os.path.exists(checkpoint_filename(export_filename)):
+        os.remove(checkpoint_filename(export_filename))
+
+    if splitter is None:
+        print(f"Export completed! {lines_written} lines written to {', '.join(sink.filename for sink in partition.sinks)}.")
+    else:
+        print(f"Export completed! {lines_written} lines written to {len(partitions)} exports by {args.split_by}:")
+        for partition in partitions:
+            print(f"  {', '.join(sink.filename for sink in partition.sinks)}: {partition.lines_written} lines")
+    print(f"Stripe object cache: {OBJECT_CACHE.summary()}")
+    print(f"Stripe API: {CALL_STATS.summary()}")
+    if CALL_STATS.calls:
+        print(f"HTTP connections: {HTTP_POOL.summary()}")
+    if CALL_STATS.degraded_rows:
+        print(f"Warning: {CALL_STATS.degraded_rows} transactions contain fallback values because Stripe calls failed: "
+              f"{', '.join(CALL_STATS.degraded_ids)}{', ...' if CALL_STATS.degraded_rows > len(CALL_STATS.degraded_ids) else ''}")
+    if ENRICHMENT_CACHE.enabled:
+        print(f"Enrichment cache: {ENRICHMENT_CACHE.summary()}")
+    if PROFILER.enabled:
+        print(PROFILER.summary())
+        with open(profile_filename(export_filename), 'w', encoding='utf-8') as profileFile:
+            json.dump(PROFILER.report(), profileFile, indent=2)
+        print(f"Profile written to {profile_filename(export_filename)}")
+    if splitter is not None:
+        return [partition.export_filename for partition in partitions], lines_written
+    return export_filename, lines_written
+
+
+@releases_run_state
+def run_sync(args, start_date, end_date, account: str = None):
+    """
+    Adds the balance transactions since the last completed sync to the local ledger and resolves
+    their customers and descriptions, e.g. nightly from cron
+    :param args: Parsed CLI arguments
+    :param start_date: Start date (datetime), defaults to the end of the last completed sync
+    :param end_date: End date (datetime), defaults to now
+    :param account: Account name in multi-account mode
+    :return: Tuple (ledger filename, new transactions)
+    """
+    reset_statistics()
+
+    LEDGER.open()
+    synced = LEDGER.synced_range()
+    if start_date is None:
+        if synced is None:
+            raise ValueError(
+                f"The ledger '{LEDGER.path}' is empty!\n"
+                "Possible solutions:\n"
+                "1. Pass --start-date for the first sync, e.g. python main.py sync --start-date 2024-01-01"
+            )
+        start_date = datetime.strptime(synced[1], '%Y-%m-%d %H:%M:%S')
+    if end_date is None:
+        end_date = datetime.now().replace(microsecond=0)
+
+    print("Configuration:")
+    if account:
+        print(f"  Account: {account}{f' ({STRIPE_ACCOUNT})' if STRIPE_ACCOUNT else ''}")
+    print(f"  Ledger: {LEDGER.path}")
+    if synced:
+        print(f"  Synced so far: {', '.join(f'{synced_from} to {synced_until}' for synced_from, synced_until in LEDGER.synced_ranges())}")
+    if args.engine == 'async':
+        print(f"  Engine: async ({args.concurrency} concurrent requests)")
+    if args.workers > 1:
+        print(f"  Workers: {args.workers} (max. {STRIPE_RATE_LIMIT:g} requests/s)")
+    if args.shards > 1:
+        print(f"  Shards: {args.shards} (by {args.shard_by})")
+
+    if args.profile:
+        PROFILER.enable()
+
+    if not args.no_cache:
+        ENRICHMENT_CACHE.open(clear=args.clear_cache)
+        print(f"  Enrichment cache: {ENRICHMENT_CACHE.path}{' (cleared)' if args.clear_cache else ''}")
+
+    # Transactions with fallback values of earlier syncs are resolved again
+    retry = LEDGER.degraded_lines()
+    if retry:
+        print(f"Resolving {len(retry)} transactions with fallback values again...")
+    # The range starts at the second of the last cursor, transactions already in the ledger are skipped
+    listing = fetch_balance_transactions(start_date, end_date, args.expand, None, args.shards, args.shard_by)
+    lines = PROFILER.timed('input', itertools.chain(retry, (line for line in listing if not LEDGER.contains(line[0]))))
+
+    if args.engine == 'async':
+        print(f"Prefetching Stripe objects (async, {args.concurrency} concurrent requests)...")
+        lines = PROFILER.timed('async prefetch', prefetch_objects(lines, args.concurrency))
+
+    try:
+        with PROFILER.stage('output'):
+            for line, customer, description, degraded in PROFILER.timed('enrichment', enrich_lines(lines, args.workers, enrich=enrich_ledger_line)):
+                LEDGER.add(line, customer, description, degraded)
+            # Only a completed sync moves the cursor, the listing is newest first
+            LEDGER.complete_sync(start_date.strftime('%Y-%m-%d %H:%M:%S'), end_date.strftime('%Y-%m-%d %H:%M:%S'))
+    except BaseException:
+        print(f"Sync interrupted after {LEDGER.added} new transactions. The next sync lists the same range again.")
+        raise
+    finally:
+        LEDGER.close()
+
+    print(f"Sync completed! Ledger: {LEDGER.summary()}")
+    print(f"Stripe object cache: {OBJECT_CACHE.summary()}")
+    print(f"Stripe API: {CALL_STATS.summary()}")
+    if CALL_STATS.calls:
+        print(f"HTTP connections: {HTTP_POOL.summary()}")
+    if CALL_STATS.degraded_rows:
+        print(f"Warning: {CALL_STATS.degraded_rows} transactions contain fallback values because Stripe calls failed, "
+              f"the next sync resolves them again: "
+              f"{', '.join(CALL_STATS.degraded_ids)}{', ...' if CALL_STATS.degraded_rows > len(CALL_STATS.degraded_ids) else ''}")
+    if ENRICHMENT_CACHE.enabled:
+        print(f"Enrichment cache: {ENRICHMENT_CACHE.summary()}")
+    if PROFILER.enabled:
+        print(PROFILER.summary())
+        with open(profile_filename(LEDGER.path), 'w', encoding='utf-8') as profileFile:
+            json.dump(PROFILER.report(), profileFile, indent=2)
+        print(f"Profile written to {profile_filename(LEDGER.path)}")
+    return LEDGER.path, LEDGER.added
+
+
+def load_accounts(path: str):
+    """
+    Reads the multi-account configuration, e.g.
+    {"accounts": [{"name": "shop", "key": "sk_live_...", "stripe_name": "...", "stripe_account": "acct_...", "import_file": "shop.csv"}]}
+    Only name is required, the other values default to the .env configuration.
+    :param path: JSON file
+    :return: List of account dicts
+    """
+    with open(path, encoding='utf-8') as accountsFile:
+        accounts = json.load(accountsFile).get('accounts', [])
+    names = [account.get('name') for account in accounts]
+    if not accounts or not all(names) or len(set(names)) != len(names):
+        raise ValueError(f"'{path}' must contain a list 'accounts' with a unique 'name' for every account!")
+    for name in names:
+        if not re.fullmatch(r'[A-Za-z0-9_.-]+', name):
+            raise ValueError(f"Invalid account name '{name}', use letters, digits, '.', '_' and '-' only.")
+    return accounts
+
+
+def use_account(account: dict):
+    """
+    Switches the configuration of this process to one account of the multi-account mode.
+    Every account runs in its own process, so the module-level configuration is never shared.
+    :param account: Account dict from the configuration file
+    """
+    global STRIPE_KEY, STRIPE_NAME, STRIPE_ACCOUNT, IMPORT_FILE
+    STRIPE_KEY = account.get('key', STRIPE_KEY)
+    STRIPE_NAME = account.get('stripe_name', STRIPE_NAME)
+    STRIPE_ACCOUNT = account.get('stripe_account', STRIPE_ACCOUNT)
+    IMPORT_FILE = account.get('import_file', IMPORT_FILE)
+    # Resolved customers and descriptions belong to one account
+    root, extension = os.path.splitext(ENRICHMENT_CACHE_FILE)
+    ENRICHMENT_CACHE.path = f"{root}.{account['name']}{extension}"
+    root, extension = os.path.splitext(LEDGER_FILE)
+    LEDGER.path = f"{root}.{account['name']}{extension}"
+
+
+def _run_account(account: dict, settings: dict, args, start_date, end_date):
+    """
+    Entry point of an account process
+    :param settings: Configuration of the parent process, the base of the account configuration
+    :return: Tuple (export filename(s), written lines) or (ledger filename, new transactions) for sync
+    """
+    configure(**settings)
+    use_account(account)
+    if args.command == 'sync':
+        return run_sync(args, start_date, end_date, account['name'])
+    return run_export(args, start_date, end_date, account['name'])
+
+
+def export_accounts(args, start_date, end_date):
+    """
+    Exports several Stripe accounts in parallel, one process per account with its own client,
+    rate limiter, caches and export file. A slow or failing account does not hold up the others.
+    :param args: Parsed CLI arguments
+    :param start_date: Start date (datetime or None)
+    :param end_date: End date (datetime or None)
+    """
+    accounts = load_accounts(args.accounts)
+    print(f"{'Syncing' if args.command == 'sync' else 'Exporting'} {len(accounts)} accounts in parallel: "
+          f"{', '.join(account['name'] for account in accounts)}")
+
+    results = {}
+    settings = current_settings()
+    with ProcessPoolExecutor(max_workers=len(accounts)) as executor:
+        futures = {
+            executor.submit(_run_account, account, settings, args, start_date, end_date): account['name']
+            for account in accounts
+        }
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                results[name] = future.result()
+                if args.command == 'sync':
+                    print(f"Account {name}: {results[name][1]} new transactions synced to {results[name][0]}.")
+                else:
+                    exports = results[name][0]
+                    print(f"Account {name}: {results[name][1]} lines written to "
+                          f"{', '.join(exports) if isinstance(exports, list) else exports}.")
+            except Exception as e:
+                print(f"Account {name} failed: {e}")
+
+    if args.combined and results and args.command == 'export':
+        combined_filename = generate_export_filename(start_date, end_date, 'combined')
+        with open(combined_filename, 'w', newline='', encoding='utf-8') as combinedFile:
+            writer = csv.writer(combinedFile, delimiter=';')
+            writer.writerow(csv_header())
+            lines = 0
+            for account in accounts:
+                if account['name'] not in results:
+                    continue
+                with open(results[account['name']][0], newline='', encoding='utf-8') as exportFile:
+                    reader = csv.reader(exportFile, delimiter=';')
+                    next(reader, None)
+                    for row in reader:
+                        writer.writerow(row)
+                        lines += 1
+        print(f"Combined export: {lines} lines of {len(results)} accounts written to {combined_filename}.")
+
+    failed = [account['name'] for account in accounts if account['name'] not in results]
+    if failed:
+        print(f"Warning: {len(failed)} accounts failed: {', '.join(failed)}. Interrupted exports can be continued with --resume.")
+
+
+class Converter:
+    """
+    Importable converter with an explicit configuration instead of the .env file, e.g.
+    Converter(STRIPE_KEY='sk_live_...', STRIPE_METHOD='API').export('2024-01-01', '2024-01-31', workers=8)
+    Converters can be reused and share the warm Stripe object cache of the process. The configuration
+    is module-level, so the exports of one process run one after another, and the configuration of the
+    process is restored after each run.
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(self, environ=None, **settings):
+        """
+        :param environ: Environment variables (e.g. os.environ), None applies the defaults only
+        :param settings: Explicit settings by name, e.g. STRIPE_METHOD='API', override environ
+        """
+        unknown = sorted(set(settings) - set(SETTINGS))
+        if unknown:
+            raise ValueError(f"Unknown settings: {', '.join(unknown)}. Available: {', '.join(SETTINGS)}")
+        self.environ = dict(environ) if environ is not None else None
+        self.settings = settings
+
+    def export(self, start_date=None, end_date=None, suffix: str = None, **options):
+        """
+        Runs one export
+        :param start_date: Start date (YYYY-MM-DD, datetime or None)
+        :param end_date: End date (YYYY-MM-DD, datetime or None)
+        :param suffix: Appended to the export filenames, e.g. to keep exports of the same range apart
+        :param options: CLI options by their argument name, e.g. workers=8, output_format=['jsonl']
+        :return: Tuple (export filename, written lines)
+        """
+        return self._run('export', start_date, end_date, options, suffix)
+
+    def sync(self, start_date=None, end_date=None, **options):
+        """
+        Updates the local ledger
+        :param start_date: Start date (YYYY-MM-DD, datetime or None), defaults to the end of the last completed sync
+        :param end_date: End date (YYYY-MM-DD, datetime or None), defaults to now
+        :param options: CLI options by their argument name, e.g. workers=8
+        :return: Tuple (ledger filename, new transactions)
+        """
+        return self._run('sync', start_date, end_date, options)
+
+    def _run(self, command: str, start_date, end_date, options: dict, suffix: str = None):
+        args = build_parser().parse_args([command])
+        for name, value in options.items():
+            if name in ['command', 'start_date', 'end_date', 'host', 'port'] or not hasattr(args, name):
+                raise ValueError(f"Unknown option '{name}'")
+            setattr(args, name, value)
+        if args.accounts:
+            raise ValueError("The accounts option is only available on the command line, use one Converter per account.")
+        if isinstance(start_date, str):
+            start_date = parse_date(start_date)
+        if isinstance(end_date, str):
+            end_date = parse_date(end_date)
+
+        with Converter._lock:
+            # The settings of this converter must not leak into later runs of other converters or daemon requests
+            previous = current_settings()
+            try:
+                configure(self.environ, **self.settings)
+                error = validate_args(args, start_date, end_date)
+                if error:
+                    raise ValueError(error)
+                if command == 'sync':
+                    return run_sync(args, start_date, end_date)
+                return run_export(args, start_date, end_date, suffix=suffix)
+            finally:
+                configure(**previous)
+
+
+class RequestRejected(Exception):
+    """
+    A request of the export daemon that is not executed, with the HTTP status of the answer
+    """
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def check_request_access(headers, token: str = None):
+    """
+    Checks the headers of a daemon request. Browsers send an Origin header with every cross-origin
+    POST, the daemon serves no pages, so any Origin is foreign.
+    :param headers: Request headers
+    :param token: Bearer token of the daemon (SERVE_TOKEN), None on localhost without authentication
+    """
+    if token:
+        authorization = headers.get('Authorization') or ''
+        if not hmac.compare_digest(authorization.encode('utf-8'), f'Bearer {token}'.encode('utf-8')):
+            raise RequestRejected(401, "Missing or invalid bearer token")
+    if headers.get('Origin') is not None:
+        raise RequestRejected(403, "Cross-origin requests are not allowed")
+
+
+def parse_export_request(headers, body: bytes, token: str = None):
+    """
+    Validates a POST /export request of the daemon. Only the settings in DAEMON_SETTINGS and
+    the options in DAEMON_OPTIONS can be changed per request.
+    :param headers: Request headers
+    :param body: Request body
+    :param token: Bearer token of the daemon (SERVE_TOKEN)
+    :return: Tuple (start date, end date, options, settings)
+    """
+    check_request_access(headers, token)
+    content_type = (headers.get('Content-Type') or '').split(';')[0].strip().lower()
+    if content_type != 'application/json':
+        raise RequestRejected(415, "Content-Type must be application/json")
+    try:
+        request = json.loads(body or b'{}')
+    except ValueError as e:
+        raise RequestRejected(400, f"Invalid JSON: {e}")
+    if not isinstance(request, dict):
+        raise RequestRejected(400, "The request must be a JSON object")
+
+    values = {}
+    for field, allowed in [('options', DAEMON_OPTIONS), ('settings', DAEMON_SETTINGS)]:
+        value = request.get(field, {})
+        if not isinstance(value, dict):
+            raise RequestRejected(400, f"'{field}' must be an object")
+        rejected = sorted(set(value) - set(allowed))
+        if rejected:
+            raise RequestRejected(400, f"{field.capitalize()} not allowed per request: {', '.join(rejected)}. "
+                                       f"Allowed: {', '.join(allowed)}")
+        values[field] = value
+    for field in ['start_date', 'end_date']:
+        if request.get(field) is not None and not isinstance(request[field], str):
+            raise RequestRejected(400, f"'{field}' must be a date string (YYYY-MM-DD)")
+    return request.get('start_date'), request.get('end_date'), values['options'], values['settings']
+
+
+class ExportRequestHandler(BaseHTTPRequestHandler):
+    """
+    HTTP endpoint of the export daemon:
+    POST /export {"start_date": "2024-01-01", "end_date": "2024-01-31", "options": {...}, "settings": {...}}
+    GET /health
+    """
+
+    def do_GET(self):
+        if self.path != '/health':
+            self._respond(404, {'error': f"Unknown path '{self.path}'"})
+            return
+        try:
+            check_request_access(self.headers, self.server.token)
+        except RequestRejected as e:
+            self._respond(e.status, {'error': str(e)})
+            return
+        self._respond(200, {
+            'status': 'ok',
+            'exports': self.server.exports,
+            'object_cache': OBJECT_CACHE.summary(),
+            'http_connections': HTTP_POOL.summary(),
+        })
+
+    def do_POST(self):
+        if self.path != '/export':
+            self._respond(404, {'error': f"Unknown path '{self.path}'"})
+            return
+        try:
+            body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            start_date, end_date, options, settings = parse_export_request(self.headers, body, self.server.token)
+            converter = Converter(self.server.environ, **settings)
+        except RequestRejected as e:
+            self._respond(e.status, {'error': str(e)})
+            return
+        except (ValueError, TypeError) as e:
+            self._respond(400, {'error': str(e)})
+            return
+
+        started = time.perf_counter()
+        # Every request writes its own files, requests of the same range or second do not overwrite each other
+        request_id = uuid.uuid4().hex[:12]
+        # All exports run on the worker thread of the daemon, which keeps its Stripe connections open
+        future = self.server.worker.submit(converter.export, start_date, end_date, request_id, **options)
+        try:
+            export_filename, lines_written = future.result()
+        except (ValueError, FileNotFoundError) as e:
+            self._respond(400, {'error': str(e), 'request_id': request_id})
+            return
+        except Exception as e:
+            self._respond(500, {'error': f"{type(e).__name__}: {e}", 'request_id': request_id})
+            return
+        self.server.exports += 1
+        self._respond(200, {
+            'request_id': request_id,
+            'export_filename': export_filename,
+            'lines_written': lines_written,
+            'seconds': round(time.perf_counter() - started, 3),
+        })
+
+    def _respond(self, status: int, body: dict):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def is_loopback(host: str):
+    """
+    :param host: Listen address
+    :return: True if only the local machine can connect
+    """
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def serve(host: str = SERVE_HOST, port: int = SERVE_PORT, token: str = None):
+    """
+    Runs the export daemon. Between the exports the Stripe connections, the object cache and the
+    imported modules stay warm, so repeated small exports do not pay the startup costs again.
+    Without a token the daemon only listens on localhost.
+    :param host: Listen address
+    :param port: Listen port
+    :param token: Bearer token required by every request (SERVE_TOKEN)
+    """
+    if not token and not is_loopback(host):
+        raise ValueError(
+            f"The export daemon would accept requests from other machines on '{host}' without authentication!\n"
+            "Possible solutions:\n"
+            "1. Set a bearer token: SERVE_TOKEN=... in the .env file\n"
+            "2. Or listen on localhost only: --host 127.0.0.1"
+        )
+    server = ThreadingHTTPServer((host, port), ExportRequestHandler)
+    # Every export request is based on the configuration the daemon was started with
+    server.environ = dict(os.environ)
+    server.token = token
+    server.worker = ThreadPoolExecutor(max_workers=1)
+    server.exports = 0
+    print(f"Export daemon listening on http://{host}:{port} (POST /export, GET /health)"
+          f"{', bearer token required' if token else ''}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        server.worker.shutdown()
+        print(f"Export daemon stopped after {server.exports} exports.")
 
 
 # Run the script
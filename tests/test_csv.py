@@ -0,0 +1,100 @@
+import csv
+
+import pytest
+
+import main
+
+
+@pytest.mark.parametrize('text, cents', [
+    ('0,00', 0),
+    ('1,5', 150),
+    ('12,34', 1234),
+    ('-12,34', -1234),
+    ('1.234,56', 123456),
+    ('-1.234.567,89', -123456789),
+    ('1.234', 123400),
+    ('-0,05', -5),
+])
+def test_to_cents_german(text, cents):
+    assert main.to_cents(text) == cents
+
+
+@pytest.mark.parametrize('text, cents', [
+    ('0.00', 0),
+    ('1234.56', 123456),
+    ('-1234.56', -123456),
+    ('1.5', 150),
+    ('-0.05', -5),
+    ('42', 4200),
+])
+def test_to_cents_decimal_point(text, cents):
+    assert main.to_cents(text, decimal_comma=False) == cents
+
+
+@pytest.mark.parametrize('cents', [0, 1, 5, 10, 99, 100, 105, 1050, 123456, -1, -5, -1234, -123456789])
+def test_format_cents_round_trip(cents):
+    assert main.to_cents(main.format_cents(cents), decimal_comma=False) == cents
+    assert main.to_cents(main.format_cents_german(cents)) == cents
+
+
+def test_format_cents():
+    assert main.format_cents(10550) == '105.5'
+    assert main.format_cents(-1234) == '-12.34'
+    assert main.format_cents(10000) == '100.0'
+    assert main.format_cents_german(10591) == '105,91'
+
+
+DASHBOARD_HEADER = [
+    'id', 'Type', 'Source', 'Amount', 'Fee', 'Currency', 'Net', 'Reporting Category',
+    'Customer Facing Amount', 'Created (UTC)', 'Available On (UTC)', 'Description',
+]
+
+
+def test_row_mapper_detects_format_per_file():
+    dashboard = main.compile_row_mapper(DASHBOARD_HEADER)
+    row = ['txn_1', 'charge', 'ch_1', '1.234', '0,30', 'eur', '', 'charge', '', '2024-01-01 10:00:00', '', '']
+    assert dashboard(row)[3:5] == [123400, 30]
+
+    report = main.compile_row_mapper(['balance_transaction_id', 'created_utc', 'gross', 'fee', 'reporting_category'])
+    line = report(['txn_1', '2024-01-01 10:00:00', '1.234', '0.30', 'fee'])
+    assert line[:5] == ['txn_1', 'stripe_fee', '', 123, 30]
+
+
+def write_import_csv(path, rows):
+    with open(path, 'w', newline='', encoding='utf-8') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(DASHBOARD_HEADER)
+        writer.writerows(rows)
+
+
+def import_rows(count):
+    rows = []
+    for i in range(count):
+        # Quoted fields with newlines and escaped quotes must never be split between chunks
+        description = f'Zahlung {i}\nmit "Zeilenumbruch"\n' if i % 3 == 0 else f'Zahlung {i}'
+        rows.append([f'txn_{i}', 'charge', f'ch_{i}', f'{i},{i % 100:02d}', '0,25', 'eur', '', 'charge', '',
+                     f'2024-01-01 00:{i % 60:02d}:00', '2024-01-03 00:00:00', description])
+    return rows
+
+
+@pytest.mark.parametrize('chunk_bytes', [1, 7, 64, 1000, 10 ** 6])
+def test_csv_chunks_end_on_record_boundaries(tmp_path, chunk_bytes):
+    path = str(tmp_path / 'import.csv')
+    write_import_csv(path, import_rows(40))
+
+    header, chunks = main.csv_chunks(path, chunk_bytes)
+    assert header == DASHBOARD_HEADER
+    # The chunks cover the file after the header without gaps or overlaps
+    for (_, end), (start, _) in zip(chunks, chunks[1:]):
+        assert end == start
+
+    lines = [line for start, end in chunks for line in main.parse_csv_chunk(path, header, start, end)]
+    assert lines == list(main._iter_csv_lines(path))
+    assert [line[0] for line in lines] == [f'txn_{i}' for i in range(40)]
+    assert lines[0][11] == 'Zahlung 0\nmit "Zeilenumbruch"\n'
+
+
+def test_csv_chunks_empty_file(tmp_path):
+    path = tmp_path / 'import.csv'
+    path.write_bytes(b'')
+    assert main.csv_chunks(str(path)) == (None, [])
@@ -0,0 +1,78 @@
+import json
+
+import pytest
+
+import main
+
+JSON_HEADERS = {'Content-Type': 'application/json'}
+
+
+def body(**request):
+    return json.dumps(request).encode('utf-8')
+
+
+def rejected_status(headers, data, token=None):
+    with pytest.raises(main.RequestRejected) as error:
+        main.parse_export_request(headers, data, token)
+    return error.value.status
+
+
+def test_valid_request():
+    data = body(start_date='2024-01-01', end_date='2024-01-31',
+                options={'output_format': ['jsonl']}, settings={'SUM_FEES': True, 'FEE_GROUPING': 'month'})
+    assert main.parse_export_request({'Content-Type': 'application/json; charset=utf-8'}, data) == (
+        '2024-01-01', '2024-01-31', {'output_format': ['jsonl']}, {'SUM_FEES': True, 'FEE_GROUPING': 'month'}
+    )
+    assert main.parse_export_request(JSON_HEADERS, b'') == (None, None, {}, {})
+
+
+@pytest.mark.parametrize('content_type', [None, 'text/plain', 'application/x-www-form-urlencoded'])
+def test_requires_json_content_type(content_type):
+    headers = {'Content-Type': content_type} if content_type else {}
+    assert rejected_status(headers, body()) == 415
+
+
+def test_rejects_cross_origin_requests():
+    assert rejected_status({**JSON_HEADERS, 'Origin': 'https://example.com'}, body()) == 403
+
+
+@pytest.mark.parametrize('authorization', [None, 'Bearer wrong', 'secret'])
+def test_requires_bearer_token(authorization):
+    headers = dict(JSON_HEADERS, **({'Authorization': authorization} if authorization else {}))
+    assert rejected_status(headers, body(), token='secret') == 401
+
+
+def test_accepts_bearer_token():
+    headers = {**JSON_HEADERS, 'Authorization': 'Bearer secret'}
+    assert main.parse_export_request(headers, body(start_date='2024-01-01'), 'secret')[0] == '2024-01-01'
+
+
+@pytest.mark.parametrize('request_body', [
+    body(settings={'STRIPE_KEY': 'sk_live_other'}),
+    body(settings={'STRIPE_API_BASE': 'http://attacker.example'}),
+    body(settings={'IMPORT_FILE': '/etc/passwd'}),
+    body(options={'accounts': ['a']}),
+    body(settings=['SUM_FEES']),
+    body(start_date=20240101),
+    b'[]',
+    b'{invalid',
+])
+def test_rejects_invalid_requests(request_body):
+    assert rejected_status(JSON_HEADERS, request_body) == 400
+
+
+def test_rejection_names_allowed_settings():
+    with pytest.raises(main.RequestRejected, match='STRIPE_KEY.*Allowed: SUM_FEES'):
+        main.parse_export_request(JSON_HEADERS, body(settings={'STRIPE_KEY': 'sk_live_other'}))
+
+
+@pytest.mark.parametrize('host, loopback', [
+    ('127.0.0.1', True), ('::1', True), ('localhost', True), ('0.0.0.0', False), ('192.168.1.10', False),
+])
+def test_is_loopback(host, loopback):
+    assert main.is_loopback(host) is loopback
+
+
+def test_serve_refuses_public_host_without_token():
+    with pytest.raises(ValueError, match='without authentication'):
+        main.serve('0.0.0.0', 0)
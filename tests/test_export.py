@@ -0,0 +1,177 @@
+import contextlib
+import json
+from datetime import datetime
+
+import pytest
+
+import main
+
+
+def export_line(description, amount=100):
+    return main.ExportLine('2024-01-01', 'Kunde', description, amount, None, amount, '2024-01-03')
+
+
+def transaction_line(created, available_on='', payout=''):
+    line = [''] * 19
+    line[9] = created
+    line[10] = available_on
+    line[18] = payout
+    return line
+
+
+@pytest.mark.parametrize('sink_class, output_format', [(main.LexOfficeSink, 'lexoffice'), (main.JsonlSink, 'jsonl')])
+def test_resume_truncates_rows_after_checkpoint(tmp_path, sink_class, output_format):
+    filename = str(tmp_path / f'export{sink_class.extension}')
+    sink = sink_class(filename, output_format)
+    sink.open()
+    sink.write(export_line('first'))
+    checkpoint = sink.position()
+    # Written after the checkpoint, processed again by the resumed run
+    sink.write(export_line('lost'))
+    sink.close()
+
+    resumed = sink_class(filename, output_format)
+    resumed.open(checkpoint)
+    resumed.write(export_line('second'))
+    resumed.close()
+
+    with open(filename, encoding='utf-8') as output:
+        content = output.read()
+    assert 'lost' not in content
+    assert content.index('first') < content.index('second')
+    if sink_class is main.LexOfficeSink:
+        # The header is only written to new files
+        assert content.count('Buchungsdatum') == 1
+    else:
+        assert [json.loads(row)['description'] for row in content.splitlines()] == ['first', 'second']
+
+
+def test_compressed_sinks_are_not_resumable(tmp_path):
+    assert main.LexOfficeSink(str(tmp_path / 'export.csv'), 'lexoffice').resumable
+    assert not main.LexOfficeSink(str(tmp_path / 'export.csv.gz'), 'lexoffice.gz', compressed=True).resumable
+
+
+def test_export_sink_is_abstract():
+    with pytest.raises(TypeError):
+        main.ExportSink('export.csv', 'lexoffice')
+
+
+def read_rows(path):
+    with open(path, encoding='utf-8') as output:
+        return output.read().splitlines()[1:]
+
+
+def test_splitter_partitions_by_month(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with contextlib.ExitStack() as outputs:
+        splitter = main.ExportSplitter('month', datetime(2024, 1, 15), datetime(2024, 3, 10), None, ['lexoffice'], outputs)
+        for created in ['2024-01-20 10:00:00', '2024-01-31 23:59:59', '2024-02-01 00:00:00', '2024-03-05 08:00:00']:
+            splitter.partition(transaction_line(created)).write(export_line(created))
+            # Lines arrive in time order, only the partition of the current month stays open
+            assert sum(partition.is_open for partition in splitter.partitions.values()) == 1
+
+    # The first and last partition only cover their part of the export range
+    assert list(splitter.partitions) == [
+        'export_2024-01-15_2024-01-31.csv',
+        'export_2024-02-01_2024-02-29.csv',
+        'export_2024-03-01_2024-03-10.csv',
+    ]
+    assert [partition.lines_written for partition in splitter.partitions.values()] == [2, 1, 1]
+    assert len(read_rows(tmp_path / 'export_2024-01-15_2024-01-31.csv')) == 2
+
+
+def test_splitter_partitions_by_iso_week(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with contextlib.ExitStack() as outputs:
+        splitter = main.ExportSplitter('week', None, None, None, ['lexoffice'], outputs)
+        for created in ['2024-01-07 23:00:00', '2024-01-08 00:00:00', '2024-01-14 12:00:00']:
+            splitter.partition(transaction_line(created)).write(export_line(created))
+
+    # Sunday belongs to the week before, weeks start on Monday
+    assert list(splitter.partitions) == ['export_2024-01-01_2024-01-07.csv', 'export_2024-01-08_2024-01-14.csv']
+
+
+def test_splitter_reopens_interleaved_payouts(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main, 'SPLIT_OPEN_PARTITIONS', 1)
+    with contextlib.ExitStack() as outputs:
+        splitter = main.ExportSplitter('payout', None, None, None, ['lexoffice'], outputs)
+        lines = [
+            transaction_line('2024-01-01 10:00:00', payout='po_a'),
+            transaction_line('2024-01-01 11:00:00', payout='po_b'),
+            transaction_line('2024-01-01 12:00:00', payout='po_a'),
+            # Without payout ID the available-on day names the payout
+            transaction_line('2024-01-01 13:00:00', available_on='2024-01-03 00:00:00'),
+        ]
+        for number, line in enumerate(lines):
+            splitter.partition(line).write(export_line(f'line {number}'))
+            assert sum(partition.is_open for partition in splitter.partitions.values()) == 1
+
+    assert list(splitter.partitions) == ['export_po_a.csv', 'export_po_b.csv', 'export_2024-01-03.csv']
+    rows = read_rows(tmp_path / 'export_po_a.csv')
+    # The reopened file is continued without a second header
+    assert [row.split(';')[2] for row in rows] == ['line 0', 'line 2']
+
+
+def add_fee(aggregator, kind, cents, accounting_date, value_date='2024-01-03 00:00:00', payout=''):
+    aggregator.add(kind, cents, transaction_line(accounting_date, value_date, payout), accounting_date, value_date)
+
+
+def summary(aggregator):
+    return [(line.description, line.debit, line.accounting_date) for line in aggregator.rows()]
+
+
+def test_fee_aggregator_run():
+    fees = main.FeeAggregator()
+    add_fee(fees, main.FeeAggregator.CHARGE, 30, '2024-01-01 10:00:00')
+    add_fee(fees, main.FeeAggregator.CHARGE, 25, '2024-02-01 10:00:00')
+    add_fee(fees, main.FeeAggregator.BILLING, 5, '2024-02-02 10:00:00')
+    assert summary(fees) == [
+        ('Stripe Processing Fees for Charges', 55, '2024-01-01 10:00:00'),
+        ('Billing Usage Fee', 5, '2024-01-01 10:00:00'),
+    ]
+
+
+def test_fee_aggregator_month_with_interleaved_groups():
+    fees = main.FeeAggregator('month')
+    add_fee(fees, main.FeeAggregator.CHARGE, 30, '2024-01-31 10:00:00')
+    add_fee(fees, main.FeeAggregator.PAYMENT, 20, '2024-02-01 10:00:00')
+    add_fee(fees, main.FeeAggregator.CHARGE, 10, '2024-01-15 10:00:00')
+    assert summary(fees) == [
+        ('Stripe Processing Fees for Charges (2024-01)', 40, '2024-01-31 10:00:00'),
+        ('Stripe Processing Fees for Payments (2024-02)', 20, '2024-02-01 10:00:00'),
+    ]
+    assert all(line.amount == -line.debit and line.credit is None for line in fees.rows())
+
+
+def test_fee_aggregator_day():
+    fees = main.FeeAggregator('day')
+    add_fee(fees, main.FeeAggregator.CHARGE, 30, '2024-01-01 10:00:00')
+    add_fee(fees, main.FeeAggregator.CHARGE, 20, '2024-01-01 23:00:00')
+    add_fee(fees, main.FeeAggregator.CHARGE, 10, '2024-01-02 00:00:00')
+    assert [(description, debit) for description, debit, _ in summary(fees)] == [
+        ('Stripe Processing Fees for Charges (2024-01-01)', 50),
+        ('Stripe Processing Fees for Charges (2024-01-02)', 10),
+    ]
+
+
+def test_fee_aggregator_payout():
+    fees = main.FeeAggregator('payout')
+    add_fee(fees, main.FeeAggregator.CHARGE, 30, '2024-01-01 10:00:00', payout='po_a')
+    add_fee(fees, main.FeeAggregator.CHARGE, 20, '2024-01-01 11:00:00', payout='po_b')
+    add_fee(fees, main.FeeAggregator.CHARGE, 10, '2024-01-01 12:00:00', payout='po_a')
+    # Without payout ID the available-on day is the group
+    add_fee(fees, main.FeeAggregator.CHARGE, 5, '2024-01-01 13:00:00', value_date='2024-01-03 00:00:00')
+    assert [(description, debit) for description, debit, _ in summary(fees)] == [
+        ('Stripe Processing Fees for Charges (po_a)', 40),
+        ('Stripe Processing Fees for Charges (po_b)', 20),
+        ('Stripe Processing Fees for Charges (2024-01-03)', 5),
+    ]
+
+
+def test_fee_aggregator_continues_from_checkpoint_state():
+    fees = main.FeeAggregator('month')
+    add_fee(fees, main.FeeAggregator.CHARGE, 30, '2024-01-01 10:00:00')
+    resumed = main.FeeAggregator('month', json.loads(json.dumps(fees.state())))
+    add_fee(resumed, main.FeeAggregator.CHARGE, 20, '2024-01-02 10:00:00')
+    assert summary(resumed) == [('Stripe Processing Fees for Charges (2024-01)', 50, '2024-01-01 10:00:00')]
@@ -0,0 +1,85 @@
+import sqlite3
+from datetime import datetime
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def ledger(tmp_path, monkeypatch):
+    ledger = main.Ledger(str(tmp_path / 'ledger.sqlite'))
+    monkeypatch.setattr(main, 'LEDGER', ledger)
+    ledger.open()
+    yield ledger
+    ledger.close()
+
+
+def test_complete_sync_keeps_gaps_between_ranges(ledger):
+    ledger.complete_sync('2024-01-01 00:00:00', '2024-01-31 23:59:59')
+    ledger.complete_sync('2024-03-01 00:00:00', '2024-03-31 23:59:59')
+
+    assert ledger.synced_ranges() == [
+        ('2024-01-01 00:00:00', '2024-01-31 23:59:59'),
+        ('2024-03-01 00:00:00', '2024-03-31 23:59:59'),
+    ]
+    assert ledger.synced_range() == ('2024-01-01 00:00:00', '2024-03-31 23:59:59')
+    assert ledger.gaps('2024-01-15 00:00:00', '2024-03-15 00:00:00') == [('2024-01-31 23:59:59', '2024-03-01 00:00:00')]
+    assert ledger.gaps('2024-01-02 00:00:00', '2024-01-30 00:00:00') == []
+    assert ledger.gaps('2024-03-15 00:00:00', '2024-04-15 00:00:00') == [('2024-03-31 23:59:59', '2024-04-15 00:00:00')]
+
+
+def test_complete_sync_merges_overlapping_and_adjacent_ranges(ledger):
+    ledger.complete_sync('2024-01-01 00:00:00', '2024-01-31 00:00:00')
+    ledger.complete_sync('2024-03-01 00:00:00', '2024-03-31 00:00:00')
+    # Fills the gap and touches both ranges
+    ledger.complete_sync('2024-01-31 00:00:00', '2024-03-01 00:00:00')
+
+    assert ledger.synced_ranges() == [('2024-01-01 00:00:00', '2024-03-31 00:00:00')]
+    assert ledger.gaps('2024-01-01 00:00:00', '2024-03-31 00:00:00') == []
+
+
+def test_open_migrates_outer_bounds_of_earlier_versions(tmp_path):
+    path = str(tmp_path / 'ledger.sqlite')
+    connection = sqlite3.connect(path)
+    connection.execute('CREATE TABLE sync_state (key TEXT PRIMARY KEY, value TEXT NOT NULL)')
+    connection.executemany('INSERT INTO sync_state VALUES (?, ?)', [
+        ('synced_from', '2024-01-01 00:00:00'), ('synced_until', '2024-02-01 00:00:00'),
+    ])
+    connection.commit()
+    connection.close()
+
+    ledger = main.Ledger(path)
+    ledger.open()
+    assert ledger.synced_ranges() == [('2024-01-01 00:00:00', '2024-02-01 00:00:00')]
+    ledger.close()
+    # A second open must not add the range again
+    ledger.open()
+    assert ledger.synced_ranges() == [('2024-01-01 00:00:00', '2024-02-01 00:00:00')]
+    ledger.close()
+
+
+def test_read_ledger_requires_a_sync(ledger):
+    with pytest.raises(ValueError, match='has not been synced yet'):
+        main.read_ledger(datetime(2024, 1, 1), datetime(2024, 1, 31))
+
+
+def test_read_ledger_refuses_ranges_with_gaps(ledger):
+    ledger.complete_sync('2024-01-01 00:00:00', '2024-01-31 23:59:59')
+    ledger.complete_sync('2024-03-01 00:00:00', '2024-03-31 23:59:59')
+    ledger.close()
+
+    with pytest.raises(ValueError) as error:
+        main.read_ledger(datetime(2024, 1, 1), datetime(2024, 3, 31, 23, 59, 59))
+    assert '2024-01-31 23:59:59 to 2024-03-01 00:00:00' in str(error.value)
+    assert 'sync --start-date 2024-01-31 --end-date 2024-03-02' in str(error.value)
+
+
+def test_read_ledger_returns_covered_transactions(ledger):
+    line = ['txn_1', 'charge', 'ch_1', 500, 10, '', '', '', '', '2024-01-15 10:00:00', '2024-01-17 10:00:00', '']
+    ledger.add(line, 'Kunde', 'Zahlung', False)
+    ledger.complete_sync('2024-01-01 00:00:00', '2024-01-31 23:59:59')
+    ledger.close()
+
+    transactions = list(main.read_ledger(datetime(2024, 1, 1), datetime(2024, 1, 31, 23, 59, 59)))
+    assert transactions == [(line, 'Kunde', 'Zahlung')]